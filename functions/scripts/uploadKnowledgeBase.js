@@ -37,7 +37,7 @@ async function uploadKnowledgeBase() {
             // Generate embedding using OpenAI
             const embeddingResponse = await openai.embeddings.create({
               model: 'text-embedding-3-small',
-              input: `${item.title} ${item.text_chunk}`,
+              input: `${item.section ? `${item.title} > ${item.section}` : item.title} ${item.text_chunk}`,
             });
 
             const embedding = embeddingResponse.data[0].embedding;
@@ -51,6 +51,7 @@ async function uploadKnowledgeBase() {
               license: item.license,
               dateAccessed: item.date_accessed,
               textChunk: item.text_chunk,
+              section: item.section || '',
               embedding: admin.firestore.FieldValue.vector(embedding),
               createdAt: admin.firestore.FieldValue.serverTimestamp(),
             });
@@ -1256,7 +1256,7 @@ If user writes in Spanish about chest pain:
         // Get the last user message for search
         const lastUserMessage = messages.filter(m => m.role === 'user').pop();
         if (lastUserMessage) {
-          const searchResults = await searchKnowledge(lastUserMessage.content, 3);
+          const searchResults = await searchKnowledge(lastUserMessage.content);
           const ragContext = formatRetrievedContext(searchResults);
           if (ragContext) {
             systemPrompt += ragContext;
@@ -5,6 +5,9 @@ import { VoyageAIClient } from 'voyageai';
 const COLLECTION_NAME = 'heydoc_knowledge';
 const EMBEDDING_MODEL = 'voyage-3-lite'; // Cost-effective, good quality
 const VECTOR_SIZE = 512; // voyage-3-lite dimension
+// Results per query. Section-split chunks may need fewer; lower this only
+// after re-seeding with them and comparing testRagQueries answers
+export const SEARCH_LIMIT = 3;
 
 // Initialize clients
 let qdrantClient: QdrantClient | null = null;
@@ -109,6 +112,15 @@ export interface KnowledgeEntry {
   license?: string;
   date_accessed?: string;
   category?: string;
+  section?: string; // heading path within the page, e.g. "Side effects > Rare"
+}
+
+/**
+ * Text embedded for an entry: title and section heading give the chunk its context
+ */
+function entryText(entry: { title: string; section?: string; text_chunk: string }): string {
+  const heading = entry.section ? `${entry.title} > ${entry.section}` : entry.title;
+  return `${heading}: ${entry.text_chunk}`;
 }
 
 /**
@@ -128,7 +140,7 @@ export async function uploadKnowledge(entries: KnowledgeEntry[]): Promise<void>
     console.log(`  Batch ${batchNum}/${totalBatches}: Processing ${batch.length} entries...`);
 
     // Create embeddings for this batch
-    const texts = batch.map(e => `${e.title}: ${e.text_chunk}`);
+    const texts = batch.map(entryText);
     const embeddings = await createEmbeddings(texts);
 
     // Prepare points for Qdrant (use global index for unique IDs)
@@ -144,6 +156,7 @@ export async function uploadKnowledge(entries: KnowledgeEntry[]): Promise<void>
         license: entry.license || '',
         date_accessed: entry.date_accessed || '',
         category: entry.category || 'general',
+        section: entry.section || '',
       },
     }));
 
@@ -169,6 +182,7 @@ export interface SearchResult {
   source_name: string;
   url: string;
   text_chunk: string;
+  section: string;
   score: number;
 }
 
@@ -177,7 +191,7 @@ export interface SearchResult {
  */
 export async function searchKnowledge(
   query: string,
-  limit: number = 3
+  limit: number = SEARCH_LIMIT
 ): Promise<SearchResult[]> {
   const client = getQdrantClient();
 
@@ -198,6 +212,7 @@ export async function searchKnowledge(
     source_name: result.payload?.source_name as string || '',
     url: result.payload?.url as string || '',
     text_chunk: result.payload?.text_chunk as string || '',
+    section: result.payload?.section as string || '',
     score: result.score,
   }));
 }
@@ -212,7 +227,7 @@ export function formatRetrievedContext(results: SearchResult[]): string {
 
   const formatted = results
     .filter(r => r.score > 0.5) // Only include reasonably relevant results
-    .map(r => `[${r.source_name}] ${r.title}\n${r.text_chunk}\nSource: ${r.url}`)
+    .map(r => `[${r.source_name}] ${r.section ? `${r.title} > ${r.section}` : r.title}\n${r.text_chunk}\nSource: ${r.url}`)
     .join('\n\n---\n\n');
 
   if (!formatted) {
@@ -49,6 +49,7 @@ function parseCSV(content: string): KnowledgeEntry[] {
         date_accessed: values[5],
         text_chunk: values[6] || '',
         category: values[7] || 'general',
+        section: values[8] || '',
       });
     }
   }
@@ -41,7 +41,7 @@ async function main() {
     console.log('-'.repeat(60));
 
     try {
-      const results = await searchKnowledge(query, 3);
+      const results = await searchKnowledge(query);
 
       if (results.length === 0) {
         console.log('   No results found');
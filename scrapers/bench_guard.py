@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Extraction Time-Bound Harness
+Feeds adversarial HTML through every scraper's extraction stage (region
+extraction under page_guard, then the boilerplate trimmer) and checks
+that no page takes longer than a fixed bound.
+
+Each case is generated at growing sizes. Besides the absolute bound, the
+table shows how time grows when the page size quadruples - about 4x for
+a linear scan. The old re.DOTALL cascades and re.sub boilerplate loops
+took minutes on several of these cases.
+
+Exits with status 1 if any page exceeds the bound.
+
+Usage:
+    python scrapers/bench_guard.py [--sizes 250000,500000,1000000] [--bound 3.0]
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import boilerplate
+import page_guard
+from cochrane_scraper import COCHRANE_BOILERPLATE, review_text
+from html_text import extract_regions, first_long_region, longest_region
+from medical_scraper import (CDC_BOILERPLATE, CDC_REGIONS, MEDLINEPLUS_BOILERPLATE,
+                             MEDLINEPLUS_REGIONS, ODS_BOILERPLATE, ODS_REGIONS)
+from nccih_scraper import NCCIH_BOILERPLATE, herb_text
+from who_scraper import (WHO_FACTSHEET_BOILERPLATE, WHO_TOPIC_BOILERPLATE, factsheet_text,
+                         topic_text)
+
+# Configuration
+DEFAULT_SIZES = (250_000, 500_000, 1_000_000)
+DEFAULT_BOUND = page_guard.PAGE_CPU_BUDGET + 1.0  # budget, fallback and trimming
+
+# source -> (extractor(page, budget), boilerplate list)
+PIPELINES = {
+    'MedlinePlus': (lambda page, budget: first_long_region(
+        extract_regions(page, MEDLINEPLUS_REGIONS, first_over=100, budget=budget)),
+        MEDLINEPLUS_BOILERPLATE),
+    'NIH ODS': (lambda page, budget: longest_region(
+        extract_regions(page, ODS_REGIONS, budget=budget)), ODS_BOILERPLATE),
+    'CDC': (lambda page, budget: longest_region(
+        extract_regions(page, CDC_REGIONS, budget=budget)), CDC_BOILERPLATE),
+    'WHO topics': (lambda page, budget: topic_text(page, 'Topic', budget), WHO_TOPIC_BOILERPLATE),
+    'WHO fact sheets': (lambda page, budget: factsheet_text(page, 'Topic', budget),
+                        WHO_FACTSHEET_BOILERPLATE),
+    'NCCIH': (herb_text, NCCIH_BOILERPLATE),
+    'Cochrane': (review_text, COCHRANE_BOILERPLATE),
+}
+
+
+# ============================================================================
+# Adversarial pages
+# ============================================================================
+
+def _repeat(unit: str, size: int) -> str:
+    return unit * max(1, size // len(unit))
+
+
+def _in_main(body: str) -> str:
+    return f'<html><body><main>{body}</main></body></html>'
+
+
+def _boilerplate_text(rng: random.Random, size: int) -> str:
+    # Anchors of every list with the lookahead / follower they need missing
+    words = ['menu', 'search', 'share', 'facebook', 'twitter', 'more', 'see, play and learn',
+             'learn more', 'start here', 'national center for complementary and integrative health',
+             'copyright', 'download']
+    out = []
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        out.append(word)
+        length += len(word) + 1
+    return _in_main('<p>' + ' '.join(out) + '</p>')
+
+
+CASES = {
+    'unclosed regions': lambda rng, size: _repeat(
+        '<section class="pls abstract key-facts overview sf-content-block">'
+        '<div class="plain-language-summary main-content content summary"><article>x ', size),
+    'unbalanced quotes': lambda rng, size: _in_main(_repeat('<div title="a>b ', size)),
+    'unterminated tags': lambda rng, size: _in_main(_repeat('<div class=x ', size)),
+    'stray end tags': lambda rng, size: _in_main(_repeat('</div </section ', size)),
+    'open comments': lambda rng, size: _in_main('text ' + _repeat('<!-- ', size)),
+    'deep nesting': lambda rng, size: _in_main(_repeat('<div><span>', size)),
+    'repeated headings': lambda rng, size: _in_main(
+        _repeat('Plain language summary Key facts Overview ', size)),
+    'boilerplate anchors': _boilerplate_text,
+    'oversized page': lambda rng, size: _in_main(
+        _repeat('<p>words words words</p>', max(size, page_guard.MAX_PAGE_CHARS + 1))),
+}
+
+
+def run(source: str, page: str) -> float:
+    """Seconds to extract and trim one page the way the scraper does."""
+    extractor, patterns = PIPELINES[source]
+    started = time.perf_counter()
+    content = page_guard.extract(source, 'bench', page, extractor)
+    boilerplate.trimmer(source, patterns).trim(' '.join(content.split()))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='comma-separated page sizes in characters')
+    parser.add_argument('--bound', type=float, default=DEFAULT_BOUND,
+                        help='maximum seconds per page')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    rng = random.Random(1)
+    print(f"{'Case':<20} {'Source':<16} " + ' '.join(f"{size // 1000:>7}K" for size in sizes)
+          + f" {'Growth':>7}", flush=True)
+    violations = []
+    for case, generate in CASES.items():
+        pages = [generate(rng, size) for size in sizes]
+        for source in PIPELINES:
+            times = [run(source, page) for page in pages]
+            growth = times[-1] / times[0] if times[0] > 0 else 0.0
+            print(f"{case:<20} {source:<16} " + ' '.join(f"{t * 1000:>6.0f}ms" for t in times)
+                  + f" {growth:>6.1f}x", flush=True)
+            violations += [(case, source, t) for t in times if t > args.bound]
+
+    page_guard.print_stats()
+    if violations:
+        print(f"\n{len(violations)} pages over the {args.bound:.1f}s bound:", flush=True)
+        for case, source, seconds in violations:
+            print(f"  - {case} / {source}: {seconds:.2f}s", flush=True)
+        sys.exit(1)
+    print(f"\nAll pages within {args.bound:.1f}s", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Parser Backend Conformance and Benchmark
+Runs html_text.extract_text on every installed parser backend over a
+corpus built from recorded pages, checks that each backend's output is
+identical to the stdlib parser's, and times them.
+
+The corpus holds what the scrapers actually pass to extract_text: whole
+pages as fetch_text returns them (pre-stripped), the <main> / <article> /
+<section> fragments the regex-based scrapers cut out of them, and a few
+hand-written edge cases. Pages come from an http_replay archive; with
+--synthetic, generated pages are used instead.
+
+Exits with status 1 if any backend differs, so it can gate switching an
+ingest worker to a native parser, and with status 2 if no native backend
+is installed, as there is then nothing to check.
+
+Usage:
+    python scrapers/bench_parsers.py [--archive PATH] [--repeat 5] [--show 3]
+    python scrapers/bench_parsers.py --synthetic 200
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import html_strip
+import http_client
+import http_replay
+from bench_regions import SOURCES as REGION_SOURCES
+from bench_regions import synthetic_page
+from html_text import available_backends, extract_text
+
+# Configuration
+HOSTS = ('medlineplus.gov', 'ods.od.nih.gov', 'cdc.gov', 'who.int', 'nccih.nih.gov',
+         'cochranelibrary.com')
+FRAGMENT_PATTERN = re.compile(r'<(main|article|section)\b[^>]*>(.*?)</\1>',
+                              re.DOTALL | re.IGNORECASE)
+
+EDGE_CASES = [
+    '',
+    'plain text only',
+    '<p>Fish &amp; chips &lt;3 &nbsp;caf&eacute; &#233; &#x27;quoted&#x27;</p>',
+    '<p>one<b>two</b>three<!-- note -->four</p>',
+    '<div><nav><a href="/">Home</a></nav>Body text<footer>Footer</footer></div>',
+    '<header><nav>Menu</nav></header><main><p>Kept</p></main>',
+    '<ul><li>First<li>Second</ul><p>Unclosed paragraph',
+    '<table><tr><td>Cell 1</td><td>Cell 2</td></tr></table>',
+    '<p>Line<br>break<br/>again</p>',
+    '<aside>Related</aside><h2>Heading</h2><p>Text after</p>',
+]
+
+
+def load_corpus(archive: str, synthetic: int) -> list[tuple[str, str]]:
+    """(label, html) pairs: pages, their fragments, and the edge cases."""
+    pages = []
+    if synthetic:
+        rng = random.Random(1)
+        for name in REGION_SOURCES:
+            pages += [(f'synthetic:{name}/{i}', 'text/html; charset=utf-8',
+                       synthetic_page(rng, name).encode('utf-8')) for i in range(synthetic)]
+    else:
+        pages = http_replay.recorded_pages(archive, HOSTS)
+
+    corpus = [(f'edge case {i}', case) for i, case in enumerate(EDGE_CASES)]
+    for url, content_type, body in pages:
+        page = http_client.decode_bytes(html_strip.strip_markup(body), content_type)
+        corpus.append((url, page))
+        for i, match in enumerate(FRAGMENT_PATTERN.finditer(page)):
+            corpus.append((f'{url} <{match.group(1).lower()}> #{i}', match.group(2)))
+    return corpus
+
+
+def _time(backend: str, documents: list[str], repeat: int) -> tuple[float, list[str]]:
+    best = float('inf')
+    results = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [extract_text(doc, backend=backend) for doc in documents]
+        best = min(best, time.perf_counter() - started)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--archive', default=http_replay.ARCHIVE_PATH)
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='use N generated pages per source instead of a recording')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--show', type=int, default=3,
+                        help='mismatching documents to print per backend')
+    args = parser.parse_args()
+
+    if not args.synthetic and not os.path.exists(args.archive):
+        parser.error(f"no recording at {args.archive} (record one, or use --synthetic N)")
+    backends = available_backends()
+    if len(backends) == 1:
+        # Comparing stdlib with itself would pass without checking anything
+        parser.error("only the stdlib backend is installed, so there is nothing to compare "
+                     "(pip install lxml or selectolax)")
+
+    corpus = load_corpus(args.archive, args.synthetic)
+    labels = [label for label, _ in corpus]
+    documents = [doc for _, doc in corpus]
+    size = sum(len(doc) for doc in documents)
+    print(f"Corpus: {len(documents)} documents, {size / 1024:,.0f} KB", flush=True)
+
+    baseline_time, baseline = _time('stdlib', documents, args.repeat)
+    print(f"\n{'Backend':<12} {'ms':>9} {'MB/s':>7} {'Speedup':>8} {'Identical':>10}", flush=True)
+    failed = False
+    mismatches = {}
+    for backend in backends:
+        if backend == 'stdlib':
+            elapsed, results = baseline_time, baseline
+        else:
+            elapsed, results = _time(backend, documents, args.repeat)
+        different = [i for i, (a, b) in enumerate(zip(baseline, results)) if a != b]
+        mismatches[backend] = (different, results)
+        failed = failed or bool(different)
+        speed = size / elapsed / 1e6 if elapsed else 0.0
+        speedup = baseline_time / elapsed if elapsed else 0.0
+        print(f"{backend:<12} {elapsed * 1000:>9.1f} {speed:>7.1f} {speedup:>7.1f}x "
+              f"{len(documents) - len(different):>5}/{len(documents)}", flush=True)
+
+    for backend, (different, results) in mismatches.items():
+        for i in different[:args.show]:
+            print(f"\n{backend} differs on {labels[i]}:", flush=True)
+            print(f"  stdlib:  {baseline[i][:200]!r}", flush=True)
+            print(f"  {backend}: {results[i][:200]!r}", flush=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
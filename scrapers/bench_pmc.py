@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+PMC Abstract Parsing Benchmark
+Compares reading PMC efetch responses whole (ElementTree.fromstring on
+the decoded text, as pmc_reviews did) with the streaming front-matter
+parser (pmc_reviews.iter_pmc_articles), per 1,000 reviews.
+
+Each variant runs in its own process so that its peak RSS is its own;
+the table shows response bytes, peak RSS above the interpreter's
+baseline, and parse time, and checks that both variants return the same
+articles. Responses are efetch XML files saved from a real run (e.g.
+curl the efetch URL of a batch into a file), or with --synthetic,
+generated JATS articles shaped like systematic reviews.
+
+Usage:
+    python scrapers/bench_pmc.py --files 'pmc_batches/*.xml'
+    python scrapers/bench_pmc.py --synthetic 1000 [--batch 50] [--article-kb 200]
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from xml.etree import ElementTree
+
+from pmc_reviews import iter_pmc_articles
+
+# Configuration
+WORDS = ('patients', 'trial', 'outcome', 'risk', 'therapy', 'placebo', 'cohort', 'dose',
+         'analysis', 'evidence', 'symptom', 'follow-up', 'adults', 'children', 'effect')
+
+
+# ============================================================================
+# Previous implementation (whole-document parse), kept for comparison
+# ============================================================================
+
+def legacy_parse_pmc_xml(xml_data: str) -> list[dict]:
+    articles = []
+    try:
+        root = ElementTree.fromstring(xml_data)
+    except ElementTree.ParseError:
+        return articles
+
+    for article in root.findall('.//article'):
+        try:
+            pmcid = None
+            for id_elem in article.findall('.//article-id'):
+                if id_elem.get('pub-id-type', '') in ('pmcid', 'pmc', 'pmcaid'):
+                    pmcid = id_elem.text
+                    if pmcid and pmcid.startswith('PMC'):
+                        pmcid = pmcid[3:]
+                    break
+            if not pmcid:
+                continue
+            title_elem = article.find('.//article-title')
+            title = ""
+            if title_elem is not None:
+                title = ElementTree.tostring(title_elem, encoding='unicode', method='text').strip()
+            if not title:
+                continue
+            abstract = ""
+            abstract_elem = article.find('.//abstract')
+            if abstract_elem is not None:
+                abstract = ElementTree.tostring(abstract_elem, encoding='unicode', method='text')
+                abstract = re.sub(r'\s+', ' ', abstract).strip()
+            if not abstract or len(abstract) < 100:
+                continue
+            authors = []
+            for contrib in article.findall('.//contrib[@contrib-type="author"]'):
+                surname = contrib.find('.//surname')
+                given = contrib.find('.//given-names')
+                if surname is not None and surname.text:
+                    name = surname.text
+                    if given is not None and given.text:
+                        name = f"{given.text} {name}"
+                    authors.append(name)
+            author_str = ', '.join(authors[:3])
+            if len(authors) > 3:
+                author_str += ' et al.'
+            pub_date = ""
+            date_elem = article.find('.//pub-date[@pub-type="epub"]')
+            if date_elem is None:
+                date_elem = article.find('.//pub-date')
+            if date_elem is not None:
+                year = date_elem.find('year')
+                if year is not None and year.text:
+                    pub_date = year.text
+            journal_elem = article.find('.//journal-title')
+            journal = journal_elem.text if journal_elem is not None else ""
+            content = f"Systematic Review: {title}\n"
+            if author_str:
+                content += f"Authors: {author_str}\n"
+            if journal:
+                content += f"Journal: {journal}\n"
+            if pub_date:
+                content += f"Published: {pub_date}\n"
+            content += f"\nAbstract: {abstract}"
+            articles.append({
+                'pmcid': pmcid,
+                'title': title,
+                'content': content,
+                'url': f"https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{pmcid}/",
+            })
+        except Exception:
+            continue
+    return articles
+
+
+# ============================================================================
+# Synthetic responses
+# ============================================================================
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def synthetic_article(rng: random.Random, pmcid: int, article_kb: int) -> str:
+    """A JATS article: small <front>, then a body and reference list that
+    make up the rest of article_kb."""
+    authors = ''.join(
+        f'<contrib contrib-type="author"><name><surname>Author{i}</surname>'
+        f'<given-names>A{i}</given-names></name></contrib>' for i in range(rng.randint(2, 8)))
+    abstract = ''.join(f'<sec><title>Part {i}</title><p>{_sentence(rng, 40)}</p></sec>'
+                       for i in range(4))
+    front = (f'<front><journal-meta><journal-title-group><journal-title>Journal {pmcid % 7}'
+             f'</journal-title></journal-title-group></journal-meta><article-meta>'
+             f'<article-id pub-id-type="pmid">{pmcid + 100000}</article-id>'
+             f'<article-id pub-id-type="pmc">PMC{pmcid}</article-id>'
+             f'<title-group><article-title>Review {pmcid}: {_sentence(rng, 8)}</article-title>'
+             f'</title-group><contrib-group>{authors}</contrib-group>'
+             f'<pub-date pub-type="epub"><day>1</day><month>5</month><year>2021</year></pub-date>'
+             f'<abstract>{abstract}</abstract></article-meta></front>')
+
+    target = article_kb * 1024
+    body, back = [], []
+    size = len(front)
+    while size < target * 0.7:
+        section = (f'<sec><title>{_sentence(rng, 4)}</title>'
+                   + ''.join(f'<p>{_sentence(rng, 30)} <xref ref-type="bibr" rid="r{i}">{i}</xref>'
+                             f' <italic>{rng.choice(WORDS)}</italic></p>' for i in range(8))
+                   + '<table-wrap><table>' + ''.join(
+                       '<tr>' + ''.join(f'<td>{rng.random():.3f}</td>' for _ in range(6)) + '</tr>'
+                       for _ in range(10)) + '</table></table-wrap></sec>')
+        body.append(section)
+        size += len(section)
+    i = 0
+    while size < target:
+        ref = (f'<ref id="r{i}"><element-citation publication-type="journal"><person-group>'
+               f'<name><surname>Cited{i}</surname><given-names>C</given-names></name></person-group>'
+               f'<article-title>{_sentence(rng, 10)}</article-title><source>Journal</source>'
+               f'<year>2019</year></element-citation></ref>')
+        back.append(ref)
+        size += len(ref)
+        i += 1
+    return (f'<article article-type="review-article">{front}<body>{"".join(body)}</body>'
+            f'<back><ref-list>{"".join(back)}</ref-list></back></article>')
+
+
+def write_synthetic(directory: str, reviews: int, batch: int, article_kb: int) -> list[str]:
+    rng = random.Random(1)
+    paths = []
+    for start in range(0, reviews, batch):
+        path = os.path.join(directory, f'batch_{start:05d}.xml')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?><pmc-articleset>')
+            for pmcid in range(start, min(reviews, start + batch)):
+                f.write(synthetic_article(rng, 1000000 + pmcid, article_kb))
+            f.write('</pmc-articleset>')
+        paths.append(path)
+    return paths
+
+
+# ============================================================================
+# Measurement (one process per variant)
+# ============================================================================
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _current_rss_mb() -> float:
+    # The peak so far includes start-up; measure from what is resident now
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        return _peak_rss_mb()
+
+
+def measure(variant: str, paths: list[str]) -> dict:
+    """Parse every response the way variant does; runs in a child process."""
+    baseline = _current_rss_mb()
+    articles = []
+    size = 0
+    started = time.perf_counter()
+    for path in paths:
+        if variant == 'whole':
+            # fetch_text read and decoded the whole body before parsing
+            with open(path, 'rb') as f:
+                body = f.read()
+            size += len(body)
+            articles.extend(legacy_parse_pmc_xml(body.decode('utf-8')))
+            del body
+        else:
+            size += os.path.getsize(path)
+            with open(path, 'rb') as f:
+                articles.extend(iter_pmc_articles(f))
+    return {
+        'articles': [(a['pmcid'], a['content']) for a in articles],
+        'bytes': size,
+        'seconds': time.perf_counter() - started,
+        'rss': _peak_rss_mb() - baseline,
+    }
+
+
+def run_variant(variant: str, paths: list[str]) -> dict:
+    listing = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    with listing:
+        json.dump(paths, listing)
+    try:
+        output = subprocess.run([sys.executable, __file__, '--measure', variant, listing.name],
+                                check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    finally:
+        os.unlink(listing.name)
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', help='glob of saved PMC efetch responses')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='use N generated reviews instead of saved responses')
+    parser.add_argument('--batch', type=int, default=50, help='reviews per synthetic response')
+    parser.add_argument('--article-kb', type=int, default=200,
+                        help='size of each synthetic review')
+    parser.add_argument('--measure', nargs=2, metavar=('VARIANT', 'LISTING'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        variant, listing = args.measure
+        with open(listing) as f:
+            print(json.dumps(measure(variant, json.load(f))))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.synthetic:
+            paths = write_synthetic(directory, args.synthetic, args.batch, args.article_kb)
+        elif args.files:
+            paths = sorted(glob.glob(args.files))
+        else:
+            parser.error("give --files PATTERN or --synthetic N")
+        if not paths:
+            parser.error(f"no files match {args.files}")
+
+        results = {variant: run_variant(variant, paths) for variant in ('whole', 'stream')}
+
+    same = results['whole']['articles'] == results['stream']['articles']
+    print(f"{len(paths)} responses, {len(results['stream']['articles'])} reviews parsed; "
+          f"same articles: {'yes' if same else 'NO'}", flush=True)
+    print(f"{'Per 1,000 reviews':<20} {'MB in':>8} {'Peak RSS MB':>12} {'Parse s':>9}", flush=True)
+    for variant, label in (('whole', 'fromstring (before)'), ('stream', 'iterparse (after)')):
+        r = results[variant]
+        scale = 1000 / max(1, len(r['articles']))
+        print(f"{label:<20} {r['bytes'] * scale / 1e6:>8.1f} {r['rss']:>12.1f} "
+              f"{r['seconds'] * scale:>9.2f}", flush=True)
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Pre-Stripping Benchmark
+Measures what html_strip saves per source on recorded pages: bytes
+removed before decoding, and decode + parse time with and without the
+pre-pass (the pre-pass itself is included in the stripped timing).
+
+Pages come from an http_replay archive (record one with
+HEYDOC_HTTP_MODE=record and any of the HTML scrapers). With --synthetic,
+generated pages shaped like the real ones are used instead.
+
+Usage:
+    python scrapers/bench_prestrip.py [--archive PATH] [--repeat 5]
+    python scrapers/bench_prestrip.py --synthetic 200
+"""
+
+import argparse
+import os
+import random
+import time
+
+import html_strip
+import http_client
+import http_replay
+from bench_regions import synthetic_page
+from html_text import extract_text
+
+# Configuration
+SOURCES = {
+    'MedlinePlus': 'medlineplus.gov',
+    'NIH ODS': 'ods.od.nih.gov',
+    'CDC': 'cdc.gov',
+    'WHO': 'who.int',
+    'NCCIH': 'nccih.nih.gov',
+    'Cochrane': 'cochranelibrary.com',
+}
+SYNTHETIC_SOURCES = ('MedlinePlus', 'NIH ODS', 'CDC')  # shapes synthetic_page knows
+
+
+def load_pages(archive: str, synthetic: int) -> dict[str, list[tuple[bytes, str]]]:
+    """Raw pages per source as (body, content_type)."""
+    if synthetic:
+        rng = random.Random(1)
+        return {name: [(synthetic_page(rng, name).encode('utf-8'), 'text/html; charset=utf-8')
+                       for _ in range(synthetic)] for name in SYNTHETIC_SOURCES}
+
+    pages = {name: [] for name in SOURCES}
+    for name, host in SOURCES.items():
+        for _, content_type, body in http_replay.recorded_pages(archive, (host,)):
+            pages[name].append((body, content_type or 'text/html'))
+    return pages
+
+
+def parse_raw(page: tuple[bytes, str]) -> str:
+    body, content_type = page
+    return extract_text(http_client.decode_bytes(body, content_type))
+
+
+def parse_stripped(page: tuple[bytes, str]) -> str:
+    body, content_type = page
+    return extract_text(http_client.decode_bytes(html_strip.strip_markup(body), content_type))
+
+
+def _time(func, items: list, repeat: int) -> tuple[float, list]:
+    best = float('inf')
+    results = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [func(item) for item in items]
+        best = min(best, time.perf_counter() - started)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--archive', default=http_replay.ARCHIVE_PATH)
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='use N generated pages per source instead of a recording')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if not args.synthetic and not os.path.exists(args.archive):
+        parser.error(f"no recording at {args.archive} (record one, or use --synthetic N)")
+
+    pages = load_pages(args.archive, args.synthetic)
+
+    print(f"{'Source':<12} {'Pages':>6} {'KB in':>9} {'Removed':>8} {'Raw ms':>9} "
+          f"{'Strip ms':>9} {'Saved':>7} {'Same':>6}", flush=True)
+    for name, items in pages.items():
+        if not items:
+            print(f"{name:<12} {0:>6}  (no pages)", flush=True)
+            continue
+
+        bytes_in = sum(len(body) for body, _ in items)
+        bytes_out = sum(len(html_strip.strip_markup(body)) for body, _ in items)
+        raw_time, raw = _time(parse_raw, items, args.repeat)
+        strip_time, stripped = _time(parse_stripped, items, args.repeat)
+        # Only inline SVG labels (<title>/<text>) should differ
+        same = sum(1 for a, b in zip(raw, stripped) if a == b)
+        removed = (bytes_in - bytes_out) / bytes_in * 100 if bytes_in else 0.0
+        saved = (raw_time - strip_time) / raw_time * 100 if raw_time else 0.0
+        print(f"{name:<12} {len(items):>6} {bytes_in / 1024:>9.0f} {removed:>7.0f}% "
+              f"{raw_time * 1000:>9.1f} {strip_time * 1000:>9.1f} {saved:>6.0f}% {same:>6}",
+              flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Region Extraction Benchmark
+Compares the old regex cascades of medical_scraper with the single-pass
+selector extractor (html_text.extract_regions) on recorded pages.
+
+Pages come from an http_replay archive (record one with
+HEYDOC_HTTP_MODE=record python scrapers/medical_scraper.py). With
+--synthetic, generated pages shaped like the real ones are used instead,
+so the benchmark also runs without a recording.
+
+Same counts pages with identical output. The rest should all be Longer
+and Cut: the old non-greedy patterns ended a region at the first close
+tag of its name, inside a nested element, and the selector extractor
+keeps the whole element.
+
+Usage:
+    python scrapers/bench_regions.py [--archive PATH] [--repeat 5]
+    python scrapers/bench_regions.py --synthetic 200
+"""
+
+import argparse
+import os
+import random
+import re
+import time
+
+import http_client
+import http_replay
+from html_text import extract_regions, extract_text, first_long_region, longest_region
+from medical_scraper import CDC_REGIONS, MEDLINEPLUS_REGIONS, ODS_REGIONS
+
+# Configuration
+SOURCES = {
+    'MedlinePlus': ('medlineplus.gov', MEDLINEPLUS_REGIONS, 100),
+    'NIH ODS': ('ods.od.nih.gov', ODS_REGIONS, None),
+    'CDC': ('cdc.gov', CDC_REGIONS, None),
+}
+
+
+# ============================================================================
+# Previous implementations (regex cascades), kept for comparison
+# ============================================================================
+
+MEDLINEPLUS_SUMMARY_PATTERNS = [
+    r'<div[^>]*class="[^"]*mp-summary[^"]*"[^>]*>(.*?)</div>',
+    r'<section[^>]*class="[^"]*summary[^"]*"[^>]*>(.*?)</section>',
+    r'<div[^>]*id="topic-summary"[^>]*>(.*?)</div>',
+    r'<div[^>]*class="[^"]*summary[^"]*"[^>]*>(.*?)</div>',
+]
+
+ODS_PATTERNS = [
+    r'<main[^>]*>(.*?)</main>',
+    r'<article[^>]*>(.*?)</article>',
+    r'<div[^>]*class="[^"]*main-content[^"]*"[^>]*>(.*?)</div>',
+    r'<div[^>]*id="main-content"[^>]*>(.*?)</div>',
+]
+
+CDC_PATTERNS = [
+    r'<main[^>]*>(.*?)</main>',
+    r'<article[^>]*>(.*?)</article>',
+    r'<div[^>]*class="[^"]*content[^"]*"[^>]*>(.*?)</div>',
+    r'<div[^>]*id="content"[^>]*>(.*?)</div>',
+    r'<div[^>]*class="[^"]*cdc-main[^"]*"[^>]*>(.*?)</div>',
+]
+
+
+def legacy_medlineplus(html: str) -> str:
+    content = ""
+    for pattern in MEDLINEPLUS_SUMMARY_PATTERNS:
+        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
+        if match:
+            content = extract_text(match.group(1))
+            if len(content) > 100:
+                break
+    if not content or len(content) < 100:
+        match = re.search(r'<article[^>]*>(.*?)</article>', html, re.DOTALL | re.IGNORECASE)
+        if match:
+            content = extract_text(match.group(1))
+    if not content or len(content) < 100:
+        match = re.search(r'<main[^>]*>(.*?)</main>', html, re.DOTALL | re.IGNORECASE)
+        if match:
+            content = extract_text(match.group(1))
+    return content
+
+
+def _legacy_longest(html: str, patterns: list[str]) -> str:
+    content = ""
+    for pattern in patterns:
+        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
+        if match:
+            extracted = extract_text(match.group(1))
+            if len(extracted) > len(content):
+                content = extracted
+    return content
+
+
+def legacy_ods(html: str) -> str:
+    return _legacy_longest(html, ODS_PATTERNS)
+
+
+def legacy_cdc(html: str) -> str:
+    return _legacy_longest(html, CDC_PATTERNS)
+
+
+LEGACY = {'MedlinePlus': legacy_medlineplus, 'NIH ODS': legacy_ods, 'CDC': legacy_cdc}
+LEGACY_PATTERNS = {'MedlinePlus': MEDLINEPLUS_SUMMARY_PATTERNS, 'NIH ODS': ODS_PATTERNS,
+                   'CDC': CDC_PATTERNS}
+
+
+def cut_at_nested_close(html: str, patterns: list[str]) -> bool:
+    """Whether one of the old patterns stopped inside its element: the
+    non-greedy match ended at the close tag of a nested element of the
+    same name, so it holds more opening tags of that name than closing."""
+    for pattern in patterns:
+        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
+        if match:
+            tag = re.match(r'<(\w+)', pattern).group(1)
+            inner = match.group(1).lower()
+            if len(re.findall(rf'<{tag}\b', inner)) > inner.count(f'</{tag}'):
+                return True
+    return False
+
+
+# ============================================================================
+# Pages
+# ============================================================================
+
+def _words(rng: random.Random, n: int) -> str:
+    vocab = ['vitamin', 'dose', 'symptoms', 'treatment', 'health', 'risk', 'children',
+             'adults', 'daily', 'intake', 'infection', 'doctor', 'may', 'help', 'the', 'and']
+    return ' '.join(rng.choice(vocab) for _ in range(n)) + '.'
+
+
+def synthetic_page(rng: random.Random, source: str) -> str:
+    """A page with the nav / script / svg / nested-div shape of the real sites."""
+    paragraphs = ''.join(f'<p>{_words(rng, rng.randint(20, 60))}</p>'
+                         for _ in range(rng.randint(5, 25)))
+    nested = (f'<div class="callout"><div class="inner">{_words(rng, 15)}</div></div>'
+              if rng.random() < 0.7 else '')
+    script = '<script>' + 'var x = {a: 1, b: [1, 2, 3]};' * rng.randint(50, 400) + '</script>'
+    icon = ('<svg viewBox="0 0 24 24" aria-hidden="true"><title>icon</title>'
+            '<path d="' + 'M12 2l3 7h7l-6 4 2 7-6-4-6 4 2-7-6-4h7z' * 4 + '"/></svg>')
+    nav = '<nav><ul>' + ''.join(f'<li><a href="/t{i}">{icon}Topic {i}</a></li>'
+                                for i in range(rng.randint(50, 200))) + '</ul></nav>'
+    if source == 'MedlinePlus':
+        body = (f'<main><div class="mp-summary" id="topic-summary">{nested}{paragraphs}</div>'
+                f'<article>{paragraphs}</article></main>')
+    elif source == 'NIH ODS':
+        body = f'<main><article><div id="main-content">{nested}{paragraphs}</div></article></main>'
+    else:
+        body = f'<main><div class="cdc-main content">{nested}{paragraphs}</div></main>'
+    return (f'<html><head>{script}<style>.a{{color:red}}</style></head><body>'
+            f'<!-- header --><header>{nav}</header>{body}<footer>{nav}</footer>'
+            f'{script}</body></html>')
+
+
+def load_pages(archive: str, synthetic: int) -> dict[str, list[tuple[str, str]]]:
+    """Pages per source as (url, html)."""
+    pages = {name: [] for name in SOURCES}
+    if synthetic:
+        rng = random.Random(1)
+        for name in SOURCES:
+            pages[name] = [(f'synthetic:{name}/{i}', synthetic_page(rng, name))
+                           for i in range(synthetic)]
+        return pages
+
+    for name, (host, _, _) in SOURCES.items():
+        for url, content_type, body in http_replay.recorded_pages(archive, (host,)):
+            pages[name].append((url, http_client.decode_bytes(body, content_type)))
+    return pages
+
+
+def _time(func, items: list, repeat: int) -> tuple[float, list]:
+    best = float('inf')
+    results = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [func(item) for item in items]
+        best = min(best, time.perf_counter() - started)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--archive', default=http_replay.ARCHIVE_PATH)
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='use N generated pages per source instead of a recording')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if not args.synthetic and not os.path.exists(args.archive):
+        parser.error(f"no recording at {args.archive} (record one, or use --synthetic N)")
+
+    pages = load_pages(args.archive, args.synthetic)
+
+    print(f"{'Source':<12} {'Pages':>6} {'Regex ms':>10} {'Single ms':>10} {'Speedup':>8} "
+          f"{'Same':>6} {'Longer':>7} {'Cut':>5}", flush=True)
+    for name, (_, selectors, first_over) in SOURCES.items():
+        htmls = [html for _, html in pages[name]]
+        if not htmls:
+            print(f"{name:<12} {0:>6}  (no pages)", flush=True)
+            continue
+
+        legacy_time, legacy = _time(LEGACY[name], htmls, args.repeat)
+        if first_over is None:
+            def single_pass(html):
+                return longest_region(extract_regions(html, selectors))
+        else:
+            def single_pass(html):
+                return first_long_region(extract_regions(html, selectors, first_over),
+                                         first_over)
+        new_time, new = _time(single_pass, htmls, args.repeat)
+        same = sum(1 for a, b in zip(legacy, new) if a == b)
+        # The regexes stop at the first close tag, so nested regions came out
+        # truncated; the selector extractor keeps the whole element. Cut
+        # counts the differing pages where that is the reason: for
+        # MedlinePlus, the summary was cut to its first nested <div>, under
+        # 100 characters, so the cascade fell through to <article>
+        differing = [(html, a, b) for html, a, b in zip(htmls, legacy, new) if a != b]
+        longer = sum(1 for _, a, b in differing if len(b) > len(a))
+        cut = sum(1 for html, _, _ in differing if cut_at_nested_close(html, LEGACY_PATTERNS[name]))
+        speedup = legacy_time / new_time if new_time else 0.0
+        print(f"{name:<12} {len(htmls):>6} {legacy_time * 1000:>10.1f} {new_time * 1000:>10.1f} "
+              f"{speedup:>7.1f}x {same:>6} {longer:>7} {cut:>5}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Boilerplate Trimmer
+Removes per-source boilerplate from extracted page text in one pass.
+
+Each scraper used to run re.sub(pattern, '', content, flags=re.IGNORECASE)
+once per pattern in its boilerplate list, re-scanning the whole text 6-15
+times. The same pattern lists are now compiled into a Trimmer, which finds
+every rule's literal anchor in a single scan and then works on positions:
+
+  'X.*', 'X.*Y.*', 'X.*?Y.*?Z.*'  truncate at the first X (that is followed
+                                  by Y, Z in order)
+  'X.*?(?=T)'                     remove each X up to the next lookahead T
+
+Rules still apply in list order - a span removed by an earlier rule hides
+later anchors inside it, and text after a truncation point is ignored by
+later rules - so the output matches the sequential re.sub calls. Where a
+span rule's lookahead would run over an earlier removal, the text removed
+so far is dropped first; patterns of any other shape are applied with
+re.sub. Unlike re.sub on 'X.*?(?=T)' or 'X.*?Y.*?Z.*', the supported
+shapes take linear time however often X occurs without a T or Z after it.
+
+trim_sections trims a page's Sections (see html_text) in the same single
+pass over their joined text, then maps what was kept back onto the
+section boundaries.
+
+Every rule that fires is counted with the characters it stripped;
+print_stats() shows the totals per source.
+"""
+
+import bisect
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+from html_text import Section
+
+_REGEX_META = re.compile(r'[\\.^$*+?{}\[\]|()]')
+_SPAN_RULE = re.compile(r'^(.*?)\.\*\?\(\?=(.*)\)$')
+
+
+@dataclass
+class Rule:
+    """One boilerplate pattern, compiled to anchors and an action."""
+    pattern: str
+    literals: tuple = ()  # anchor followed by required later literals
+    terminator: Optional[re.Pattern] = None  # span rules: lookahead ending the span
+    regex: Optional[re.Pattern] = None  # fallback for unsupported shapes
+
+    @property
+    def truncates(self) -> bool:
+        return self.regex is None and self.terminator is None
+
+
+def _literal(piece: str) -> Optional[str]:
+    if not piece or _REGEX_META.search(re.sub(r'\\.', '', piece)):
+        return None
+    # Patterns may escape punctuation (e.g. '\(') - unescape it
+    return re.sub(r'\\(.)', r'\1', piece)
+
+
+def compile_rule(pattern: str) -> Rule:
+    """Recognise the supported pattern shapes; anything else stays a regex."""
+    span = _SPAN_RULE.match(pattern)
+    if span:
+        anchor = _literal(span.group(1))
+        if anchor:
+            return Rule(pattern, (anchor,), terminator=re.compile(span.group(2), re.IGNORECASE))
+
+    if pattern.endswith('.*') and not pattern.endswith('\\.*'):
+        pieces = re.split(r'\.\*\??', pattern[:-2])
+        literals = tuple(_literal(piece) for piece in pieces)
+        if all(literals):
+            return Rule(pattern, literals)
+
+    return Rule(pattern, regex=re.compile(pattern, re.IGNORECASE))
+
+
+@dataclass
+class RuleStats:
+    """How often one rule fired and how much text it removed."""
+    pages: int = 0
+    matches: int = 0
+    chars: int = 0
+
+
+@dataclass
+class _Text:
+    """Working view of a text: removed spans and the truncation point."""
+    length: int
+    cut: int = 0
+    removed: list = field(default_factory=list)  # sorted, disjoint (start, end)
+
+    def __post_init__(self):
+        self.cut = self.length
+
+    def overlapping(self, start: int, end: int) -> list:
+        """Removed spans that overlap [start, end)."""
+        i = max(0, bisect.bisect_right(self.removed, (start,)) - 1)
+        spans = []
+        while i < len(self.removed) and self.removed[i][0] < end:
+            if self.removed[i][1] > start:
+                spans.append(self.removed[i])
+            i += 1
+        return spans
+
+    def alive(self, start: int, end: int) -> bool:
+        return end <= self.cut and not self.overlapping(start, end)
+
+    def chars_between(self, start: int, end: int) -> int:
+        """Characters in [start, end) that have not been removed yet."""
+        count = end - start
+        for r_start, r_end in self.overlapping(start, end):
+            count -= min(end, r_end) - max(start, r_start)
+        return count
+
+    def remove(self, start: int, end: int):
+        bisect.insort(self.removed, (start, end))
+
+    def kept(self) -> list:
+        """Spans that survive the removals and the truncation."""
+        spans = []
+        pos = 0
+        for start, end in self.removed:
+            if start >= self.cut:
+                break
+            if start > pos:
+                spans.append((pos, start))
+            pos = max(pos, end)
+        if pos < self.cut:
+            spans.append((pos, self.cut))
+        return spans
+
+
+def _through(kept: list, spans: list) -> list:
+    """Spans of the current text (made of the original's kept spans, in
+    order) mapped back to spans of the original text."""
+    mapped = []
+    i = 0
+    offset = 0  # position of kept[i] in the current text
+    for start, end in spans:
+        while start < end:
+            while offset + kept[i][1] - kept[i][0] <= start:
+                offset += kept[i][1] - kept[i][0]
+                i += 1
+            k_start, k_end = kept[i]
+            lo = k_start + start - offset
+            hi = min(k_end, k_start + end - offset)
+            if mapped and mapped[-1][1] == lo:
+                mapped[-1] = (mapped[-1][0], hi)
+            else:
+                mapped.append((lo, hi))
+            start += hi - lo
+    return mapped
+
+
+class Trimmer:
+    """A compiled boilerplate list for one source."""
+
+    def __init__(self, source: str, patterns: list[str]):
+        self.source = source
+        self.rules = [compile_rule(pattern) for pattern in patterns]
+        literals = sorted({lit for rule in self.rules for lit in rule.literals},
+                          key=lambda lit: (-len(lit), lit))
+        self._literals = [(lit, lit.lower()) for lit in literals]
+        self._by_first_char: dict[str, list] = {}
+        for lit, lower in self._literals:
+            self._by_first_char.setdefault(lower[0], []).append((lit, lower))
+        # Zero-width, so overlapping anchors ('Share' / 'Share this page') are
+        # all seen. The scan runs over text.lower(), which is several times
+        # faster than an IGNORECASE alternation; _folded_scan is for the rare
+        # text whose lowercase form has a different length.
+        alternation = '|'.join(re.escape(lower) for _, lower in self._literals)
+        self._scan = re.compile(f'(?={alternation})') if literals else None
+        self._folded_scan = re.compile(f'(?={alternation})', re.IGNORECASE) if literals else None
+        self._literal_patterns = {lit: re.compile(re.escape(lit), re.IGNORECASE)
+                                  for lit in literals}
+        self._lock = threading.Lock()
+        self.stats: dict[str, RuleStats] = {rule.pattern: RuleStats() for rule in self.rules}
+
+    def _occurrences(self, text: str) -> dict[str, list[int]]:
+        """Start positions of every literal, from one scan of text."""
+        found = {lit: [] for lit, _ in self._literals}
+        if self._scan is None:
+            return found
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            for match in self._scan.finditer(lowered):
+                pos = match.start()
+                for lit, lower in self._by_first_char[lowered[pos]]:
+                    if lowered.startswith(lower, pos):
+                        found[lit].append(pos)
+        else:
+            for match in self._folded_scan.finditer(text):
+                pos = match.start()
+                for lit, literal_pattern in self._literal_patterns.items():
+                    if literal_pattern.match(text, pos):
+                        found[lit].append(pos)
+        return found
+
+    def _record(self, rule: Rule, matches: int, chars: int):
+        with self._lock:
+            stats = self.stats[rule.pattern]
+            stats.pages += 1
+            stats.matches += matches
+            stats.chars += chars
+
+    def _truncate(self, rule: Rule, view: _Text, found: dict):
+        anchor, *followers = rule.literals
+        for start in found[anchor]:
+            if start >= view.cut:
+                break
+            if not view.alive(start, start + len(anchor)):
+                continue
+            pos = start + len(anchor)
+            for lit in followers:
+                positions = found[lit]
+                i = bisect.bisect_left(positions, pos)
+                while i < len(positions) and not view.alive(positions[i], positions[i] + len(lit)):
+                    i += 1
+                pos = positions[i] + len(lit) if i < len(positions) else None
+                if pos is None:
+                    break
+            if pos is None:
+                return  # later anchors have even fewer followers after them
+            self._record(rule, 1, view.chars_between(start, view.cut))
+            view.cut = start
+            return
+
+    def _remove_spans(self, rule: Rule, text: str, view: _Text, found: dict) -> bool:
+        """Apply a span rule; False if the text must be materialised first.
+
+        That happens when an earlier removal lies where this rule's
+        terminator would be searched, since the text there has changed.
+        Each stretch of text is searched for a terminator at most once: if
+        none follows one anchor, none follows a later one either.
+        """
+        anchor = rule.literals[0]
+        spans = []
+        resume = 0
+        for start in found[anchor]:
+            if start < resume:
+                continue
+            if start >= view.cut:
+                break
+            if not view.alive(start, start + len(anchor)):
+                continue
+            pos = start + len(anchor)
+            match = rule.terminator.search(text, pos, view.cut)
+            window_end = match.end() if match else view.cut
+            if view.overlapping(pos, window_end):
+                return False
+            if match is None:
+                break
+            spans.append((start, match.start()))
+            resume = match.start()
+
+        if spans:
+            chars = sum(view.chars_between(start, end) for start, end in spans)
+            for start, end in spans:
+                view.remove(start, end)
+            self._record(rule, len(spans), chars)
+        return True
+
+    def _apply_regex(self, rule: Rule, regex: re.Pattern, text: str) -> _Text:
+        """The matches of an unsupported pattern, removed from a fresh view
+        (what regex.subn('', text) would leave)."""
+        view = _Text(len(text))
+        view.removed = [match.span() for match in regex.finditer(text) if match.end() > match.start()]
+        if view.removed:
+            self._record(rule, len(view.removed), sum(end - start for start, end in view.removed))
+        return view
+
+    def trim(self, text: str) -> str:
+        """Apply every rule to text, in list order."""
+        return ''.join(text[start:end] for start, end in self._kept(text))
+
+    def trim_sections(self, sections: list[Section]) -> list[Section]:
+        """Trim sectioned text as one text - the same rules fire as for
+        the sections joined with spaces - and split the result back into
+        its sections, dropping those left empty."""
+        text = ' '.join(section.text for section in sections)
+        kept = self._kept(text)
+        trimmed = []
+        i = 0
+        start = 0
+        for section in sections:
+            end = start + len(section.text)
+            pieces = []
+            while i < len(kept) and kept[i][0] < end:
+                lo, hi = max(kept[i][0], start), min(kept[i][1], end)
+                if lo < hi:
+                    pieces.append(text[lo:hi])
+                if kept[i][1] > end:
+                    break
+                i += 1
+            section_text = ' '.join(''.join(pieces).split())
+            if section_text:
+                trimmed.append(Section(section.path, section_text))
+            start = end + 1
+        return trimmed
+
+    def _kept(self, text: str) -> list:
+        """Spans of text that survive every rule, applied in list order."""
+        original = [(0, len(text))] if text else []
+        view = _Text(len(text))
+        found = self._occurrences(text)
+
+        for rule in self.rules:
+            if rule.truncates:
+                self._truncate(rule, view, found)
+                continue
+            if rule.regex is None and self._remove_spans(rule, text, view, found):
+                continue
+            # Unsupported shape, or earlier removals are in the way: continue
+            # on the text as it stands (where a span rule always succeeds)
+            original, text = self._materialise(original, text, view)
+            if rule.regex is not None:
+                view = self._apply_regex(rule, rule.regex, text)
+                original, text = self._materialise(original, text, view)
+            view = _Text(len(text))
+            found = self._occurrences(text)
+            if rule.regex is None:
+                self._remove_spans(rule, text, view, found)
+
+        return _through(original, view.kept())
+
+    @staticmethod
+    def _materialise(original: list, text: str, view: _Text) -> tuple[list, str]:
+        """Apply a view's removals: the spans of the original text the
+        result is made of, and the result."""
+        kept = view.kept()
+        return _through(original, kept), ''.join(text[start:end] for start, end in kept)
+
+
+_TRIMMERS: dict[str, Trimmer] = {}
+_TRIMMERS_LOCK = threading.Lock()
+
+
+def trimmer(source: str, patterns: list[str]) -> Trimmer:
+    """Return the compiled Trimmer for a source, building it on first use."""
+    with _TRIMMERS_LOCK:
+        if source not in _TRIMMERS:
+            _TRIMMERS[source] = Trimmer(source, patterns)
+        return _TRIMMERS[source]
+
+
+def take_stats() -> dict[str, dict[str, RuleStats]]:
+    """Rule counters per source recorded since the last call, resetting
+    them (how pipeline workers hand their counters back)."""
+    with _TRIMMERS_LOCK:
+        trimmers = list(_TRIMMERS.values())
+    taken = {}
+    for t in trimmers:
+        with t._lock:
+            if any(s.pages for s in t.stats.values()):
+                taken[t.source] = t.stats
+                t.stats = {pattern: RuleStats() for pattern in t.stats}
+    return taken
+
+
+def merge_stats(per_source: dict[str, dict[str, RuleStats]]):
+    """Add rule counters recorded in another process."""
+    for source, rules in per_source.items():
+        # Rule counters are keyed by pattern, in list order
+        t = trimmer(source, list(rules))
+        with t._lock:
+            for pattern, other in rules.items():
+                s = t.stats[pattern]
+                s.pages += other.pages
+                s.matches += other.matches
+                s.chars += other.chars
+
+
+def print_stats():
+    """Print which rules fired and how much text each one stripped."""
+    with _TRIMMERS_LOCK:
+        trimmers = list(_TRIMMERS.values())
+    fired = [(t, pattern, s) for t in trimmers for pattern, s in t.stats.items() if s.pages]
+    if not fired:
+        return
+
+    print("\nBoilerplate rules:", flush=True)
+    for t, pattern, s in fired:
+        print(f"  - {t.source}: {pattern!r} fired on {s.pages} pages "
+              f"({s.matches} matches, {s.chars:,} chars stripped)", flush=True)
@@ -10,16 +10,20 @@ Note: Uses polite scraping with 2-3 second delays
 
 import csv
 import re
-import time
-import urllib.request
 import urllib.error
 import urllib.parse
 import sys
 from datetime import date
 from dataclasses import dataclass
-from html.parser import HTMLParser
 from typing import Optional
-import random
+
+import boilerplate
+import crawl_engine
+import fetch_metrics
+import http_client
+import page_guard
+import pipeline
+from html_text import Selector, extract_regions, extract_text, section_after
 
 # Configuration
 REQUEST_DELAY_MIN = 2.0  # Minimum seconds between requests
@@ -44,71 +48,25 @@ class RagEntry:
     date_accessed: str
     text_chunk: str
     category: str
-
-
-class TextExtractor(HTMLParser):
-    """Extract clean text from HTML, preserving some structure."""
-
-    def __init__(self):
-        super().__init__()
-        self.text_parts = []
-        self.skip_tags = {'script', 'style', 'nav', 'header', 'footer', 'aside', 'noscript'}
-        self.current_skip = 0
-
-    def handle_starttag(self, tag, attrs):
-        if tag in self.skip_tags:
-            self.current_skip += 1
-        if tag in ('p', 'li', 'h1', 'h2', 'h3', 'h4', 'br', 'div'):
-            self.text_parts.append(' ')
-
-    def handle_endtag(self, tag):
-        if tag in self.skip_tags:
-            self.current_skip = max(0, self.current_skip - 1)
-        if tag in ('p', 'li', 'h1', 'h2', 'h3', 'h4'):
-            self.text_parts.append(' ')
-
-    def handle_data(self, data):
-        if self.current_skip == 0:
-            self.text_parts.append(data)
-
-    def get_text(self) -> str:
-        text = ' '.join(self.text_parts)
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
-
-
-def extract_text(html: str) -> str:
-    """Extract clean text from HTML."""
-    parser = TextExtractor()
-    try:
-        parser.feed(html)
-    except Exception:
-        pass
-    return parser.get_text()
+    section: str = ""  # heading path of the chunk within its page
 
 
 def fetch_url(url: str, delay: bool = True) -> Optional[str]:
     """Fetch URL content with polite random delay."""
-    if delay:
-        delay_time = random.uniform(REQUEST_DELAY_MIN, REQUEST_DELAY_MAX)
-        time.sleep(delay_time)
-
     headers = {
         'User-Agent': USER_AGENT,
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
         'Accept-Language': 'en-US,en;q=0.5',
     }
-    req = urllib.request.Request(url, headers=headers)
-
     try:
-        with urllib.request.urlopen(req, timeout=30) as response:
-            return response.read().decode('utf-8', errors='ignore')
+        return http_client.fetch_text(url, headers=headers, timeout=30,
+                                      pace=crawl_engine.pacer(REQUEST_DELAY_MIN, REQUEST_DELAY_MAX,
+                                                             wait=delay))
     except urllib.error.HTTPError as e:
         if e.code == 403:
             print(f"  Access denied (403) - site may be blocking scrapers", flush=True)
         elif e.code == 429:
-            print(f"  Rate limited (429) - waiting longer", flush=True)
-            time.sleep(10)
+            print(f"  Rate limited (429) - gave up after retries", flush=True)
         else:
             print(f"  HTTP Error {e.code}: {url}", flush=True)
         return None
@@ -231,78 +189,74 @@ def search_cochrane(topic: str, max_results: int = 10) -> list[dict]:
     return reviews[:max_results]
 
 
-def scrape_cochrane_review(url: str, title: str) -> Optional[str]:
-    """Scrape the plain language summary from a Cochrane review page."""
-    html = fetch_url(url)
-    if not html:
-        return None
+COCHRANE_BOILERPLATE = [
+    r'See all Cochrane Reviews.*',
+    r'This is a reprint.*',
+    r'Copyright.*Cochrane.*',
+    r'View all authors.*',
+    r'Read the full abstract.*',
+    r'Funding.*',
+    r'Assessed as up to date.*',
+]
+
 
-    content = ""
+REVIEW_REGIONS = [
+    # Plain language summary (PLS)
+    Selector('section', class_contains='pls'),
+    Selector('div', class_contains='plain-language-summary'),
+    Selector('div', id_contains='pls'),
+    # Abstract
+    Selector('section', class_contains='abstract'),
+    Selector('div', class_contains='abstract'),
+    Selector('div', id='abstract'),
+    # Main content area
+    Selector('main'),
+    Selector('article'),
+]
+PLS_END = ('<h[23]', '</section', '</article')
+
+
+def review_text(html: str, budget: Optional[page_guard.PageBudget] = None) -> str:
+    """Plain language summary of a review page, else its abstract, else the
+    start of its main content."""
+    regions = extract_regions(html, REVIEW_REGIONS, budget=budget)
 
     # Try to find plain language summary (PLS)
-    pls_patterns = [
-        r'<section[^>]*class="[^"]*pls[^"]*"[^>]*>(.*?)</section>',
-        r'<div[^>]*class="[^"]*plain-language-summary[^"]*"[^>]*>(.*?)</div>',
-        r'<div[^>]*id="[^"]*pls[^"]*"[^>]*>(.*?)</div>',
-        r'Plain language summary(.*?)(?=<h[23]|</section|</article)',
-        r'<section[^>]*class="[^"]*abstract[^"]*"[^>]*>(.*?)</section>',
-    ]
-
-    for pattern in pls_patterns:
-        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
-        if match:
-            extracted = extract_text(match.group(1))
-            if len(extracted) > 100:
-                content = extracted
-                break
+    pls = list(regions[:3])
+    if not any(text and len(text) > 100 for text in pls):
+        marked = section_after(html, 'Plain language summary', PLS_END)
+        pls.append(extract_text(marked) if marked is not None else None)
+    pls.append(regions[3])
+    content = next((text for text in pls if text and len(text) > 100), "")
 
     # If no PLS, try abstract
     if not content or len(content) < 100:
-        abstract_patterns = [
-            r'<section[^>]*class="[^"]*abstract[^"]*"[^>]*>(.*?)</section>',
-            r'<div[^>]*class="[^"]*abstract[^"]*"[^>]*>(.*?)</div>',
-            r'<div[^>]*id="abstract"[^>]*>(.*?)</div>',
-        ]
-
-        for pattern in abstract_patterns:
-            match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
-            if match:
-                extracted = extract_text(match.group(1))
-                if len(extracted) > len(content):
-                    content = extracted
+        for extracted in regions[3:6]:
+            if extracted and len(extracted) > len(content):
+                content = extracted
 
     # Fallback to main content area
     if not content or len(content) < 100:
-        main_patterns = [
-            r'<main[^>]*>(.*?)</main>',
-            r'<article[^>]*>(.*?)</article>',
-        ]
-
-        for pattern in main_patterns:
-            match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
-            if match:
-                extracted = extract_text(match.group(1))
-                # Only use first portion to avoid too much boilerplate
-                if len(extracted) > 200:
-                    content = extracted[:3000]
-                    break
+        for extracted in regions[6:]:
+            # Only use first portion to avoid too much boilerplate
+            if extracted and len(extracted) > 200:
+                content = extracted[:3000]
+                break
+
+    return content
+
+
+def parse_cochrane_review(review: dict, html: str) -> Optional[str]:
+    """Parse stage: the plain language summary of a fetched review page."""
+    content = page_guard.extract('Cochrane', review['url'], html, review_text,
+                                 fallback=lambda page: page_guard.main_text(page)[:3000])
 
     # Clean up content
     if content:
         content = re.sub(r'\s+', ' ', content).strip()
 
         # Remove common boilerplate
-        boilerplate = [
-            r'See all Cochrane Reviews.*',
-            r'This is a reprint.*',
-            r'Copyright.*Cochrane.*',
-            r'View all authors.*',
-            r'Read the full abstract.*',
-            r'Funding.*',
-            r'Assessed as up to date.*',
-        ]
-        for pattern in boilerplate:
-            content = re.sub(pattern, '', content, flags=re.IGNORECASE)
+        content = boilerplate.trimmer('Cochrane', COCHRANE_BOILERPLATE).trim(content)
 
         content = content.strip()
 
@@ -321,62 +275,68 @@ def scrape_cochrane_reviews() -> list[RagEntry]:
     seen_urls = set()
     entry_count = 0
 
-    for topic in SEARCH_TOPICS:
-        if entry_count >= MAX_ENTRIES:
-            print(f"\nReached target of {MAX_ENTRIES} entries", flush=True)
-            break
+    def reviews():
+        # Searched lazily by the fetcher, so a later topic's search is
+        # skipped once the writer has stopped the pipeline
+        for topic in SEARCH_TOPICS:
+            print(f"\nSearching: {topic}...", flush=True)
 
-        print(f"\nSearching: {topic}...", flush=True)
+            found = search_cochrane(topic, max_results=10)
 
-        reviews = search_cochrane(topic, max_results=10)
+            if not found:
+                print(f"  No results found", flush=True)
+                continue
 
-        if not reviews:
-            print(f"  No results found", flush=True)
-            continue
+            print(f"  Found {len(found)} reviews", flush=True)
 
-        print(f"  Found {len(reviews)} reviews", flush=True)
+            for review in found:
+                if review['url'] in seen_urls:
+                    continue
+                seen_urls.add(review['url'])
+                yield review
 
-        for review in reviews:
-            if entry_count >= MAX_ENTRIES:
-                break
+    def fetch(review):
+        print(f"  Fetching: {review['title'][:40]}...", flush=True)
+        return fetch_url(review['url'])
 
-            url = review['url']
-            title = review['title']
+    def write(review, content):
+        nonlocal entry_count
+        url = review['url']
+        title = review['title']
 
-            if url in seen_urls:
-                continue
-            seen_urls.add(url)
+        if not content:
+            print(f"    {title[:40]}: no content extracted", flush=True)
+            return
 
-            print(f"  Fetching: {title[:40]}...", flush=True)
+        # Add context
+        full_content = f"Cochrane Systematic Review: {title}\n\n{content}"
 
-            content = scrape_cochrane_review(url, title)
-            if not content:
-                print(f"    No content extracted", flush=True)
-                continue
+        chunks = chunk_text(full_content)
 
-            # Add context
-            full_content = f"Cochrane Systematic Review: {title}\n\n{content}"
+        for j, chunk in enumerate(chunks):
+            entry_id = f"cochrane_{entry_count+1:04d}"
+            if len(chunks) > 1:
+                entry_id += f"_{j+1}"
 
-            chunks = chunk_text(full_content)
+            entries.append(RagEntry(
+                id=entry_id,
+                title=title,
+                source_name="Cochrane Library",
+                url=url,
+                license="Free Summary",
+                date_accessed=TODAY,
+                text_chunk=chunk,
+                category="systematic_review"
+            ))
 
-            for j, chunk in enumerate(chunks):
-                entry_id = f"cochrane_{entry_count+1:04d}"
-                if len(chunks) > 1:
-                    entry_id += f"_{j+1}"
+        entry_count += 1
+        print(f"    {title[:40]}: added {len(chunks)} chunks", flush=True)
 
-                entries.append(RagEntry(
-                    id=entry_id,
-                    title=title,
-                    source_name="Cochrane Library",
-                    url=url,
-                    license="Free Summary",
-                    date_accessed=TODAY,
-                    text_chunk=chunk,
-                    category="systematic_review"
-                ))
+        if entry_count >= MAX_ENTRIES:
+            print(f"\nReached target of {MAX_ENTRIES} entries", flush=True)
+            raise pipeline.Stop
 
-            entry_count += 1
-            print(f"    Added {len(chunks)} chunks", flush=True)
+    pipeline.run('Cochrane', reviews(), fetch, parse_cochrane_review, write)
 
     print(f"\n  Total Cochrane entries: {len(entries)}", flush=True)
     return entries
@@ -390,7 +350,7 @@ def write_csv(entries: list[RagEntry], output_path: str):
         # Header
         writer.writerow([
             'id', 'title', 'source_name', 'url', 'license',
-            'date_accessed', 'text_chunk', 'category'
+            'date_accessed', 'text_chunk', 'category', 'section'
         ])
 
         # Data rows
@@ -403,7 +363,8 @@ def write_csv(entries: list[RagEntry], output_path: str):
                 entry.license,
                 entry.date_accessed,
                 entry.text_chunk,
-                entry.category
+                entry.category,
+                entry.section
             ])
 
 
@@ -432,6 +393,11 @@ def main():
 
     write_csv(entries, output_path)
     print(f"\nOutput written to: {output_path}", flush=True)
+    http_client.print_stats()
+    pipeline.print_stats()
+    boilerplate.print_stats()
+    page_guard.print_stats()
+    fetch_metrics.write_summary(output_path, total=len(entries))
 
     return entries
 
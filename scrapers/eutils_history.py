@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+E-utilities History Server
+Collect every query's results first, then fetch their union once.
+
+pubmed_api.py and pmc_reviews.py used to run one esearch per query and
+send the IDs back to efetch in comma-joined batches, so the number of
+requests (and the length of every efetch URL) grew with the query list.
+With the History server, an uploaded ID list is kept on NCBI's side
+under a WebEnv / query_key pair, and efetch pages through it with
+retstart / retmax:
+
+  ids      one esearch per query, efetch by ID list (the old behaviour)
+  collect  every query's top results searched first, SEARCH_WORKERS at a
+           time (collect), then the deduplicated union fetched by ID list
+           with EFETCH_WORKERS concurrent efetch requests
+  epost    searched as in collect, then the union is uploaded with a
+           single epost and paged from the History server, HISTORY_PAGE
+           records per efetch
+
+Both keep each query's own budget of top results and credit an article
+to every query that found it. (OR-ing the queries into one search would
+need fewer searches, but one broad query could then fill the whole
+budget and leave the others with nothing, and the results could not be
+credited to queries.) HEYDOC_EUTILS_MODE selects the mode. Concurrent
+requests still draw from ncbi_limiter's shared budget. The epost goes
+out as a POST, so a long ID list never hits URL length limits.
+"""
+
+import concurrent.futures
+import os
+import urllib.parse
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+from xml.etree import ElementTree
+
+import http_client
+import ncbi_limiter
+
+# Configuration
+MODES = ('ids', 'collect', 'epost')
+MODE = os.environ.get('HEYDOC_EUTILS_MODE', 'ids').lower()
+HISTORY_PAGE = 500  # records per efetch page
+SEARCH_WORKERS = 3  # concurrent esearch requests in collect / epost mode
+EFETCH_WORKERS = 3  # concurrent efetch requests in collect mode
+BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+USER_AGENT = "HeyDoc-RAG-Fetcher/1.0 (Educational/Healthcare Research)"
+
+if MODE not in MODES:
+    raise ValueError(f"HEYDOC_EUTILS_MODE={MODE!r} is not one of {', '.join(MODES)}")
+
+
+@dataclass
+class History:
+    """A result set stored on the History server."""
+    db: str
+    webenv: str
+    query_key: str
+    count: int
+
+
+def collect(queries: list[str], search: Callable[[str], list[str]],
+            workers: int = SEARCH_WORKERS) -> dict[str, list[str]]:
+    """Run search(query) for every query, up to workers at a time. Returns
+    each distinct ID with the queries that found it, ordered by the first
+    query that found it and then by that query's ranking."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(search, queries))
+    matched: dict[str, list[str]] = {}
+    for query, ids in zip(queries, results):
+        for id_ in ids:
+            matched.setdefault(id_, []).append(query)
+    return matched
+
+
+def _post(utility: str, params: dict) -> Optional[bytes]:
+    url = f"{BASE_URL}/{utility}.fcgi"
+    headers = {'User-Agent': USER_AGENT, 'Content-Type': 'application/x-www-form-urlencoded'}
+    body = urllib.parse.urlencode(ncbi_limiter.with_api_key(params)).encode('ascii')
+    try:
+        # An upload changes nothing that a retry could duplicate
+        response = http_client.request_with_retries('POST', url, headers=headers, body=body,
+                                                    timeout=30, pace=ncbi_limiter.pace,
+                                                    idempotent=True)
+        return response.body
+    except Exception as e:
+        print(f"  Error in {utility}: {e}", flush=True)
+        return None
+
+
+def epost(db: str, ids: list[str]) -> Optional[History]:
+    """Upload a list of IDs; they keep their order on the server. None if
+    the upload failed, or NCBI answered with an error or without a WebEnv
+    and query_key (paging that would fetch nothing)."""
+    if not ids:
+        return None
+    body = _post('epost', {'db': db, 'id': ','.join(ids)})
+    if body is None:
+        return None
+    try:
+        root = ElementTree.fromstring(body)
+    except ElementTree.ParseError as e:
+        print(f"  Error parsing epost result: {e}", flush=True)
+        return None
+    error = (root.findtext('ERROR') or '').strip()
+    webenv = (root.findtext('WebEnv') or '').strip()
+    query_key = (root.findtext('QueryKey') or '').strip()
+    if error or not webenv or not query_key:
+        print(f"  Error in epost: {error or 'no WebEnv / QueryKey in the result'}", flush=True)
+        return None
+    return History(db, webenv, query_key, len(ids))
+
+
+def efetch_url(history: History, retstart: int, retmax: int, params: Optional[dict] = None) -> str:
+    """efetch URL for records retstart..retstart+retmax of a stored result."""
+    query = dict(params or {}, db=history.db, WebEnv=history.webenv,
+                 query_key=history.query_key, retstart=retstart, retmax=retmax)
+    return f"{BASE_URL}/efetch.fcgi?" + urllib.parse.urlencode(ncbi_limiter.with_api_key(query))
+
+
+def pages(history: History, limit: Optional[int] = None, params: Optional[dict] = None,
+          page_size: int = HISTORY_PAGE) -> Iterator[tuple[str, str]]:
+    """(label, efetch URL) for each page of the first limit records."""
+    total = history.count if limit is None else min(history.count, limit)
+    for retstart in range(0, total, page_size):
+        end = min(total, retstart + page_size)
+        yield f"records {retstart + 1}-{end}", efetch_url(history, retstart, end - retstart, params)
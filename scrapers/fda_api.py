@@ -10,8 +10,6 @@ License: Public Domain (US Government)
 import csv
 import json
 import re
-import time
-import urllib.request
 import urllib.error
 import urllib.parse
 import sys
@@ -19,6 +17,10 @@ from datetime import date
 from dataclasses import dataclass
 from typing import Optional
 
+import crawl_engine
+import fetch_metrics
+import http_client
+
 # Configuration
 REQUEST_DELAY = 0.5  # Polite delay between requests
 MAX_CHUNK_SIZE = 2000
@@ -41,6 +43,7 @@ class RagEntry:
     date_accessed: str
     text_chunk: str
     category: str
+    section: str = ""  # heading path of the chunk within its page
 
 
 # Common OTC drugs to fetch
@@ -151,15 +154,10 @@ OTC_DRUGS = [
 
 def fetch_url(url: str, delay: bool = True) -> Optional[str]:
     """Fetch URL content with polite delay."""
-    if delay:
-        time.sleep(REQUEST_DELAY)
-
     headers = {'User-Agent': USER_AGENT}
-    req = urllib.request.Request(url, headers=headers)
-
     try:
-        with urllib.request.urlopen(req, timeout=30) as response:
-            return response.read().decode('utf-8', errors='ignore')
+        return http_client.fetch_text(url, headers=headers, timeout=30,
+                                      pace=crawl_engine.pacer(REQUEST_DELAY, wait=delay))
     except urllib.error.HTTPError as e:
         if e.code == 404:
             return None  # No results, not an error
@@ -413,7 +411,7 @@ def write_csv(entries: list[RagEntry], output_path: str):
         # Header
         writer.writerow([
             'id', 'title', 'source_name', 'url', 'license',
-            'date_accessed', 'text_chunk', 'category'
+            'date_accessed', 'text_chunk', 'category', 'section'
         ])
 
         # Data rows
@@ -426,7 +424,8 @@ def write_csv(entries: list[RagEntry], output_path: str):
                 entry.license,
                 entry.date_accessed,
                 entry.text_chunk,
-                entry.category
+                entry.category,
+                entry.section
             ])
 
 
@@ -455,6 +454,8 @@ def main():
 
     write_csv(entries, output_path)
     print(f"\nOutput written to: {output_path}", flush=True)
+    http_client.print_stats()
+    fetch_metrics.write_summary(output_path, total=len(entries))
 
     return entries
 
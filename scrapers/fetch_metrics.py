@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Fetch Metrics
+Per-request latency and throughput telemetry for the fetch layer.
+
+Every request that goes through http_client records its phases - DNS,
+TCP connect, TLS handshake, time to first byte, body transfer - together
+with bytes, status and how many retries it took. Timings are aggregated
+per host into p50 / p95 / p99 so a run shows which host dominates the
+refresh window.
+
+Each scraper's main() calls write_summary() at the end, which prints a
+short per-host table and writes the full summary as JSON next to the
+scraper's CSV (e.g. pubmed_articles.metrics.json).
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Timing phases, in the order they happen (seconds)
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'transfer', 'total')
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class RequestTiming:
+    """Phases and outcome of one logical request (all redirect hops and retries).
+
+    Connection phases are zero when a kept-alive connection was reused.
+    ttfb is measured from sending the request to receiving the response
+    headers, excluding connection setup. total is time on the network and
+    leaves out politeness and retry backoff waits.
+    """
+    url: str
+    host: str
+    method: str = 'GET'
+    status: int = 0
+    dns: float = 0.0
+    connect: float = 0.0
+    tls: float = 0.0
+    ttfb: float = 0.0
+    transfer: float = 0.0
+    total: float = 0.0
+    wire_bytes: int = 0
+    body_bytes: int = 0
+    retries: int = 0
+    hops: int = 0  # requests sent, including redirects and retries
+    error: Optional[str] = None
+
+    def add_connection(self, phases: dict):
+        """Add connection setup times reported by a pooled connection."""
+        self.dns += phases.get('dns', 0.0)
+        self.connect += phases.get('connect', 0.0)
+        self.tls += phases.get('tls', 0.0)
+
+    def merge(self, other: 'RequestTiming'):
+        """Add the phases and bytes of an attempt timed separately."""
+        for phase in ('dns', 'connect', 'tls', 'ttfb', 'transfer'):
+            setattr(self, phase, getattr(self, phase) + getattr(other, phase))
+        self.wire_bytes += other.wire_bytes
+        self.body_bytes += other.body_bytes
+        self.hops += other.hops
+        self.status = other.status or self.status
+
+    def finish(self):
+        self.total = self.dns + self.connect + self.tls + self.ttfb + self.transfer
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+@dataclass
+class HostMetrics:
+    """All timings recorded for one host."""
+    requests: int = 0
+    errors: int = 0
+    retries: int = 0
+    wire_bytes: int = 0
+    body_bytes: int = 0
+    status: dict = field(default_factory=dict)  # status code (str) -> count
+    samples: dict = field(default_factory=lambda: {phase: [] for phase in PHASES})
+
+    def add(self, timing: RequestTiming):
+        self.requests += 1
+        self.retries += timing.retries
+        self.wire_bytes += timing.wire_bytes
+        self.body_bytes += timing.body_bytes
+        if timing.error:
+            self.errors += 1
+        key = str(timing.status or 'error')
+        self.status[key] = self.status.get(key, 0) + 1
+        for phase in PHASES:
+            self.samples[phase].append(getattr(timing, phase))
+
+    def percentiles(self, phase: str) -> dict:
+        values = self.samples[phase]
+        return {f"p{pct}": round(percentile(values, pct), 4) for pct in PERCENTILES}
+
+    def summary(self) -> dict:
+        total_seconds = sum(self.samples['total'])
+        transfer_seconds = sum(self.samples['transfer'])
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'status': dict(sorted(self.status.items())),
+            'wire_bytes': self.wire_bytes,
+            'body_bytes': self.body_bytes,
+            'seconds': round(total_seconds, 3),
+            'throughput_bytes_per_s': (round(self.wire_bytes / transfer_seconds)
+                                       if transfer_seconds else None),
+            'latency': {phase: self.percentiles(phase) for phase in PHASES},
+        }
+
+
+class MetricsCollector:
+    """Thread-safe per-host aggregation of RequestTimings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts: dict[str, HostMetrics] = {}
+        self.started = time.time()
+
+    def record(self, timing: RequestTiming):
+        timing.finish()
+        with self._lock:
+            self._hosts.setdefault(timing.host, HostMetrics()).add(timing)
+
+    def hosts(self) -> dict[str, HostMetrics]:
+        """Per-host metrics (shared - read only)."""
+        with self._lock:
+            return dict(self._hosts)
+
+    def samples(self, host: str, phase: str = 'total') -> list:
+        """Copy of the recorded values of one phase for a host."""
+        with self._lock:
+            metrics = self._hosts.get(host)
+            return list(metrics.samples[phase]) if metrics else []
+
+    def summary(self) -> dict:
+        hosts = self.hosts()
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'duration_seconds': round(time.time() - self.started, 3),
+            'hosts': {host: m.summary() for host, m in sorted(hosts.items())},
+        }
+
+
+# Shared collector for all scrapers in this process
+_COLLECTOR = MetricsCollector()
+
+
+def get_collector() -> MetricsCollector:
+    """Return the process-wide metrics collector."""
+    return _COLLECTOR
+
+
+def record(timing: RequestTiming):
+    """Record a finished request in the process-wide collector."""
+    _COLLECTOR.record(timing)
+
+
+def summary(**counts) -> dict:
+    """Run summary as a JSON-ready dict; counts (e.g. entries by source) are
+    included under 'entries'."""
+    result = _COLLECTOR.summary()
+    if counts:
+        result['entries'] = counts
+    return result
+
+
+def write_summary(output_path: str, **counts) -> str:
+    """Print per-host latency percentiles and write the JSON summary next to
+    output_path. Returns the path of the JSON file."""
+    data = summary(**counts)
+
+    if data['hosts']:
+        print("\nFetch latency (total p50 / p95 / p99, TTFB p95):", flush=True)
+        for host, s in data['hosts'].items():
+            total = s['latency']['total']
+            print(f"  - {host}: {s['requests']} requests, "
+                  f"{total['p50']:.2f}s / {total['p95']:.2f}s / {total['p99']:.2f}s, "
+                  f"TTFB {s['latency']['ttfb']['p95']:.2f}s, "
+                  f"{s['seconds']:.1f}s total, {s['retries']} retries", flush=True)
+
+    metrics_path = os.path.splitext(output_path)[0] + '.metrics.json'
+    with open(metrics_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    print(f"Fetch metrics written to: {metrics_path}", flush=True)
+    return metrics_path
+
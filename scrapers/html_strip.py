@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+HTML Pre-Stripping
+Drops <script>, <style> and <svg> subtrees and comments from raw page bytes.
+
+TextExtractor and the region scanner already ignore scripts and styles,
+but only after fetch_text has decoded the whole body and the parser has
+tokenized every byte of inline JavaScript and SVG - on current CDC and
+WHO pages that is most of the document. http_client runs HTML bodies
+through a MarkupStripper before decoding instead, so neither the decoder
+nor any regex or parser sees those bytes.
+
+Each removed subtree is replaced by a single space, which keeps the text
+on either side apart exactly as the parser's separate text nodes did, so
+extracted text only loses the icon labels (<title>, <text>) that inline
+SVGs carried. Stripping works on ASCII-compatible encodings only;
+UTF-16/32 pages are passed through untouched. Set HEYDOC_PRESTRIP=0 to
+turn it off.
+
+Bytes removed are counted per host (print_stats); bench_prestrip.py
+measures the parse time saved on recorded pages.
+"""
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+# Configuration
+PRESTRIP_ENABLED = os.environ.get('HEYDOC_PRESTRIP', '1') != '0'
+STRIPPED_TAGS = ('script', 'style', 'svg')
+
+_OPENER = re.compile(rb'<(?:!--|(' + b'|'.join(t.encode() for t in STRIPPED_TAGS)
+                     + rb')(?=[\s/>]))', re.IGNORECASE)
+_CLOSERS = {tag.encode(): re.compile(rb'</' + tag.encode() + rb'(?:[\s/][^>]*)?>', re.IGNORECASE)
+            for tag in STRIPPED_TAGS}
+# <svg> nests, so inside one its openers are counted as well as its closers
+# (group 1 is the '/' of a closer)
+_CLOSERS[b'svg'] = re.compile(rb'<(/)?svg(?:[\s/][^>]*)?>', re.IGNORECASE)
+# A closer (or nested <svg) whose name has arrived but whose '>' has not
+_OPEN_CLOSERS = {tag.encode(): re.compile(rb'</' + tag.encode() + rb'[\s/]', re.IGNORECASE)
+                 for tag in STRIPPED_TAGS}
+_OPEN_CLOSERS[b'svg'] = re.compile(rb'</?svg[\s/]', re.IGNORECASE)
+_COMMENT_END = re.compile(rb'-->')
+_LONGEST_OPENER = max(len(tag) for tag in STRIPPED_TAGS) + 2  # '<' + name + next byte
+_HTML_SNIFF = re.compile(rb'<(?:!doctype\s+html|html[\s>]|head[\s>]|body[\s>])', re.IGNORECASE)
+_NOT_ASCII_COMPATIBLE = ('utf_16', 'utf-16', 'utf_32', 'utf-32')
+
+
+class MarkupStripper:
+    """Incremental remover of script/style/svg subtrees and comments.
+
+    feed() takes raw body chunks as they arrive and returns the bytes that
+    are safe to pass on; a possible tag split across two chunks is held
+    back until the next call. An <svg> ends at the </svg> that balances it,
+    not at the first one. An unterminated subtree swallows the rest of the
+    body, as it would in a browser.
+    """
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._closer: Optional[re.Pattern] = None  # set while inside a subtree
+        self._tag: Optional[bytes] = None  # its tag name, None for a comment
+        self._depth = 0  # open <svg> elements, counting the outermost
+        self._pending = b''
+
+    @property
+    def bytes_removed(self) -> int:
+        return self.bytes_in - self.bytes_out
+
+    def feed(self, chunk: bytes, final: bool = False) -> bytes:
+        self.bytes_in += len(chunk)
+        data = self._pending + chunk if self._pending else chunk
+        self._pending = b''
+        out = []
+        pos = 0
+
+        while pos < len(data):
+            if self._closer is not None:
+                match = self._closer.search(data, pos)
+                if match is None:
+                    if not final:
+                        self._pending = data[self._closer_start(data, pos):]
+                    break
+                pos = match.end()
+                if self._tag == b'svg':
+                    if match.group(1) is None:
+                        if not match.group(0).endswith(b'/>'):
+                            self._depth += 1
+                        continue
+                    self._depth -= 1
+                    if self._depth:
+                        continue
+                self._closer = None
+                continue
+
+            match = _OPENER.search(data, pos)
+            if match is None:
+                end = len(data)
+                if not final:
+                    lt = data.rfind(b'<', max(pos, end - _LONGEST_OPENER))
+                    if lt != -1:
+                        end = lt
+                out.append(data[pos:end])
+                self._pending = data[end:]
+                break
+
+            tag = match.group(1)
+            if tag is not None and tag.lower() == b'svg':
+                # <svg .../> has no subtree
+                tag_end = data.find(b'>', match.end())
+                if tag_end == -1 and not final:
+                    out.append(data[pos:match.start()])
+                    self._pending = data[match.start():]
+                    break
+                if tag_end != -1 and data[tag_end - 1:tag_end] == b'/':
+                    out.append(data[pos:match.start()])
+                    out.append(b' ')
+                    pos = tag_end + 1
+                    continue
+
+            out.append(data[pos:match.start()])
+            out.append(b' ')
+            self._tag = None if tag is None else tag.lower()
+            self._closer = _COMMENT_END if tag is None else _CLOSERS[self._tag]
+            self._depth = 1
+            pos = match.end()
+
+        result = b''.join(out)
+        self.bytes_out += len(result)
+        return result
+
+    def _closer_start(self, data: bytes, pos: int) -> int:
+        """Where the held-back tail of a subtree starts: the bytes that could
+        still become its closer once the next chunk arrives. That is only
+        the last few bytes (a cut-off '</script' or '--'), or a closer that
+        has its name but not yet its '>'. Holding back everything from
+        the last '<' would re-scan a long script on every chunk."""
+        if self._tag is None:
+            return max(pos, len(data) - 2)
+        hold = max(pos, len(data) - len(self._tag) - 2)
+        started = _OPEN_CLOSERS[self._tag].search(data, pos)
+        return min(started.start(), hold) if started else hold
+
+    def flush(self) -> bytes:
+        """Return whatever was held back once the body is complete."""
+        return self.feed(b'', final=True)
+
+
+def strip_markup(body: bytes) -> bytes:
+    """Strip a complete body in one call."""
+    return MarkupStripper().feed(body, final=True)
+
+
+def applies(content_type: Optional[str], head: bytes, charset: str) -> bool:
+    """Whether a body should be stripped: HTML in an ASCII-compatible charset."""
+    if not PRESTRIP_ENABLED or charset.lower().startswith(_NOT_ASCII_COMPATIBLE):
+        return False
+    if content_type:
+        return 'html' in content_type.lower()
+    return bool(_HTML_SNIFF.search(head[:1024]))
+
+
+# ============================================================================
+# Per-host accounting
+# ============================================================================
+
+@dataclass
+class StripStats:
+    """Pre-stripping totals for one host."""
+    pages: int = 0
+    bytes_in: int = 0
+    bytes_removed: int = 0
+    seconds: float = 0.0
+
+
+_STATS: dict[str, StripStats] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def record(host: str, stripper: MarkupStripper, seconds: float):
+    """Add one stripped body to the host's totals."""
+    with _STATS_LOCK:
+        s = _STATS.setdefault(host, StripStats())
+        s.pages += 1
+        s.bytes_in += stripper.bytes_in
+        s.bytes_removed += stripper.bytes_removed
+        s.seconds += seconds
+
+
+def strip_for_host(host: str, body: bytes) -> bytes:
+    """strip_markup, with the result counted against host."""
+    started = time.perf_counter()
+    stripper = MarkupStripper()
+    stripped = stripper.feed(body, final=True)
+    record(host, stripper, time.perf_counter() - started)
+    return stripped
+
+
+def stats() -> dict[str, StripStats]:
+    """Per-host totals (copy)."""
+    with _STATS_LOCK:
+        return {host: StripStats(**vars(s)) for host, s in _STATS.items()}
+
+
+def print_stats():
+    """Print bytes removed before decoding, per host."""
+    per_host = stats()
+    if not per_host:
+        return
+
+    print("\nHTML pre-stripping (script/style/svg/comments):", flush=True)
+    for host, s in sorted(per_host.items()):
+        share = s.bytes_removed / s.bytes_in * 100 if s.bytes_in else 0.0
+        print(f"  - {host}: {s.pages} pages, {s.bytes_removed:,} of {s.bytes_in:,} bytes "
+              f"removed ({share:.0f}%) in {s.seconds * 1000:.0f} ms", flush=True)
@@ -0,0 +1,794 @@
+#!/usr/bin/env python3
+"""
+HTML Text Extraction
+Shared HTML-to-text helpers for the page scrapers.
+
+TextExtractor / extract_text turn an HTML fragment into clean text.
+RegionWatcher is fed a page while it downloads and reports when the
+region a scraper extracts from (e.g. <main>) has closed, so the fetch
+layer can stop reading and skip the footer bytes.
+
+extract_regions finds the text of several candidate regions, described
+by Selectors, in a single parse of the page - replacing a cascade of
+re.DOTALL searches each followed by its own extract_text parse. Its scan
+is linear in the page size (a start tag is looked for within
+MAX_TAG_CHARS) and can be given a page_guard.PageBudget to check.
+
+It also records each region's h2-h4 headings, so RegionTexts.sections
+can split the text into (heading path, text) Sections, which
+chunk_sections chunks without crossing section boundaries.
+
+The same scan counts each region's structure (RegionFeatures: link
+density, average text-run length, share of list items), which
+page_guard uses to tell navigation hubs from articles.
+
+extract_text runs on a parser backend: lxml or selectolax when one is
+installed, the stdlib HTMLParser otherwise. HEYDOC_HTML_BACKEND (auto,
+stdlib, lxml, selectolax) overrides the choice. Every backend keeps the
+same rules - text outside SKIP_TAGS, one text node per word boundary -
+and bench_parsers.py checks them against each other on recorded pages.
+"""
+
+import functools
+import html
+import os
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Callable, Iterable, Optional
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # optional native backend
+    lxml_etree = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # optional native backend
+    LexborHTMLParser = None
+
+# Configuration
+PARSER_BACKEND = os.environ.get('HEYDOC_HTML_BACKEND', 'auto')
+NATIVE_BACKENDS = ('lxml', 'selectolax')  # preference order for 'auto'
+
+MAX_TAG_CHARS = 16 * 1024  # longest start tag the region scanner will match
+
+SKIP_TAGS = frozenset({'script', 'style', 'nav', 'header', 'footer', 'aside', 'noscript'})
+BLOCK_START_TAGS = frozenset({'p', 'li', 'h1', 'h2', 'h3', 'h4', 'br', 'div'})
+BLOCK_END_TAGS = frozenset({'p', 'li', 'h1', 'h2', 'h3', 'h4'})
+SECTION_TAGS = {'h2': 2, 'h3': 3, 'h4': 4}  # headings that start a section (h1 is the title)
+
+MIN_SECTION_CHARS = 200  # shorter sections are packed with a neighbour by chunk_sections
+
+
+def _join_text(parts: list) -> str:
+    # Same as re.sub(r'\s+', ' ', ...).strip(), without the regex pass
+    return ' '.join(' '.join(parts).split())
+
+
+class TextExtractor(HTMLParser):
+    """Extract clean text from HTML, preserving some structure."""
+
+    def __init__(self):
+        super().__init__()
+        self.text_parts = []
+        self.skip_tags = set(SKIP_TAGS)
+        self.current_skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skip_tags:
+            self.current_skip += 1
+        if tag in BLOCK_START_TAGS:
+            self.text_parts.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in self.skip_tags:
+            self.current_skip = max(0, self.current_skip - 1)
+        if tag in BLOCK_END_TAGS:
+            self.text_parts.append(' ')
+
+    def handle_data(self, data):
+        if self.current_skip == 0:
+            self.text_parts.append(data)
+
+    def get_text(self) -> str:
+        return _join_text(self.text_parts)
+
+
+def _stdlib_text(html: str) -> str:
+    parser = TextExtractor()
+    try:
+        parser.feed(html)
+    except Exception:
+        pass  # HTMLParser gives up on some malformed markup; keep what it read
+    return parser.get_text()
+
+
+class _LxmlTarget:
+    """lxml parser target applying TextExtractor's rules to parse events."""
+
+    def __init__(self):
+        self.text_parts = []
+        self.piece = []  # data events of the current text node
+        self.current_skip = 0
+
+    def _end_piece(self):
+        if self.piece:
+            self.text_parts.append(''.join(self.piece))
+            self.piece = []
+
+    def start(self, tag, attrib):
+        self._end_piece()
+        if tag in SKIP_TAGS:
+            self.current_skip += 1
+
+    def end(self, tag):
+        self._end_piece()
+        if tag in SKIP_TAGS:
+            self.current_skip = max(0, self.current_skip - 1)
+
+    def data(self, data):
+        if self.current_skip == 0:
+            self.piece.append(data)
+
+    def comment(self, text):
+        self._end_piece()
+
+    def pi(self, target, data=None):
+        self._end_piece()
+
+    def close(self) -> str:
+        self._end_piece()
+        return _join_text(self.text_parts)
+
+
+def _lxml_text(html: str) -> str:
+    target = _LxmlTarget()
+    parser = lxml_etree.HTMLParser(target=target, recover=True, no_network=True)
+    try:
+        parser.feed(html)
+        return parser.close()
+    except (lxml_etree.LxmlError, ValueError):
+        return target.close()  # e.g. "Document is empty" - keep what was read
+
+
+def _selectolax_text(html: str) -> str:
+    if not html:
+        return ''
+    parts = []
+    stack = [LexborHTMLParser(html).root]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        if node.tag == '-text':
+            parts.append(node.text(deep=False))
+        elif node.tag not in SKIP_TAGS:
+            stack.extend(reversed(list(node.iter(include_text=True))))
+    return _join_text(parts)
+
+
+_BACKENDS: dict[str, Callable[[str], str]] = {'stdlib': _stdlib_text}
+if lxml_etree is not None:
+    _BACKENDS['lxml'] = _lxml_text
+if LexborHTMLParser is not None:
+    _BACKENDS['selectolax'] = _selectolax_text
+
+
+def available_backends() -> list[str]:
+    """Names of the parser backends usable in this environment."""
+    return list(_BACKENDS)
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_backend(name: str = PARSER_BACKEND) -> str:
+    """Backend name to use for a HEYDOC_HTML_BACKEND value."""
+    if name == 'auto':
+        return next((native for native in NATIVE_BACKENDS if native in _BACKENDS), 'stdlib')
+    if name not in _BACKENDS:
+        raise ValueError(f"HTML backend {name!r} is not available "
+                         f"(installed: {', '.join(_BACKENDS)})")
+    return name
+
+
+def extract_text(html: str, backend: Optional[str] = None) -> str:
+    """Extract clean text from HTML."""
+    return _BACKENDS[resolve_backend(backend or PARSER_BACKEND)](html)
+
+
+class RegionWatcher(HTMLParser):
+    """Incremental parser that tells when a target region has closed.
+
+    Use an instance as http_client.fetch_text's stop_when callback: it is
+    called with each decoded chunk and returns True once the first element
+    named in stop_tags (e.g. 'main') has been opened and closed again.
+    """
+
+    def __init__(self, stop_tags: Iterable[str]):
+        super().__init__()
+        self.stop_tags = {tag.lower() for tag in stop_tags}
+        self.depth = 0
+        self.closed = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.stop_tags:
+            self.depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.stop_tags and self.depth > 0:
+            self.depth -= 1
+            if self.depth == 0:
+                self.closed = True
+
+    def __call__(self, chunk: str) -> bool:
+        if not self.closed:
+            try:
+                self.feed(chunk)
+            except Exception:
+                pass
+        return self.closed
+
+
+@dataclass(frozen=True)
+class Selector:
+    """A candidate content region: tag name plus optional class / id substring
+    or exact id.
+
+    Matching is case-insensitive, like the re.IGNORECASE patterns it
+    replaces (e.g. <div class="...summary..."> is
+    Selector('div', class_contains='summary')).
+    """
+    tag: str
+    class_contains: Optional[str] = None
+    id: Optional[str] = None
+    id_contains: Optional[str] = None
+
+    def matches(self, tag: str, attrs: list) -> bool:
+        if tag != self.tag:
+            return False
+        if self.class_contains is None and self.id is None and self.id_contains is None:
+            return True
+        values = {name: (value or '').lower() for name, value in attrs}
+        if self.class_contains is not None and self.class_contains.lower() not in values.get('class', ''):
+            return False
+        if self.id is not None and values.get('id') != self.id.lower():
+            return False
+        if self.id_contains is not None and self.id_contains.lower() not in values.get('id', ''):
+            return False
+        return True
+
+
+@dataclass
+class RegionFeatures:
+    """Structure of a region's text, counted while it is collected.
+
+    A navigation hub is mostly short link labels in lists; an article is
+    mostly long runs of plain text.
+    """
+    chars: int = 0  # text characters (runs stripped of surrounding space)
+    link_chars: int = 0  # of which inside <a>
+    list_chars: int = 0  # of which inside <li>
+    runs: int = 0  # text runs between block boundaries
+    links: int = 0
+
+    @property
+    def link_density(self) -> float:
+        return self.link_chars / self.chars if self.chars else 0.0
+
+    @property
+    def avg_run(self) -> float:
+        return self.chars / self.runs if self.runs else 0.0
+
+    @property
+    def list_ratio(self) -> float:
+        return self.list_chars / self.chars if self.chars else 0.0
+
+
+@dataclass(frozen=True)
+class Section:
+    """Text under one heading, starting with the heading itself. path is
+    the chain of headings above it, outermost first (() before the first)."""
+    path: tuple
+    text: str
+
+    @property
+    def heading(self) -> str:
+        return ' > '.join(self.path)
+
+
+class _Capture:
+    """Text collected for one element while it is open, on behalf of every
+    selector it matched (e.g. <div class="mp-summary" id="topic-summary">
+    matches three MEDLINEPLUS_REGIONS selectors, but is collected once)."""
+
+    __slots__ = ('indices', 'tag', 'depth', 'skip', 'parts', 'features', 'in_link', 'in_item',
+                 'in_run', 'headings')
+
+    def __init__(self, indices: list[int], tag: str):
+        self.indices = indices
+        self.tag = tag
+        self.depth = 1
+        self.skip = 0
+        self.parts = []
+        self.features = RegionFeatures()
+        self.in_link = 0
+        self.in_item = 0
+        self.in_run = False
+        self.headings = []  # [level, first part, end part] of each section heading
+
+    def start(self, tag: str):
+        if tag == self.tag:
+            self.depth += 1
+        if tag in SKIP_TAGS:
+            self.skip += 1
+        if tag in BLOCK_START_TAGS:
+            self.parts.append(' ')
+            self.end_run()
+        if tag == 'a':
+            self.in_link += 1
+            if self.skip == 0:
+                self.features.links += 1
+        elif tag == 'li':
+            self.in_item += 1
+        if tag in SECTION_TAGS and self.skip == 0 and not self._in_heading():
+            self.headings.append([SECTION_TAGS[tag], len(self.parts), None])
+
+    def _in_heading(self) -> bool:
+        return bool(self.headings) and self.headings[-1][2] is None
+
+    def end(self, tag: str) -> bool:
+        """Handle an end tag; True when it closes the captured element."""
+        if tag == self.tag:
+            self.depth -= 1
+            if self.depth == 0:
+                self.end_run()
+                return True
+        if tag in SKIP_TAGS:
+            self.skip = max(0, self.skip - 1)
+        if tag in BLOCK_END_TAGS:
+            self.parts.append(' ')
+            self.end_run()
+        if tag == 'a':
+            self.in_link = max(0, self.in_link - 1)
+        elif tag == 'li':
+            self.in_item = max(0, self.in_item - 1)
+        if tag in SECTION_TAGS and self._in_heading() and self.headings[-1][0] == SECTION_TAGS[tag]:
+            self.headings[-1][2] = len(self.parts)
+        return False
+
+    def add(self, data: list, size: int):
+        self.parts.extend(data)
+        if size:
+            self.features.chars += size
+            if self.in_link:
+                self.features.link_chars += size
+            if self.in_item:
+                self.features.list_chars += size
+            self.in_run = True
+
+    def end_run(self):
+        if self.in_run:
+            self.features.runs += 1
+            self.in_run = False
+
+
+# Markup recognised by the region scanner
+_MARKUP = re.compile(r'<[a-zA-Z/!?]')
+_START_TAG = re.compile(r"""<([a-zA-Z][^\s/>]*)((?:[^>"']|"[^"]*"|'[^']*')*)>""")
+_END_TAG = re.compile(r'</([a-zA-Z][^\s>]*)[^>]*>')
+_ATTR = re.compile(r"""([^\s=/>]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?""")
+_RAW_TEXT_END = {
+    'script': re.compile(r'</script\s*>', re.IGNORECASE),
+    'style': re.compile(r'</style\s*>', re.IGNORECASE),
+}
+
+
+def _parse_attrs(text: str) -> list:
+    attrs = []
+    for name, value in _ATTR.findall(text):
+        if value[:1] in ('"', "'"):
+            value = value[1:-1]
+        attrs.append((name.lower(), html.unescape(value) if value else None))
+    return attrs
+
+
+def _any_case(name: str) -> str:
+    return ''.join(f'[{c.lower()}{c.upper()}]' if c.isalpha() else re.escape(c) for c in name)
+
+
+@functools.lru_cache(maxsize=32)
+def _candidate_pattern(tags: frozenset) -> re.Pattern:
+    """Finds the next tag that could open a region (or raw text / a comment,
+    which must be skipped so markup inside them is not mistaken for tags).
+
+    This search runs over most of every page, past thousands of '<' that
+    open no region, so it is written to reject those cheaply: the
+    lookahead rules out most of them on their first letter, and the
+    ASCII cases are spelled out instead of using re.IGNORECASE, which
+    makes each attempt about twice as slow.
+    """
+    names = sorted(tags | {'script', 'style'})
+    initials = ''.join(sorted({c for name in names for c in (name[0].lower(), name[0].upper())}))
+    alternatives = '|'.join(_any_case(name) for name in names)
+    return re.compile(rf'<(?=[!{re.escape(initials)}])(?:!--|(?:{alternatives})\b)')
+
+
+class RegionTexts(Sequence):
+    """Texts of the regions found by extract_regions, in selector order.
+
+    Each region's text is only assembled when it is first looked at, so a
+    choice rule that stops at the first good region pays for that one only.
+    """
+
+    def __init__(self, parts: list[Optional[list]],
+                 features: Optional[list[Optional[RegionFeatures]]] = None,
+                 headings: Optional[list[Optional[list]]] = None,
+                 texts: Optional[dict[int, str]] = None):
+        self._parts = parts
+        self._features = features or [None] * len(parts)
+        self._headings = headings or [None] * len(parts)
+        self._texts: dict[int, Optional[str]] = dict(texts or {})
+
+    def __len__(self) -> int:
+        return len(self._parts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index not in self._texts:
+            parts = self._parts[index]
+            self._texts[index] = None if parts is None else _join_text(parts)
+        return self._texts[index]
+
+    def features(self, index: int) -> Optional[RegionFeatures]:
+        """Structure of region index (None if it was not found)."""
+        return self._features[index]
+
+    def features_within(self, content: str) -> Optional[RegionFeatures]:
+        """Structure of the longest region whose text is part of content -
+        the region a choice rule picked, or the main one of several that
+        were joined."""
+        best = None
+        best_length = 0
+        for i in range(len(self)):
+            text = self[i]
+            if text and len(text) > best_length and text in content:
+                best, best_length = self._features[i], len(text)
+        return best
+
+    def sections(self, index: int) -> list[Section]:
+        """Region index split at its h2-h4 headings. The section texts,
+        joined with spaces, are the region's text."""
+        parts = self._parts[index]
+        if parts is None:
+            return []
+        sections = []
+        stack: list[tuple[int, str]] = []
+        path = ()
+        previous = 0
+        for level, first, end in self._headings[index] or ():
+            title = _join_text(parts[first:end if end is not None else len(parts)])
+            if not title:
+                continue
+            text = _join_text(parts[previous:first])
+            if text:
+                sections.append(Section(path, text))
+            stack = [(outer, name) for outer, name in stack if outer < level] + [(level, title)]
+            path = tuple(name for _, name in stack)
+            previous = first
+        text = _join_text(parts[previous:])
+        if text:
+            sections.append(Section(path, text))
+        return sections
+
+    def sections_of(self, content: str) -> Optional[list[Section]]:
+        """Sections of the region whose text is content, or None if content
+        is not one region's text."""
+        for i in range(len(self)):
+            if self[i] == content:
+                return self.sections(i)
+        return None
+
+
+class _RegionScan:
+    """State of one extract_regions call."""
+
+    def __init__(self, page: str, selectors: list[Selector], first_over: Optional[int],
+                 budget=None, repeat: Optional[int] = None):
+        self.page = page
+        self.selectors = selectors
+        self.first_over = first_over
+        self.budget = budget
+        self.repeat = repeat  # collect up to this many matches of selectors[0]
+        self.done = False
+        self.results: list[Optional[list]] = [None] * len(selectors)
+        self.features: list[Optional[RegionFeatures]] = [None] * len(selectors)
+        self.repeated: list[list] = []
+        self.repeated_features: list[RegionFeatures] = []
+        self.headings: list[Optional[list]] = [None] * len(selectors)
+        self.repeated_headings: list[list] = []
+        self.started = [False] * len(selectors)
+        self.active: list[_Capture] = []
+        self.texts: dict[int, str] = {}  # joined text of closed regions, once looked at
+        self.by_tag: dict[str, list[int]] = {}
+        for i, selector in enumerate(selectors):
+            self.by_tag.setdefault(selector.tag, []).append(i)
+
+    def start_tag(self, tag: str, attr_text: str):
+        for capture in self.active:
+            capture.start(tag)
+        attrs = None
+        matched = []
+        for i in self.by_tag.get(tag, ()):
+            if self.started[i]:
+                continue
+            if attrs is None:
+                attrs = _parse_attrs(attr_text)
+            if self.selectors[i].matches(tag, attrs):
+                self.started[i] = True
+                matched.append(i)
+        if matched:
+            self.active.append(_Capture(matched, tag))
+
+    def end_tag(self, tag: str):
+        still_open = []
+        closed = False
+        for capture in self.active:
+            if capture.end(tag):
+                if self.repeat is not None:
+                    self.repeated.append(capture.parts)
+                    self.repeated_features.append(capture.features)
+                    self.repeated_headings.append(capture.headings)
+                    for i in capture.indices:
+                        self.started[i] = False
+                    self.done = len(self.repeated) >= self.repeat
+                    continue
+                for i in capture.indices:
+                    self.results[i] = capture.parts
+                    self.features[i] = capture.features
+                    self.headings[i] = capture.headings
+                closed = True
+            else:
+                still_open.append(capture)
+        self.active = still_open
+        if closed and self.first_over is not None:
+            self._decide()
+
+    def _text(self, index: int) -> str:
+        if index not in self.texts:
+            self.texts[index] = _join_text(self.results[index])
+        return self.texts[index]
+
+    def _decide(self):
+        """Apply first_long_region's rule to the regions closed so far. Once
+        a region longer than first_over has closed, no lower-priority region
+        can be picked, so those are no longer collected; and once every
+        higher-priority selector is resolved too, the answer is final."""
+        unresolved = False
+        for i, parts in enumerate(self.results):
+            if parts is None:
+                unresolved = True  # a higher-priority region may still turn up
+            elif len(self._text(i)) > self.first_over:
+                if not unresolved:
+                    self.done = True
+                    return
+                for lower in range(i + 1, len(self.selectors)):
+                    self.started[lower] = True
+                self.active = [capture for capture in self.active if min(capture.indices) < i]
+                return
+        self.done = not unresolved
+
+    def text(self, start: int, end: int):
+        if start >= end:
+            return
+        receivers = [capture for capture in self.active if capture.skip == 0]
+        if not receivers:
+            return
+        chunk = self.page[start:end]
+        if '<' in chunk:
+            # html.parser reports a stray '<' as its own piece of data
+            pieces = chunk.split('<')
+            data = [html.unescape(pieces[0])]
+            for piece in pieces[1:]:
+                data.append('<')
+                data.append(html.unescape(piece))
+            data = [piece for piece in data if piece]
+        else:
+            data = [html.unescape(chunk)]
+        size = len(chunk.strip())
+        for capture in receivers:
+            capture.add(data, size)
+
+    def markup(self, pos: int) -> int:
+        """Handle the markup at pos; return the position after it."""
+        page = self.page
+        kind = page[pos + 1:pos + 2]
+        if kind == '!' or kind == '?':
+            if page.startswith('<!--', pos):
+                end = page.find('-->', pos + 4)
+                return len(page) if end < 0 else end + 3
+            end = page.find('>', pos)
+            return len(page) if end < 0 else end + 1
+
+        closing = kind == '/'
+        match = (_END_TAG if closing else _START_TAG).match(page, pos, pos + MAX_TAG_CHARS)
+        if match is None:
+            # No '>' in reach, or an unbalanced quote: like html.parser, take
+            # everything up to the next '>' as a broken tag, and stop if
+            # there is none. Either way no position is scanned twice.
+            end = page.find('>', pos)
+            return len(page) if end < 0 else end + 1
+        if closing:
+            self.end_tag(match.group(1).lower())
+            return match.end()
+
+        tag = match.group(1).lower()
+        attr_text = match.group(2)
+        self.start_tag(tag, attr_text)
+        if attr_text.rstrip().endswith('/'):
+            self.end_tag(tag)
+            return match.end()
+        if tag in _RAW_TEXT_END:
+            # Script / style content is never text, so skip straight to its end tag
+            end = _RAW_TEXT_END[tag].search(page, match.end())
+            if end is None:
+                return len(page)
+            self.end_tag(tag)
+            return end.end()
+        return match.end()
+
+    def run(self) -> RegionTexts:
+        page = self.page
+        candidates = _candidate_pattern(frozenset(s.tag for s in self.selectors))
+        pos = 0
+        steps = 0
+        while pos < len(page) and not self.done:
+            steps += 1
+            if self.budget is not None and steps % 32 == 0:
+                self.budget.check()
+            if not self.active:
+                if all(self.started):
+                    break
+                # Nothing is being captured: jump to the next possible region
+                match = candidates.search(page, pos)
+                if match is None:
+                    break
+                pos = self.markup(match.start())
+                continue
+
+            match = _MARKUP.search(page, pos)
+            if match is None:
+                self.text(pos, len(page))
+                break
+            self.text(pos, match.start())
+            pos = self.markup(match.start())
+
+        if self.repeat is not None:
+            regions = RegionTexts(self.repeated, self.repeated_features, self.repeated_headings)
+        else:
+            regions = RegionTexts(self.results, self.features, self.headings, self.texts)
+        if self.budget is not None:
+            self.budget.note(regions)
+        return regions
+
+
+def extract_regions(page: str, selectors: list[Selector],
+                    first_over: Optional[int] = None, budget=None) -> RegionTexts:
+    """Text of the first element matching each selector (None if absent or
+    never closed), from one scan of the page.
+
+    With first_over, regions are collected only while first_long_region(...,
+    first_over) could still pick them: once a region longer than that has
+    closed, lower-priority ones are left None, and scanning stops as soon
+    as every higher-priority selector has been resolved as well. budget
+    (a page_guard.PageBudget) is checked as the scan goes and raises
+    page_guard.BudgetExceeded once the page has used up its CPU time; the
+    regions found are also handed to it, so page_guard can judge the
+    page's structure from their RegionFeatures.
+
+    Text is collected exactly as extract_text would collect it from the
+    element's inner HTML, so no second parse is needed. Tags outside every
+    candidate region are skipped over without being tokenized. Unlike the
+    non-greedy regexes this replaces, a region ends at its matching close
+    tag rather than at the first close tag of the same name.
+    """
+    return _RegionScan(page, selectors, first_over, budget).run()
+
+
+def extract_all(page: str, selector: Selector, limit: Optional[int] = None,
+                budget=None) -> RegionTexts:
+    """Text of every element matching selector (up to limit), in page
+    order - the single-scan form of re.findall over a region pattern."""
+    return _RegionScan(page, [selector], None, budget, repeat=limit or len(page)).run()
+
+
+@functools.lru_cache(maxsize=32)
+def _terminator_pattern(terminators: tuple) -> re.Pattern:
+    return re.compile('|'.join(terminators), re.IGNORECASE)
+
+
+def section_after(page: str, marker: str, terminators: tuple) -> Optional[str]:
+    """Markup between the first occurrence of marker and the nearest
+    following terminator (regex fragments), case-insensitively.
+
+    Same result as re.search(marker + '(.*?)(?=' + '|'.join(terminators)
+    + ')', page, re.DOTALL | re.IGNORECASE), but in two forward scans: if
+    no terminator follows the first marker, none follows a later one
+    either, where the regex would rescan the rest of the page from every
+    later occurrence of the marker.
+    """
+    start = re.search(re.escape(marker), page, re.IGNORECASE)
+    if start is None:
+        return None
+    end = _terminator_pattern(terminators).search(page, start.end())
+    if end is None:
+        return None
+    return page[start.end():end.start()]
+
+
+def first_long_region(texts: Sequence, min_length: int = 100) -> str:
+    """Cascade rule: the first region longer than min_length, else the last
+    region found (texts in selector priority order)."""
+    content = ""
+    for text in texts:
+        if text is None:
+            continue
+        content = text
+        if len(content) > min_length:
+            break
+    return content
+
+
+def longest_region(texts: Sequence) -> str:
+    """Pick the longest region found."""
+    return max((text for text in texts if text is not None), key=len, default="")
+
+
+def page_heading(page: str) -> Optional[str]:
+    """Text of the page's first <h1>, or None."""
+    return extract_regions(page, [Selector('h1')], first_over=0)[0] or None
+
+
+def section_chars(sections: list[Section]) -> int:
+    """Length of the sections' text joined with spaces."""
+    return sum(len(section.text) for section in sections) + max(0, len(sections) - 1)
+
+
+def chunk_sections(sections: list[Section], chunk_text: Callable[[str, int], list[str]],
+                   max_size: int, min_size: int = MIN_SECTION_CHARS) -> list[tuple[str, str]]:
+    """(heading path, chunk) pairs, chunking each section on its own with
+    chunk_text so that no chunk straddles two unrelated sections.
+
+    A section shorter than min_size is packed rather than left as a scrap:
+    into the previous chunk if it is a subsection of it and there is room,
+    or else in front of its own first subsection (a heading followed
+    straight by a subheading).
+    """
+    pairs: list[tuple[tuple, str]] = []
+    waiting = None  # short section waiting for its first subsection
+    for section in sections:
+        path, text = section.path, section.text
+        if waiting is not None:
+            if path[:len(waiting[0])] == waiting[0] and len(path) > len(waiting[0]):
+                text = f"{waiting[1]} {text}"
+            else:
+                pairs.append(waiting)
+            waiting = None
+
+        if len(text) < min_size:
+            if pairs:
+                last_path, last_text = pairs[-1]
+                if (last_path and path[:len(last_path)] == last_path
+                        and len(last_text) + 1 + len(text) <= max_size):
+                    pairs[-1] = (last_path, f"{last_text} {text}")
+                    continue
+            waiting = (path, text)
+            continue
+
+        pairs.extend((path, chunk) for chunk in chunk_text(text, max_size))
+    if waiting is not None:
+        pairs.append(waiting)
+    return [(' > '.join(path), chunk) for path, chunk in pairs if chunk.strip()]
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+On-disk HTTP Cache
+Persistent response cache with ETag / Last-Modified revalidation.
+
+Bodies are stored under scrapers/.http_cache together with their
+validators. On the next run the fetch layer sends If-None-Match /
+If-Modified-Since, and a 304 reply is served from disk, so unchanged
+fact sheets cost a header exchange instead of a full download.
+
+Outcomes are counted per host:
+  hit          - still fresh (max-age / Expires), no request sent
+  revalidated  - conditional request answered with 304
+  miss         - full body downloaded
+"""
+
+import email.utils
+import hashlib
+import http.client
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Configuration
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.http_cache')
+CACHE_ENABLED = os.environ.get('HEYDOC_HTTP_CACHE', '1') != '0'
+
+# Response headers kept with the body (replayed on hits)
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Expires', 'Date')
+
+
+@dataclass
+class CacheEntry:
+    """A cached response body and its validators."""
+    url: str
+    status: int
+    headers: dict
+    stored_at: float
+    expires_at: float  # 0 when the entry must always be revalidated
+    body: bytes = field(repr=False)
+    partial: bool = False  # body was cut short by a streaming fetch
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get('ETag')
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get('Last-Modified')
+
+    def is_fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+    def is_current(self, lastmod: Optional[float]) -> bool:
+        """Whether this copy was stored after the page's last modification."""
+        return lastmod is not None and lastmod <= self.stored_at
+
+    def conditional_headers(self) -> dict:
+        """Request headers that let the server answer 304."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def message(self) -> http.client.HTTPMessage:
+        """Stored headers as an HTTPMessage, like a live response."""
+        msg = http.client.HTTPMessage()
+        for name, value in self.headers.items():
+            msg[name] = value
+        return msg
+
+
+@dataclass
+class CacheStats:
+    """Cache outcome counters for one host."""
+    hits: int = 0
+    unchanged: int = 0
+    revalidated: int = 0
+    misses: int = 0
+    bytes_served: int = 0  # body bytes served from disk
+    bytes_downloaded: int = 0  # body bytes fetched on misses
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.unchanged + self.revalidated + self.misses
+
+    def ratio(self, count: int) -> float:
+        return count / self.lookups if self.lookups else 0.0
+
+
+def freshness_deadline(headers) -> float:
+    """Epoch time until which a response may be reused without revalidation."""
+    cache_control = (headers.get('Cache-Control') or '').lower()
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return 0.0
+
+    match = re.search(r'max-age\s*=\s*(\d+)', cache_control)
+    if match:
+        return time.time() + int(match.group(1))
+
+    expires = headers.get('Expires')
+    if expires:
+        try:
+            return email.utils.parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
+
+
+class HttpCache:
+    """Thread-safe on-disk cache keyed by URL."""
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._stats: dict[str, CacheStats] = {}
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key[:2], key)
+        return base + '.json', base + '.body'
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """Return the cached entry for url, or None."""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url:
+            return None
+        return CacheEntry(url=url, status=meta['status'], headers=meta['headers'],
+                          stored_at=meta['stored_at'], expires_at=meta['expires_at'],
+                          body=body, partial=meta.get('partial', False))
+
+    def _write(self, entry: CacheEntry):
+        meta_path, body_path = self._paths(entry.url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        meta = {
+            'url': entry.url,
+            'status': entry.status,
+            'headers': entry.headers,
+            'stored_at': entry.stored_at,
+            'expires_at': entry.expires_at,
+            'partial': entry.partial,
+        }
+        # Write body first, then metadata, each via rename so readers never
+        # see a half-written entry
+        tmp_suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(body_path + tmp_suffix, 'wb') as f:
+            f.write(entry.body)
+        os.replace(body_path + tmp_suffix, body_path)
+        with open(meta_path + tmp_suffix, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + tmp_suffix, meta_path)
+
+    def store(self, url: str, status: int, headers, body: bytes, partial: bool = False,
+              lastmod: Optional[float] = None) -> bool:
+        """Cache a 200 response if it can be revalidated or reused later.
+
+        partial marks a body that a streaming fetch stopped reading early;
+        only other streaming fetches will use it. A page with a known
+        lastmod is kept even without validators, since the next lastmod
+        tells whether it is still current.
+        """
+        if status != 200:
+            return False
+        if 'no-store' in (headers.get('Cache-Control') or '').lower():
+            return False
+
+        kept = {name: headers[name] for name in STORED_HEADERS if headers.get(name)}
+        expires_at = freshness_deadline(headers)
+        if ('ETag' not in kept and 'Last-Modified' not in kept and not expires_at
+                and lastmod is None):
+            return False  # nothing to validate against - not worth the disk
+
+        try:
+            self._write(CacheEntry(url=url, status=status, headers=kept,
+                                   stored_at=time.time(), expires_at=expires_at, body=body,
+                                   partial=partial))
+        except OSError:
+            return False
+        return True
+
+    def refresh(self, entry: CacheEntry, headers) -> CacheEntry:
+        """Update an entry's validators and freshness from a 304 reply."""
+        for name in STORED_HEADERS:
+            if name != 'Content-Type' and headers.get(name):
+                entry.headers[name] = headers[name]
+        entry.expires_at = freshness_deadline(headers)
+        entry.stored_at = time.time()
+        try:
+            self._write(entry)
+        except OSError:
+            pass
+        return entry
+
+    def record(self, host: str, outcome: str, nbytes: int):
+        """Count a lookup outcome ('hit', 'unchanged', 'revalidated' or
+        'miss') for host."""
+        with self._lock:
+            stats = self._stats.setdefault(host, CacheStats())
+            if outcome == 'hit':
+                stats.hits += 1
+                stats.bytes_served += nbytes
+            elif outcome == 'unchanged':
+                stats.unchanged += 1
+                stats.bytes_served += nbytes
+            elif outcome == 'revalidated':
+                stats.revalidated += 1
+                stats.bytes_served += nbytes
+            else:
+                stats.misses += 1
+                stats.bytes_downloaded += nbytes
+
+    def stats(self) -> dict[str, CacheStats]:
+        """Per-host outcome counters (copy)."""
+        with self._lock:
+            return {host: CacheStats(**vars(s)) for host, s in self._stats.items()}
+
+
+# Shared cache for all scrapers in this process
+_CACHE = HttpCache()
+
+
+def get_cache() -> Optional[HttpCache]:
+    """Return the process-wide cache, or None when disabled."""
+    return _CACHE if CACHE_ENABLED else None
+
+
+def print_stats():
+    """Print hit / unchanged / revalidate / miss ratios per host."""
+    stats = _CACHE.stats()
+    if not stats:
+        return
+
+    print("\nHTTP cache:", flush=True)
+    for host, s in sorted(stats.items()):
+        print(f"  - {host}: {s.lookups} lookups, "
+              f"hit {s.ratio(s.hits):.0%}, unchanged {s.ratio(s.unchanged):.0%}, "
+              f"revalidated {s.ratio(s.revalidated):.0%}, "
+              f"miss {s.ratio(s.misses):.0%} "
+              f"({s.bytes_served:,} bytes from cache, {s.bytes_downloaded:,} downloaded)",
+              flush=True)
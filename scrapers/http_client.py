@@ -0,0 +1,1013 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP Client
+Keep-alive connection pool used by every scraper's fetch_url.
+
+urllib.request.urlopen opens (and TLS-handshakes) a fresh connection for
+every request. This module keeps persistent connections per host instead,
+resumes TLS sessions when a connection has to be re-opened, and bounds the
+number of open sockets. Handshake counters are kept so a full run can show
+how many connections were actually opened.
+
+Responses are requested with gzip/deflate and decompressed incrementally
+as they arrive; text is decoded using the charset from the Content-Type
+header, a BOM, or an HTML/XML meta declaration instead of assuming UTF-8.
+
+Every request can be recorded to, or answered from, an archive for
+offline runs (see http_replay), and its phase timings are collected by
+fetch_metrics. Per-host timeouts adapt to those timings and slow GETs can
+be hedged (see tail_latency).
+
+Usage:
+    import http_client
+    html = http_client.fetch_text(url, headers={'User-Agent': ...})
+    http_client.print_stats()
+"""
+
+import codecs
+import concurrent.futures
+import http.client
+import io
+import re
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+
+import fetch_metrics
+import html_strip
+import http_cache
+import http_replay
+import retry_policy
+import tail_latency
+
+# Configuration
+MAX_CONNECTIONS_PER_HOST = 4  # persistent connections kept per host
+MAX_CONNECTIONS = 32  # hard cap on open sockets across all hosts
+MAX_REDIRECTS = 5
+DEFAULT_TIMEOUT = 30
+READ_CHUNK_SIZE = 64 * 1024
+ACCEPT_ENCODING = 'gzip, deflate'
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# Errors that mean a kept-alive connection was closed by the server while idle
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+@dataclass
+class PoolStats:
+    """Connection counters for one host (or the whole pool)."""
+    requests: int = 0
+    reused: int = 0  # requests served on an already-open connection
+    tcp_handshakes: int = 0
+    tls_handshakes: int = 0
+    tls_resumed: int = 0  # TLS handshakes that resumed a cached session
+    wire_bytes: int = 0  # body bytes as received (possibly compressed)
+    body_bytes: int = 0  # body bytes after decompression
+    stopped_early: int = 0  # streamed responses closed before the end
+    bytes_skipped: int = 0  # wire bytes never downloaded because of that
+
+    def add(self, other: 'PoolStats'):
+        self.requests += other.requests
+        self.reused += other.reused
+        self.tcp_handshakes += other.tcp_handshakes
+        self.tls_handshakes += other.tls_handshakes
+        self.tls_resumed += other.tls_resumed
+        self.wire_bytes += other.wire_bytes
+        self.body_bytes += other.body_bytes
+        self.stopped_early += other.stopped_early
+        self.bytes_skipped += other.bytes_skipped
+
+
+@dataclass
+class Response:
+    """A fully-read HTTP response.
+
+    body is always decompressed; wire_bytes is what actually crossed the
+    network (0 when served from the cache).
+    """
+    url: str
+    status: int
+    reason: str
+    headers: http.client.HTTPMessage
+    body: bytes = field(repr=False)
+    wire_bytes: int = 0
+
+
+def _decompressor(content_encoding: str):
+    """Return a zlib decompressor for a Content-Encoding, or None for identity."""
+    encoding = content_encoding.strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompressobj(zlib.MAX_WBITS)
+    return None
+
+
+def iter_body(resp: http.client.HTTPResponse, counter: Optional[list] = None) -> Iterator[bytes]:
+    """Yield a response body in decompressed chunks as it arrives.
+
+    Compressed chunks are inflated one at a time, so the compressed body is
+    never held in memory in full. If counter is given, counter[0] is kept
+    up to date with the number of bytes read off the wire.
+    """
+    encoding = resp.headers.get('Content-Encoding', '')
+    decompressor = _decompressor(encoding)
+    wire_bytes = 0
+
+    while True:
+        chunk = resp.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        wire_bytes += len(chunk)
+        if counter is not None:
+            counter[0] = wire_bytes
+        if decompressor is None:
+            yield chunk
+            continue
+        try:
+            data = decompressor.decompress(chunk)
+        except zlib.error:
+            if encoding.strip().lower() != 'deflate' or wire_bytes != len(chunk):
+                raise
+            # Some servers send raw deflate without the zlib header
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = decompressor.decompress(chunk)
+        if data:
+            yield data
+
+    if decompressor is not None:
+        data = decompressor.flush()
+        if data:
+            yield data
+
+
+def read_body(resp: http.client.HTTPResponse) -> tuple[bytes, int]:
+    """Read and decompress a whole response body. Returns (body, wire_bytes)."""
+    counter = [0]
+    body = b''.join(iter_body(resp, counter))
+    return body, counter[0]
+
+
+_META_CHARSET = re.compile(
+    rb'<meta[^>]+charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)', re.IGNORECASE
+)
+_XML_ENCODING = re.compile(rb'^\s*<\?xml[^>]+encoding\s*=\s*["\']([A-Za-z0-9_.:-]+)')
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def _known_codec(name) -> Optional[str]:
+    if not name:
+        return None
+    if isinstance(name, bytes):
+        name = name.decode('ascii', errors='ignore')
+    try:
+        return codecs.lookup(name.strip()).name
+    except LookupError:
+        return None
+
+
+def detect_charset(body: bytes, content_type: Optional[str] = None) -> str:
+    """Pick the charset for a body: header, then BOM, then meta/XML declaration."""
+    if content_type:
+        match = re.search(r'charset\s*=\s*["\']?([^"\';\s]+)', content_type, re.IGNORECASE)
+        charset = _known_codec(match.group(1)) if match else None
+        if charset:
+            return charset
+
+    for bom, charset in _BOMS:
+        if body.startswith(bom):
+            return charset
+
+    head = body[:4096]
+    match = _XML_ENCODING.search(head) or _META_CHARSET.search(head)
+    charset = _known_codec(match.group(1)) if match else None
+    return charset or 'utf-8'
+
+
+def decode_bytes(body: bytes, content_type: Optional[str] = None) -> str:
+    """Decode a body using its detected charset."""
+    return body.decode(detect_charset(body, content_type), errors='ignore')
+
+
+def decode_body(response: Response) -> str:
+    """Decode a response body using its detected charset."""
+    return decode_bytes(response.body, response.headers.get('Content-Type'))
+
+
+def _decode_page(host: str, body: bytes, content_type: Optional[str]) -> str:
+    """Decode a body for text extraction, pre-stripping it if it is HTML."""
+    charset = detect_charset(body, content_type)
+    if html_strip.applies(content_type, body, charset):
+        body = html_strip.strip_for_host(host, body)
+        # A <meta charset> behind a large inline script is now in reach
+        charset = detect_charset(body, content_type)
+    return body.decode(charset, errors='ignore')
+
+
+def _timed_connection(conn, address, timeout, source_address=None) -> socket.socket:
+    """socket.create_connection, timing DNS and TCP connect into conn.phases."""
+    host, port = address
+    started = time.monotonic()
+    infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    resolved = time.monotonic()
+    conn.phases['dns'] = resolved - started
+
+    error = None
+    for family, socktype, proto, _, sockaddr in infos:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            conn.phases['connect'] = time.monotonic() - resolved
+            return sock
+        except OSError as e:
+            error = e
+            if sock is not None:
+                sock.close()
+    raise error or OSError(f"getaddrinfo returned no addresses for {host}")
+
+
+class _PooledHTTPConnection(http.client.HTTPConnection):
+    """Plain HTTP connection that reports its TCP handshake to the pool."""
+
+    def __init__(self, host, port, pool: 'ConnectionPool', timeout):
+        super().__init__(host, port, timeout=timeout)
+        self.pool = pool
+        self.phases = {}  # setup timings since the last request picked them up
+
+    def _create_connection(self, address, timeout, source_address=None):
+        return _timed_connection(self, address, timeout, source_address)
+
+    def connect(self):
+        super().connect()
+        self.pool._record_connect(self.host, tls=False, resumed=False)
+
+
+class _PooledHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection that resumes the host's last TLS session."""
+
+    def __init__(self, host, port, pool: 'ConnectionPool', timeout):
+        super().__init__(host, port, timeout=timeout, context=pool.ssl_context)
+        self.pool = pool
+        self.phases = {}
+
+    def _create_connection(self, address, timeout, source_address=None):
+        return _timed_connection(self, address, timeout, source_address)
+
+    def connect(self):
+        # Same as HTTPSConnection.connect, but passes a cached session so the
+        # server can skip the full key exchange.
+        http.client.HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host or self.host
+        session = self.pool._get_tls_session(self.host)
+        started = time.monotonic()
+        try:
+            self.sock = self._context.wrap_socket(
+                self.sock, server_hostname=server_hostname, session=session
+            )
+        except ssl.SSLError:
+            if session is None:
+                raise
+            # Stale session - fall back to a full handshake
+            self.pool._forget_tls_session(self.host)
+            self.sock.close()
+            http.client.HTTPConnection.connect(self)
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname)
+        self.phases['tls'] = time.monotonic() - started
+        self.pool._record_connect(self.host, tls=True, resumed=self.sock.session_reused)
+
+
+class StreamingResponse:
+    """A response whose body is read incrementally.
+
+    Iterate chunks() to consume the body. Closing before the body has been
+    read to the end discards the connection (it cannot be reused with
+    unread data on it), which is how callers stop a download early.
+
+    on_close, if set, is called once the stream has been closed and its
+    timing completed.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', key: tuple, conn, resp: http.client.HTTPResponse,
+                 url: str, timing: Optional[fetch_metrics.RequestTiming] = None):
+        self.url = url
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = resp.headers
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self._wire = [0]
+        self.body_bytes = 0
+        self.finished = False
+        self.closed = False
+        self.timing = timing
+        self.on_close: Optional[Callable[[], None]] = None
+        self._headers_at = time.monotonic()
+        self._pieces: Optional[Iterator[bytes]] = None  # read()'s position in chunks()
+        self._buffer = b''
+
+    @property
+    def wire_bytes(self) -> int:
+        return self._wire[0]
+
+    def chunks(self) -> Iterator[bytes]:
+        """Yield decompressed body chunks; releases the connection at the end."""
+        try:
+            for chunk in iter_body(self._resp, self._wire):
+                self.body_bytes += len(chunk)
+                yield chunk
+        except BaseException:
+            self.close()
+            raise
+        self.finished = True
+        self.close()
+
+    def read(self, size: int = -1) -> bytes:
+        """Read the rest of the body, or with size >= 0 up to size bytes of
+        it (b'' at the end) - so a pull parser such as
+        ElementTree.iterparse can consume the stream directly."""
+        if self._pieces is None:
+            self._pieces = self.chunks()
+        if size < 0:
+            rest, self._buffer = self._buffer, b''
+            return rest + b''.join(self._pieces)
+        while not self._buffer and size:
+            self._buffer = next(self._pieces, None)
+            if self._buffer is None:
+                self._buffer = b''
+                return b''
+        piece, self._buffer = self._buffer[:size], self._buffer[size:]
+        return piece
+
+    def close(self):
+        """Release the connection; drops it if the body was not fully read."""
+        if self.closed:
+            return
+        self.closed = True
+        self._pool._finish_stream(self)
+        if self.on_close is not None:
+            self.on_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    """Thread-safe pool of persistent HTTP(S) connections keyed by host."""
+
+    def __init__(self, max_per_host: int = MAX_CONNECTIONS_PER_HOST,
+                 max_total: int = MAX_CONNECTIONS, timeout: float = DEFAULT_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.max_total = max_total
+        self.timeout = timeout
+        self.ssl_context = ssl.create_default_context()
+
+        self._cond = threading.Condition()
+        self._idle: dict[tuple, list] = {}  # key -> idle connections
+        self._open: dict[tuple, int] = {}  # key -> open connection count
+        self._total_open = 0
+        self._tls_sessions: dict[str, ssl.SSLSession] = {}
+        self._stats: dict[str, PoolStats] = {}
+
+    # -- bookkeeping ---------------------------------------------------------
+
+    def _host_stats(self, host: str) -> PoolStats:
+        if host not in self._stats:
+            self._stats[host] = PoolStats()
+        return self._stats[host]
+
+    def _record_connect(self, host: str, tls: bool, resumed: bool):
+        with self._cond:
+            stats = self._host_stats(host)
+            stats.tcp_handshakes += 1
+            if tls:
+                stats.tls_handshakes += 1
+                if resumed:
+                    stats.tls_resumed += 1
+
+    def _get_tls_session(self, host: str) -> Optional[ssl.SSLSession]:
+        with self._cond:
+            return self._tls_sessions.get(host)
+
+    def _forget_tls_session(self, host: str):
+        with self._cond:
+            self._tls_sessions.pop(host, None)
+
+    def stats(self) -> dict[str, PoolStats]:
+        """Per-host connection counters (copy)."""
+        with self._cond:
+            return {host: PoolStats(**vars(s)) for host, s in self._stats.items()}
+
+    def totals(self) -> PoolStats:
+        """Connection counters summed across hosts."""
+        total = PoolStats()
+        for s in self.stats().values():
+            total.add(s)
+        return total
+
+    # -- connection lifecycle ------------------------------------------------
+
+    def _acquire(self, scheme: str, host: str, port: int):
+        """Return (connection, reused) - an idle connection or a new one."""
+        key = (scheme, host, port)
+        with self._cond:
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    return idle.pop(), True
+
+                if (self._open.get(key, 0) < self.max_per_host
+                        and self._total_open >= self.max_total):
+                    # Make room by closing an idle connection to another host
+                    for other_key, other_idle in self._idle.items():
+                        if other_idle:
+                            other_idle.pop().close()
+                            self._open[other_key] -= 1
+                            self._total_open -= 1
+                            break
+
+                if (self._open.get(key, 0) < self.max_per_host
+                        and self._total_open < self.max_total):
+                    self._open[key] = self._open.get(key, 0) + 1
+                    self._total_open += 1
+                    break
+
+                self._cond.wait()
+
+        if scheme == 'https':
+            conn = _PooledHTTPSConnection(host, port, self, self.timeout)
+        else:
+            conn = _PooledHTTPConnection(host, port, self, self.timeout)
+        return conn, False
+
+    def _release(self, scheme: str, host: str, port: int, conn, reusable: bool):
+        """Return a connection to the pool, or close it."""
+        key = (scheme, host, port)
+        with self._cond:
+            sock = conn.sock
+            if isinstance(sock, ssl.SSLSocket) and sock.session is not None:
+                # TLS 1.3 tickets arrive after the handshake, so capture here
+                self._tls_sessions[host] = sock.session
+
+            if reusable and sock is not None:
+                self._idle.setdefault(key, []).append(conn)
+            else:
+                conn.close()
+                self._open[key] -= 1
+                self._total_open -= 1
+            self._cond.notify()
+
+    def close(self):
+        """Close every idle connection."""
+        with self._cond:
+            for key, idle in self._idle.items():
+                while idle:
+                    idle.pop().close()
+                    self._open[key] -= 1
+                    self._total_open -= 1
+            self._cond.notify_all()
+
+    # -- requests ------------------------------------------------------------
+
+    def _send(self, method: str, url: str, headers: dict, body: Optional[bytes],
+              timeout: Optional[float],
+              timing: Optional[fetch_metrics.RequestTiming] = None) -> StreamingResponse:
+        """Send one request (no redirect handling) and return once headers arrive.
+
+        timing, if given, accumulates this hop's connection setup and TTFB.
+        """
+        original_url = url
+        replayer = http_replay.get_replayer()
+        if replayer is not None:
+            return self._replay(replayer, method, url, headers, body, timing)
+        url, headers = http_replay.route(url, headers)
+
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported URL scheme: {url}")
+        host = parts.hostname or ''
+        port = parts.port or (443 if scheme == 'https' else 80)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        request_headers = {'Accept-Encoding': ACCEPT_ENCODING, 'Connection': 'keep-alive'}
+        request_headers.update(headers)
+
+        recorder = http_replay.get_recorder()
+        for attempt in range(2):
+            conn, reused = self._acquire(scheme, host, port)
+            started = time.monotonic()
+            conn.timeout = timeout or self.timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(conn.timeout)
+            try:
+                conn.request(method, path, body=body, headers=request_headers)
+                resp = conn.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                conn.phases.clear()
+                self._release(scheme, host, port, conn, reusable=False)
+                if reused and attempt == 0:
+                    continue  # server dropped an idle connection - reconnect once
+                raise
+            except BaseException:
+                if timing is not None:
+                    timing.add_connection(conn.phases)
+                self._release(scheme, host, port, conn, reusable=False)
+                raise
+
+            if timing is not None:
+                setup = sum(conn.phases.values())
+                timing.add_connection(conn.phases)
+                timing.ttfb += time.monotonic() - started - setup
+                timing.hops += 1
+                timing.status = resp.status
+            conn.phases.clear()
+
+            with self._cond:
+                stats = self._host_stats(host)
+                stats.requests += 1
+                if reused:
+                    stats.reused += 1
+
+            if recorder is not None:
+                return self._record(recorder, (scheme, host, port), conn, resp,
+                                    method, original_url, headers, body, started, timing)
+            return StreamingResponse(self, (scheme, host, port), conn, resp, original_url,
+                                     timing)
+
+        raise http.client.HTTPException(f"Could not send request to {host}")
+
+    def _replay(self, replayer: 'http_replay.Replayer', method: str, url: str,
+                headers: dict, body: Optional[bytes],
+                timing: Optional[fetch_metrics.RequestTiming]) -> StreamingResponse:
+        """Answer a request from the replay archive instead of the network."""
+        host = (urllib.parse.urlsplit(url).hostname or '').lower()
+        started = time.monotonic()
+        resp = replayer.respond(method, url, headers, body)
+        if timing is not None:
+            timing.ttfb += time.monotonic() - started  # the simulated latency
+            timing.hops += 1
+            timing.status = resp.status
+        return StreamingResponse(self, ('replay', host, 0), None, resp, url, timing)
+
+    def _record(self, recorder: 'http_replay.Recorder', key: tuple, conn,
+                resp: http.client.HTTPResponse, method: str, url: str, headers: dict,
+                body: Optional[bytes], started: float,
+                timing: Optional[fetch_metrics.RequestTiming]) -> StreamingResponse:
+        """Read a whole response into the archive, then hand it out from memory.
+
+        Bodies are always read to the end while recording, so the archive
+        holds complete pages even for fetches that would stop early.
+        """
+        scheme, host, port = key
+        read_started = time.monotonic()
+        try:
+            data, wire_bytes = read_body(resp)
+        except BaseException:
+            self._release(scheme, host, port, conn, reusable=False)
+            raise
+        self._release(scheme, host, port, conn, reusable=not resp.will_close)
+        with self._cond:
+            self._host_stats(host).wire_bytes += wire_bytes
+        if timing is not None:
+            timing.transfer += time.monotonic() - read_started
+            timing.wire_bytes += wire_bytes
+
+        recorder.record(method, url, headers, body, resp.status, resp.reason, resp.headers,
+                        data, time.monotonic() - started)
+        replayed = http_replay.ReplayedResponse(resp.status, resp.reason,
+                                                http_replay.strip_wire_headers(resp.headers.items()),
+                                                data)
+        return StreamingResponse(self, key, None, replayed, url, timing)
+
+    def _finish_stream(self, stream: StreamingResponse):
+        """Account for a streamed body and release its connection."""
+        scheme, host, port = stream._key
+        with self._cond:
+            stats = self._host_stats(host)
+            if stream._conn is not None:
+                stats.wire_bytes += stream.wire_bytes
+            stats.body_bytes += stream.body_bytes
+            if stream.timing is not None:
+                stream.timing.transfer += time.monotonic() - stream._headers_at
+                stream.timing.body_bytes += stream.body_bytes
+                if stream._conn is not None:
+                    stream.timing.wire_bytes += stream.wire_bytes
+            if stream._conn is None:
+                return  # answered from memory (record/replay) - no connection to release
+            if not stream.finished:
+                stats.stopped_early += 1
+                length = stream.headers.get('Content-Length', '')
+                if length.isdigit():
+                    stats.bytes_skipped += max(0, int(length) - stream.wire_bytes)
+
+        reusable = stream.finished and not stream._resp.will_close
+        if not reusable:
+            stream._resp.close()
+        self._release(scheme, host, port, stream._conn, reusable=reusable)
+
+    def open_stream(self, method: str, url: str, headers: Optional[dict] = None,
+                    body: Optional[bytes] = None, timeout: Optional[float] = None,
+                    timing: Optional[fetch_metrics.RequestTiming] = None) -> StreamingResponse:
+        """Send a request, following redirects, and return the final response
+        with its body still unread.
+
+        Raises urllib.error.HTTPError for 4xx/5xx responses so callers can keep
+        their existing urlopen error handling. timing, if given, accumulates
+        the phases of every hop.
+        """
+        headers = dict(headers or {})
+
+        for _ in range(MAX_REDIRECTS + 1):
+            stream = self._send(method, url, headers, body, timeout, timing)
+
+            if stream.status in REDIRECT_CODES and stream.headers.get('Location'):
+                stream.read()
+                url = urllib.parse.urljoin(url, stream.headers['Location'])
+                if stream.status == 303 or (stream.status in (301, 302) and method == 'POST'):
+                    method, body = 'GET', None
+                continue
+
+            if stream.status >= 400:
+                raise urllib.error.HTTPError(
+                    url, stream.status, stream.reason, stream.headers,
+                    io.BytesIO(stream.read())
+                )
+            return stream
+
+        raise urllib.error.HTTPError(url, stream.status, "Too many redirects",
+                                     stream.headers, io.BytesIO(stream.read()))
+
+    def request(self, method: str, url: str, headers: Optional[dict] = None,
+                body: Optional[bytes] = None, timeout: Optional[float] = None,
+                timing: Optional[fetch_metrics.RequestTiming] = None) -> Response:
+        """Send a request, following redirects, and read the whole body.
+
+        Raises urllib.error.HTTPError like open_stream.
+        """
+        stream = self.open_stream(method, url, headers=headers, body=body, timeout=timeout,
+                                  timing=timing)
+        data = stream.read()
+        return Response(url=stream.url, status=stream.status, reason=stream.reason,
+                        headers=stream.headers, body=data, wire_bytes=stream.wire_bytes)
+
+
+# Shared pool for all scrapers in this process
+_POOL = ConnectionPool()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide connection pool."""
+    return _POOL
+
+
+_HEDGE_EXECUTOR: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_HEDGE_LOCK = threading.Lock()
+
+
+def _hedge_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _HEDGE_EXECUTOR
+    with _HEDGE_LOCK:
+        if _HEDGE_EXECUTOR is None:
+            _HEDGE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+                max_workers=MAX_CONNECTIONS, thread_name_prefix='hedge')
+        return _HEDGE_EXECUTOR
+
+
+def _hedged_request(method: str, url: str, headers: Optional[dict], body: Optional[bytes],
+                    timeout: Optional[float], pace: Optional[Callable[[str], None]],
+                    delay: float, timing: fetch_metrics.RequestTiming) -> Response:
+    """Send a request; if it is still running after delay, send a second copy
+    and return whichever succeeds first.
+
+    The copy waits for pace like any other request, so hedges spend the
+    host's politeness budget rather than bypassing it. The losing request
+    is left to finish in the background and its connection goes back to
+    the pool.
+    """
+    tail = tail_latency.get_tail_latency()
+    host = timing.host
+    executor = _hedge_executor()
+
+    def send(attempt_timing):
+        return _POOL.request(method, url, headers=headers, body=body, timeout=timeout,
+                             timing=attempt_timing)
+
+    timings = {}
+    primary_timing = fetch_metrics.RequestTiming(url=url, host=host, method=method)
+    primary = executor.submit(send, primary_timing)
+    timings[primary] = primary_timing
+
+    concurrent.futures.wait([primary], timeout=delay)
+    if not primary.done() and pace is not None and not http_replay.is_offline():
+        pace(url)
+    if primary.done():
+        timing.merge(primary_timing)
+        return primary.result()
+
+    tail.record_hedge(host)
+    hedge_timing = fetch_metrics.RequestTiming(url=url, host=host, method=method)
+    hedge = executor.submit(send, hedge_timing)
+    timings[hedge] = hedge_timing
+
+    winner = None
+    pending = {primary, hedge}
+    while pending and winner is None:
+        done, pending = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        # Prefer the original when both finish together
+        for future in sorted(done, key=lambda f: f is not primary):
+            if future.exception() is None:
+                winner = future
+                break
+
+    if winner is None:
+        timing.merge(primary_timing)
+        raise primary.exception()
+
+    timing.merge(timings[winner])
+    if winner is hedge:
+        tail.record_hedge_won(host)
+        won_at = time.monotonic()
+        primary.add_done_callback(lambda _: tail.record_saved(host, time.monotonic() - won_at))
+    return winner.result()
+
+
+def _cache() -> Optional[http_cache.HttpCache]:
+    # Recording must capture full responses and replay must not depend on
+    # what happens to be on disk, so the cache sits out both
+    if http_replay.MODE in ('record', 'replay') or http_replay.REPLAY_SERVER:
+        return None
+    return http_cache.get_cache()
+
+
+def request_with_retries(method: str, url: str, headers: Optional[dict] = None,
+                         body: Optional[bytes] = None, timeout: Optional[float] = None,
+                         pace: Optional[Callable[[str], None]] = None,
+                         idempotent: Optional[bool] = None, stream: bool = False,
+                         hedge: bool = False):
+    """Send a request through the shared pool under the retry policy.
+
+    Transient failures of idempotent requests are retried with backoff
+    (see retry_policy); every attempt goes through the host's circuit
+    breaker and, if given, the pace callback. A pace callback with a
+    throttled(url) method is told about every 429 so it can slow down.
+
+    Each attempt's socket timeout is tightened to the host's adaptive
+    deadline, and with hedge=True a slow idempotent, non-streaming attempt
+    is hedged (see tail_latency).
+
+    Returns a Response, or with stream=True a StreamingResponse whose body
+    is still unread (failures while reading it are not retried). The
+    request's timings go to fetch_metrics once its body has been read.
+    """
+    breaker = retry_policy.get_breaker()
+    tail = tail_latency.get_tail_latency()
+    host = (urllib.parse.urlsplit(url).hostname or '').lower()
+    timing = fetch_metrics.RequestTiming(url=url, host=host, method=method)
+    if idempotent is None:
+        idempotent = method.upper() in retry_policy.IDEMPOTENT_METHODS
+    attempt = 0
+
+    while True:
+        breaker.before_request(host)
+        started = time.monotonic()
+        attempt_timeout = tail.timeout_for(host, timeout or DEFAULT_TIMEOUT)
+        hedge_delay = tail.hedge_delay(host) if hedge and idempotent and not stream else None
+        try:
+            if pace is not None and not http_replay.is_offline():
+                pace(url)
+            if hedge_delay is not None:
+                response = _hedged_request(method, url, headers, body, attempt_timeout, pace,
+                                           hedge_delay, timing)
+            elif stream:
+                response = _POOL.open_stream(method, url, headers=headers, body=body,
+                                             timeout=attempt_timeout, timing=timing)
+            else:
+                response = _POOL.request(method, url, headers=headers, body=body,
+                                         timeout=attempt_timeout, timing=timing)
+        except Exception as e:
+            elapsed = time.monotonic() - started
+            retry_after = None
+            if isinstance(e, urllib.error.HTTPError):
+                retry_after = retry_policy.parse_retry_after(e.headers.get('Retry-After'))
+                throttled = getattr(pace, 'throttled', None)
+                if e.code == 429 and throttled is not None:
+                    throttled(url)
+
+            give_up = (attempt >= retry_policy.MAX_RETRIES
+                       or not retry_policy.is_retryable(method, e, idempotent)
+                       # server wants us gone for longer than we are willing to wait
+                       or (retry_after is not None and retry_after > retry_policy.MAX_BACKOFF))
+            breaker.record_failure(host, e, elapsed, final=give_up)
+            if give_up:
+                timing.error = f"{type(e).__name__}: {e}"
+                if isinstance(e, urllib.error.HTTPError):
+                    timing.status = e.code
+                fetch_metrics.record(timing)
+                raise
+
+            delay = retry_policy.backoff_delay(attempt, retry_after)
+            breaker.record_retry(host, delay)
+            time.sleep(delay)
+            attempt += 1
+            timing.retries = attempt
+            continue
+
+        breaker.record_success(host)
+        if stream:
+            response.on_close = lambda: fetch_metrics.record(timing)
+        else:
+            fetch_metrics.record(timing)
+        return response
+
+
+def fetch(url: str, headers: Optional[dict] = None, timeout: Optional[float] = None,
+          pace: Optional[Callable[[str], None]] = None, use_cache: bool = True,
+          hedge: Optional[bool] = None, lastmod: Optional[float] = None) -> Response:
+    """GET a URL through the shared pool and the on-disk cache.
+
+    pace, if given, is called with the URL right before a request goes on
+    the wire (not for fresh cache hits) - scrapers pass their host
+    politeness limiter here. hedge defaults to tail_latency.HEDGE_ENABLED.
+    lastmod is when the page last changed, if known (see sitemap): a cached
+    copy stored after it is served without a request.
+    """
+    if hedge is None:
+        hedge = tail_latency.HEDGE_ENABLED
+    cache = _cache() if use_cache else None
+    host = (urllib.parse.urlsplit(url).hostname or '').lower()
+    request_headers = dict(headers or {})
+
+    entry = cache.get(url) if cache else None
+    if entry is not None and entry.partial:
+        entry = None  # body was cut short by a streaming fetch - need it all
+    if entry is not None:
+        if entry.is_fresh() or entry.is_current(lastmod):
+            cache.record(host, 'hit' if entry.is_fresh() else 'unchanged', len(entry.body))
+            return Response(url=url, status=entry.status, reason='OK (cached)',
+                            headers=entry.message(), body=entry.body)
+        request_headers.update(entry.conditional_headers())
+
+    response = request_with_retries('GET', url, headers=request_headers,
+                                    timeout=timeout, pace=pace, hedge=hedge)
+
+    if cache is None:
+        return response
+
+    if response.status == 304 and entry is not None:
+        entry = cache.refresh(entry, response.headers)
+        cache.record(host, 'revalidated', len(entry.body))
+        return Response(url=response.url, status=entry.status, reason='OK (revalidated)',
+                        headers=entry.message(), body=entry.body)
+
+    cache.record(host, 'miss', len(response.body))
+    cache.store(url, response.status, response.headers, response.body, lastmod=lastmod)
+    return response
+
+
+def fetch_text(url: str, headers: Optional[dict] = None, timeout: Optional[float] = None,
+               pace: Optional[Callable[[str], None]] = None,
+               stop_when: Optional[Callable[[str], bool]] = None,
+               lastmod: Optional[float] = None) -> str:
+    """GET a URL (see fetch, including lastmod) and decode the body as text.
+
+    stop_when switches to streaming mode: it is called with each chunk of
+    decoded text as it arrives and returns True once the caller has what it
+    needs (e.g. html_text.RegionWatcher). The rest of the download is then
+    abandoned and the text received so far is returned.
+
+    HTML bodies lose their script/style/svg subtrees and comments before
+    they are decoded (see html_strip).
+    """
+    if stop_when is None:
+        response = fetch(url, headers=headers, timeout=timeout, pace=pace, lastmod=lastmod)
+        host = (urllib.parse.urlsplit(url).hostname or '').lower()
+        return _decode_page(host, response.body, response.headers.get('Content-Type'))
+    return _fetch_text_streaming(url, headers, timeout, pace, stop_when, lastmod)
+
+
+def _fetch_text_streaming(url: str, headers: Optional[dict], timeout: Optional[float],
+                          pace: Optional[Callable[[str], None]],
+                          stop_when: Callable[[str], bool],
+                          lastmod: Optional[float] = None) -> str:
+    cache = _cache()
+    host = (urllib.parse.urlsplit(url).hostname or '').lower()
+    request_headers = dict(headers or {})
+
+    # A partial entry is fine here: it was cut after the region we stop at
+    entry = cache.get(url) if cache else None
+    if entry is not None:
+        if entry.is_fresh() or entry.is_current(lastmod):
+            cache.record(host, 'hit' if entry.is_fresh() else 'unchanged', len(entry.body))
+            return _decode_page(host, entry.body, entry.headers.get('Content-Type'))
+        request_headers.update(entry.conditional_headers())
+
+    stream = request_with_retries('GET', url, headers=request_headers, timeout=timeout,
+                                  pace=pace, stream=True)
+    with stream:
+        if stream.status == 304 and entry is not None:
+            stream.read()
+            entry = cache.refresh(entry, stream.headers)
+            cache.record(host, 'revalidated', len(entry.body))
+            return _decode_page(host, entry.body, entry.headers.get('Content-Type'))
+
+        content_type = stream.headers.get('Content-Type')
+        raw = []
+        text_parts = []
+        pending = b''
+        decoder = None
+        stripper = None
+        strip_seconds = 0.0
+        for chunk in stream.chunks():
+            raw.append(chunk)
+            if decoder is None:
+                # Wait for enough bytes to see a <meta charset> before decoding
+                pending += chunk
+                if len(pending) < 1024:
+                    continue
+                charset = detect_charset(pending, content_type)
+                if html_strip.applies(content_type, pending, charset):
+                    stripper = html_strip.MarkupStripper()
+                decoder = codecs.getincrementaldecoder(charset)(errors='ignore')
+                chunk, pending = pending, b''
+            if stripper is not None:
+                started = time.perf_counter()
+                chunk = stripper.feed(chunk)
+                strip_seconds += time.perf_counter() - started
+            text = decoder.decode(chunk)
+            text_parts.append(text)
+            if stop_when(text):
+                break
+        else:
+            if decoder is None:
+                text_parts.append(_decode_page(host, pending, content_type))
+            else:
+                tail = stripper.flush() if stripper is not None else b''
+                text_parts.append(decoder.decode(tail, final=True))
+        finished = stream.finished
+
+    if stripper is not None:
+        html_strip.record(host, stripper, strip_seconds)
+    body = b''.join(raw)
+    if cache is not None:
+        cache.record(host, 'miss', len(body))
+        cache.store(url, stream.status, stream.headers, body, partial=not finished,
+                    lastmod=lastmod)
+    return ''.join(text_parts)
+
+
+def print_stats():
+    """Print connection reuse and handshake counts for this run."""
+    if http_replay.replaying_in_process():
+        http_replay.print_stats()  # nothing went over a connection
+        html_strip.print_stats()
+        return
+
+    stats = _POOL.stats()
+    total = _POOL.totals()
+
+    print("\nHTTP connections:", flush=True)
+    for host, s in sorted(stats.items()):
+        print(f"  - {host}: {s.requests} requests, {s.tcp_handshakes} TCP handshakes, "
+              f"{s.tls_handshakes} TLS ({s.tls_resumed} resumed), "
+              f"{s.wire_bytes:,} bytes on the wire / {s.body_bytes:,} decompressed", flush=True)
+    saved = max(0, total.requests - total.tcp_handshakes)
+    print(f"  Total: {total.requests} requests over {total.tcp_handshakes} connections "
+          f"({saved} handshakes saved by keep-alive)", flush=True)
+    if total.stopped_early:
+        print(f"  Streaming: {total.stopped_early} downloads stopped once the target region "
+              f"closed ({total.bytes_skipped:,}+ bytes not downloaded)", flush=True)
+
+    html_strip.print_stats()
+    http_cache.print_stats()
+    retry_policy.print_stats()
+    tail_latency.print_stats()
+    http_replay.print_stats()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+HTTP Record / Replay
+Capture every request the scrapers make and serve it back offline.
+
+Modes are chosen with environment variables, so any scraper can be
+recorded or replayed without code changes:
+
+    HEYDOC_HTTP_MODE=record  python scrapers/medical_scraper.py
+    HEYDOC_HTTP_MODE=replay  python scrapers/medical_scraper.py
+
+    HEYDOC_HTTP_ARCHIVE      archive path (default scrapers/http_archive.jsonl.gz)
+    HEYDOC_REPLAY_LATENCY    seconds added to each replayed response, or
+                             'recorded' to reproduce the original timings
+    HEYDOC_REPLAY_SERVER     base URL of a stand-in server (see below);
+                             requests are sent there instead of the real host
+
+The archive is a gzip-compressed JSON-lines file with one record per HTTP
+exchange (redirect hops included), keyed by method, URL, the request
+headers that change the answer, and a hash of the request body. Bodies are
+stored decompressed. Credentials (the NCBI api_key) are taken out of the
+URL and form body before keying and storing, so the archive holds no
+secret and replays whatever key, if any, is set. In replay mode politeness delays are skipped and the
+on-disk cache is bypassed, so a full run takes seconds with no network.
+
+The same archive can be served by a local stand-in HTTP server, which
+exercises the real connection pool end to end:
+
+    python scrapers/http_replay.py serve [--port 8765] [--latency 0.05] [ARCHIVE]
+    HEYDOC_REPLAY_SERVER=http://127.0.0.1:8765 python scrapers/pubmed_api.py
+
+    python scrapers/http_replay.py info [ARCHIVE]
+"""
+
+import argparse
+import atexit
+import base64
+import gzip
+import hashlib
+import http.client
+import http.server
+import io
+import json
+import os
+import threading
+import time
+import urllib.parse
+from typing import Optional
+
+# Configuration
+DEFAULT_ARCHIVE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'http_archive.jsonl.gz')
+ARCHIVE_PATH = os.environ.get('HEYDOC_HTTP_ARCHIVE', DEFAULT_ARCHIVE)
+MODE = os.environ.get('HEYDOC_HTTP_MODE', 'live').lower()  # live | record | replay
+REPLAY_LATENCY = os.environ.get('HEYDOC_REPLAY_LATENCY', '0')
+REPLAY_SERVER = os.environ.get('HEYDOC_REPLAY_SERVER', '').rstrip('/')
+
+# Request headers that can change the response, and so are part of the key
+KEY_HEADERS = ('accept', 'accept-language', 'content-type', 'if-modified-since',
+               'if-none-match', 'range')
+# Response headers that describe the wire encoding, not the stored body
+WIRE_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+ORIGINAL_URL_HEADER = 'X-Replay-Url'
+# Query / form parameters that are credentials, not part of the request
+SECRET_PARAMS = ('api_key',)
+
+
+def _without_secrets(query: str) -> str:
+    pairs = urllib.parse.parse_qsl(query, keep_blank_values=True)
+    if not any(name in SECRET_PARAMS for name, _ in pairs):
+        return query
+    return urllib.parse.urlencode([(name, value) for name, value in pairs
+                                   if name not in SECRET_PARAMS])
+
+
+def public_url(url: str) -> str:
+    """url without credential parameters."""
+    parts = urllib.parse.urlsplit(url)
+    if not parts.query:
+        return url
+    return urllib.parse.urlunsplit(parts._replace(query=_without_secrets(parts.query)))
+
+
+def _public_body(headers: dict, body: Optional[bytes]) -> Optional[bytes]:
+    content_type = next((value for name, value in headers.items()
+                         if name.lower() == 'content-type'), '')
+    if not body or 'x-www-form-urlencoded' not in content_type.lower():
+        return body
+    try:
+        return _without_secrets(body.decode('ascii')).encode('ascii')
+    except UnicodeDecodeError:
+        return body
+
+
+def request_key(method: str, url: str, headers: dict, body: Optional[bytes]) -> str:
+    """Archive key for a request, without its credentials."""
+    lowered = {name.lower(): value for name, value in headers.items()}
+    body = _public_body(headers, body)
+    parts = [method.upper(), public_url(url)]
+    parts += [f"{name}={lowered[name]}" for name in KEY_HEADERS if name in lowered]
+    if body:
+        parts.append('body=' + hashlib.sha1(body).hexdigest())
+    return '\n'.join(parts)
+
+
+def loose_key(method: str, url: str, headers: dict, body: Optional[bytes]) -> str:
+    """Key ignoring headers, used when the exact request was not recorded."""
+    content_type = {name: value for name, value in headers.items()
+                    if name.lower() == 'content-type'}
+    return request_key(method, url, {}, _public_body(content_type, body))
+
+
+class ReplayedResponse:
+    """Stands in for http.client.HTTPResponse with a body held in memory."""
+
+    def __init__(self, status: int, reason: str, headers: http.client.HTTPMessage, body: bytes):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.will_close = False
+        self._body = io.BytesIO(body)
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        return self._body.read(amt)
+
+    def close(self):
+        self._body.close()
+
+
+def strip_wire_headers(header_pairs) -> http.client.HTTPMessage:
+    """Response headers without transfer details, for a body held decompressed."""
+    msg = http.client.HTTPMessage()
+    for name, value in header_pairs:
+        if name.lower() not in WIRE_HEADERS:
+            msg[name] = value
+    return msg
+
+
+def _encode_body(body: bytes) -> dict:
+    try:
+        return {'text': body.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'b64': base64.b64encode(body).decode('ascii')}
+
+
+def record_body(record: dict) -> bytes:
+    """Decompressed response body of an archive record."""
+    if 'text' in record:
+        return record['text'].encode('utf-8')
+    return base64.b64decode(record.get('b64', ''))
+
+
+class Recorder:
+    """Appends exchanges to a gzip JSON-lines archive."""
+
+    def __init__(self, path: str = ARCHIVE_PATH):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def record(self, method: str, url: str, headers: dict, body: Optional[bytes],
+               status: int, reason: str, response_headers, response_body: bytes,
+               elapsed: float):
+        record = {
+            'key': request_key(method, url, headers, body),
+            'loose': loose_key(method, url, headers, body),
+            'method': method,
+            'url': public_url(url),
+            'status': status,
+            'reason': reason,
+            'headers': [[name, value] for name, value in response_headers.items()],
+            'elapsed': round(elapsed, 4),
+        }
+        record.update(_encode_body(response_body))
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = gzip.open(self.path, 'ab')
+                atexit.register(self.close)
+            self._file.write(line)
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Archive:
+    """Recorded exchanges indexed by request key."""
+
+    def __init__(self, path: str = ARCHIVE_PATH):
+        self.path = path
+        self._exact: dict[str, list] = {}
+        self._loose: dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._exact.setdefault(record['key'], []).append(record)
+                if record['status'] != 304:
+                    self._loose.setdefault(record['loose'], []).append(record)
+
+    def records(self):
+        """Iterate over every recorded exchange."""
+        for records in self._exact.values():
+            yield from records
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self._exact.values())
+
+    @staticmethod
+    def _take(records: list) -> dict:
+        # Serve repeated requests in recorded order; the last answer repeats
+        return records.pop(0) if len(records) > 1 else records[0]
+
+    def lookup(self, method: str, url: str, headers: dict,
+               body: Optional[bytes]) -> Optional[dict]:
+        """Find the recorded exchange for a request, or None."""
+        with self._lock:
+            records = self._exact.get(request_key(method, url, headers, body))
+            if not records:
+                # e.g. a conditional request that was sent unconditionally when
+                # recording - a full 200 is still a valid answer
+                records = self._loose.get(loose_key(method, url, headers, body))
+            if not records:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._take(records)
+
+
+def recorded_pages(path: str = ARCHIVE_PATH,
+                   hosts: Optional[tuple] = None) -> list[tuple[str, Optional[str], bytes]]:
+    """(url, Content-Type, body) of every recorded 200 HTML page, optionally
+    limited to hosts ending in one of the given suffixes. Used by the
+    benchmark scripts."""
+    pages = []
+    for record in Archive(path).records():
+        if record['status'] != 200:
+            continue
+        headers = dict((name.lower(), value) for name, value in record['headers'])
+        content_type = headers.get('content-type')
+        if content_type and 'html' not in content_type.lower():
+            continue
+        host = (urllib.parse.urlsplit(record['url']).hostname or '').lower()
+        if hosts and not host.endswith(tuple(hosts)):
+            continue
+        pages.append((record['url'], content_type, record_body(record)))
+    return pages
+
+
+def _latency(record: dict, latency: str) -> float:
+    if latency == 'recorded':
+        return record.get('elapsed', 0.0)
+    try:
+        return float(latency)
+    except ValueError:
+        return 0.0
+
+
+class Replayer:
+    """Serves responses from an Archive in place of the network."""
+
+    def __init__(self, archive: Archive, latency: str = REPLAY_LATENCY):
+        self.archive = archive
+        self.latency = latency
+
+    def respond(self, method: str, url: str, headers: dict,
+                body: Optional[bytes]) -> ReplayedResponse:
+        record = self.archive.lookup(method, url, headers, body)
+        if record is None:
+            msg = http.client.HTTPMessage()
+            msg['X-Replay-Miss'] = '1'
+            return ReplayedResponse(404, 'Not in replay archive', msg, b'')
+
+        delay = _latency(record, self.latency)
+        if delay > 0:
+            time.sleep(delay)
+        return ReplayedResponse(record['status'], record['reason'],
+                                strip_wire_headers(record['headers']), record_body(record))
+
+
+_recorder: Optional[Recorder] = None
+_replayer: Optional[Replayer] = None
+
+
+def get_recorder() -> Optional[Recorder]:
+    """The active recorder when HEYDOC_HTTP_MODE=record, else None."""
+    global _recorder
+    if MODE == 'record' and _recorder is None:
+        _recorder = Recorder()
+    return _recorder
+
+
+def get_replayer() -> Optional[Replayer]:
+    """The active in-process replayer when HEYDOC_HTTP_MODE=replay, else None."""
+    global _replayer
+    if replaying_in_process() and _replayer is None:
+        _replayer = Replayer(Archive())
+    return _replayer
+
+
+def replaying_in_process() -> bool:
+    """Whether responses come straight from the archive, with no sockets."""
+    return MODE == 'replay' and not REPLAY_SERVER
+
+
+def is_offline() -> bool:
+    """Whether requests are being answered from an archive."""
+    return MODE == 'replay' or bool(REPLAY_SERVER)
+
+
+def route(url: str, headers: dict) -> tuple[str, dict]:
+    """Redirect a request to the stand-in server when one is configured."""
+    if not REPLAY_SERVER:
+        return url, headers
+    headers = dict(headers)
+    headers[ORIGINAL_URL_HEADER] = url
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return f"{REPLAY_SERVER}/{parts.scheme}/{parts.netloc}{path}", headers
+
+
+def print_stats():
+    """Print what was recorded or replayed in this run."""
+    if _recorder is not None:
+        print(f"\nRecorded {_recorder.count} HTTP exchanges to {_recorder.path}", flush=True)
+    if _replayer is not None:
+        archive = _replayer.archive
+        print(f"\nReplayed {archive.hits} HTTP exchanges from {archive.path} "
+              f"({archive.misses} not in archive)", flush=True)
+
+
+# ============================================================================
+# Stand-in server
+# ============================================================================
+
+def make_server(archive: Archive, port: int = 8765, latency: str = '0',
+                host: str = '127.0.0.1') -> http.server.ThreadingHTTPServer:
+    """Build an HTTP server that answers requests from the archive."""
+    replayer = Replayer(archive, latency)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _handle(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else None
+            url = self.headers.get(ORIGINAL_URL_HEADER, '')
+            headers = {name: value for name, value in self.headers.items()
+                       if name.lower() != ORIGINAL_URL_HEADER.lower()}
+
+            resp = replayer.respond(self.command, url, headers, body)
+            data = resp.read()
+            if 'gzip' in (self.headers.get('Accept-Encoding') or '') and len(data) > 1024:
+                data = gzip.compress(data, compresslevel=5)
+                resp.headers['Content-Encoding'] = 'gzip'
+
+            self.send_response(resp.status, resp.reason)
+            for name, value in resp.headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(data)
+
+        do_GET = do_POST = do_HEAD = _handle
+
+        def log_message(self, format, *args):
+            pass
+
+    return http.server.ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    """Command line: serve or summarise an archive."""
+    parser = argparse.ArgumentParser(description="HeyDoc HTTP record/replay archive tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help='serve an archive over HTTP')
+    serve.add_argument('archive', nargs='?', default=ARCHIVE_PATH)
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--latency', default=REPLAY_LATENCY,
+                       help="seconds per response, or 'recorded'")
+
+    info = sub.add_parser('info', help='summarise an archive')
+    info.add_argument('archive', nargs='?', default=ARCHIVE_PATH)
+
+    args = parser.parse_args()
+    archive = Archive(args.archive)
+
+    if args.command == 'info':
+        by_host = {}
+        for record in archive.records():
+            host = urllib.parse.urlsplit(record['url']).netloc
+            by_host[host] = by_host.get(host, 0) + 1
+        print(f"{args.archive}: {len(archive)} exchanges", flush=True)
+        for host, count in sorted(by_host.items()):
+            print(f"  - {host}: {count}", flush=True)
+        return
+
+    server = make_server(archive, args.port, args.latency)
+    print(f"Replaying {len(archive)} exchanges from {args.archive} "
+          f"on http://127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -13,15 +13,21 @@ Sources:
 import csv
 import json
 import re
-import time
-import urllib.request
-import urllib.error
 import sys
 from datetime import date
-from html.parser import HTMLParser
 from typing import Optional
 from dataclasses import dataclass
 
+import boilerplate
+import crawl_engine
+import fetch_metrics
+import http_client
+import page_guard
+import pipeline
+import sitemap
+from html_text import (RegionWatcher, Selector, chunk_sections, extract_regions,
+                       first_long_region, longest_region, page_heading, section_chars)
+
 # Configuration
 REQUEST_DELAY = 2.0  # seconds between requests (polite scraping)
 MAX_CHUNK_SIZE = 2000  # max characters per text chunk
@@ -44,60 +50,23 @@ class RagEntry:
     date_accessed: str
     text_chunk: str
     category: str
+    section: str = ""  # heading path of the chunk within its page
 
 
-class TextExtractor(HTMLParser):
-    """Extract clean text from HTML, preserving some structure."""
-
-    def __init__(self):
-        super().__init__()
-        self.text_parts = []
-        self.skip_tags = {'script', 'style', 'nav', 'header', 'footer', 'aside', 'noscript'}
-        self.current_skip = 0
-
-    def handle_starttag(self, tag, attrs):
-        if tag in self.skip_tags:
-            self.current_skip += 1
-        if tag in ('p', 'li', 'h1', 'h2', 'h3', 'h4', 'br', 'div'):
-            self.text_parts.append(' ')
-
-    def handle_endtag(self, tag):
-        if tag in self.skip_tags:
-            self.current_skip = max(0, self.current_skip - 1)
-        if tag in ('p', 'li', 'h1', 'h2', 'h3', 'h4'):
-            self.text_parts.append(' ')
-
-    def handle_data(self, data):
-        if self.current_skip == 0:
-            self.text_parts.append(data)
-
-    def get_text(self) -> str:
-        text = ' '.join(self.text_parts)
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
-
-
-def extract_text(html: str) -> str:
-    """Extract clean text from HTML."""
-    parser = TextExtractor()
-    try:
-        parser.feed(html)
-    except Exception:
-        pass
-    return parser.get_text()
-
-
-def fetch_url(url: str, delay: bool = True) -> Optional[str]:
-    """Fetch URL content with polite delay."""
-    if delay:
-        time.sleep(REQUEST_DELAY)
+def fetch_url(url: str, delay: bool = True, stop_after: Optional[tuple] = None,
+              lastmod: Optional[float] = None) -> Optional[str]:
+    """Fetch URL content with polite delay.
 
+    With stop_after (e.g. ('main',)) the page is parsed while it downloads
+    and reading stops once that element has closed. With lastmod (from the
+    sitemap) a cached copy newer than that is used without a request.
+    """
     headers = {'User-Agent': USER_AGENT}
-    req = urllib.request.Request(url, headers=headers)
-
+    stop_when = RegionWatcher(stop_after) if stop_after else None
     try:
-        with urllib.request.urlopen(req, timeout=30) as response:
-            return response.read().decode('utf-8', errors='ignore')
+        return http_client.fetch_text(url, headers=headers, timeout=30,
+                                      pace=crawl_engine.pacer(REQUEST_DELAY, wait=delay),
+                                      stop_when=stop_when, lastmod=lastmod)
     except Exception as e:
         print(f"  Error fetching {url}: {e}", flush=True)
         return None
@@ -139,8 +108,37 @@ def chunk_text(text: str, max_size: int = MAX_CHUNK_SIZE) -> list[str]:
 # MedlinePlus Health Topics Scraper
 # ============================================================================
 
-def get_medlineplus_topic_links() -> list[tuple[str, str]]:
-    """Get all health topic links from MedlinePlus."""
+MEDLINEPLUS_SITEMAP = "https://medlineplus.gov/sitemap.xml"
+
+# Top-level pages that are not health topics
+MEDLINEPLUS_SKIP = ('index', 'about', 'contact', 'privacy', 'terms',
+                    'accessibility', 'disclaimer', 'viewers', 'sitemap',
+                    'healthtopics', 'languages', 'all_', 'copyright',
+                    'medlineplus', 'faq', 'newsletter')
+
+# Health topics are the top-level pages, e.g. https://medlineplus.gov/asthma.html
+MEDLINEPLUS_PAGES = sitemap.PathRules(include=r'/([a-z][a-z0-9]*)\.html',
+                                      exclude=MEDLINEPLUS_SKIP)
+
+
+def get_medlineplus_topic_links() -> list[tuple[str, Optional[str], Optional[float]]]:
+    """Get health topic pages from the MedlinePlus sitemap as (url, title,
+    lastmod). Sitemap topics have no title yet - it is read from the page."""
+    print("Fetching MedlinePlus sitemap...", flush=True)
+
+    pages = sitemap.discover('MedlinePlus', MEDLINEPLUS_SITEMAP, MEDLINEPLUS_PAGES,
+                             headers={'User-Agent': USER_AGENT},
+                             pace=crawl_engine.pacer(REQUEST_DELAY, wait=False))
+    if not pages:
+        print("  No sitemap, using the all-topics index", flush=True)
+        return [(url, title, None) for url, title in get_medlineplus_index_links()]
+
+    print(f"  Found {len(pages)} health topics", flush=True)
+    return [(page.url, None, page.lastmod) for page in pages][:MAX_ENTRIES_PER_SOURCE]
+
+
+def get_medlineplus_index_links() -> list[tuple[str, str]]:
+    """Get all health topic links from the MedlinePlus all-topics page."""
     print("Fetching MedlinePlus health topic index...", flush=True)
 
     topics = []
@@ -158,11 +156,7 @@ def get_medlineplus_topic_links() -> list[tuple[str, str]]:
     seen = set()
     for full_url, path, title in matches:
         # Skip non-topic pages
-        skip_patterns = ['index', 'about', 'contact', 'privacy', 'terms',
-                         'accessibility', 'disclaimer', 'viewers', 'sitemap',
-                         'healthtopics', 'languages', 'all_', 'copyright',
-                         'medlineplus', 'faq', 'newsletter']
-        if any(x in path.lower() for x in skip_patterns):
+        if any(x in path.lower() for x in MEDLINEPLUS_SKIP):
             continue
 
         if full_url not in seen:
@@ -176,11 +170,7 @@ def get_medlineplus_topic_links() -> list[tuple[str, str]]:
     matches2 = re.findall(pattern2, html, re.IGNORECASE)
 
     for path, title in matches2:
-        skip_patterns = ['index', 'about', 'contact', 'privacy', 'terms',
-                         'accessibility', 'disclaimer', 'viewers', 'sitemap',
-                         'healthtopics', 'languages', 'all_', 'copyright',
-                         'medlineplus', 'faq', 'newsletter']
-        if any(x in path.lower() for x in skip_patterns):
+        if any(x in path.lower() for x in MEDLINEPLUS_SKIP):
             continue
 
         full_url = f"https://medlineplus.gov/{path}"
@@ -194,67 +184,49 @@ def get_medlineplus_topic_links() -> list[tuple[str, str]]:
     return topics[:MAX_ENTRIES_PER_SOURCE]
 
 
-def scrape_medlineplus_topic(url: str, title: str) -> Optional[str]:
-    """Scrape content from a MedlinePlus topic page."""
-    html = fetch_url(url)
-    if not html:
-        return None
+# Candidate content regions, in priority order
+MEDLINEPLUS_REGIONS = [
+    Selector('div', class_contains='mp-summary'),
+    Selector('section', class_contains='summary'),
+    Selector('div', id='topic-summary'),
+    Selector('div', class_contains='summary'),
+    Selector('article'),
+    Selector('main'),
+]
 
-    content = ""
 
-    # Look for the main topic summary section
-    summary_patterns = [
-        r'<div[^>]*class="[^"]*mp-summary[^"]*"[^>]*>(.*?)</div>',
-        r'<section[^>]*class="[^"]*summary[^"]*"[^>]*>(.*?)</section>',
-        r'<div[^>]*id="topic-summary"[^>]*>(.*?)</div>',
-        r'<div[^>]*class="[^"]*summary[^"]*"[^>]*>(.*?)</div>',
-    ]
+MEDLINEPLUS_BOILERPLATE = [
+    r'See, Play and Learn.*?(?=\.|$)',
+    r'No links available.*?(?=\.|$)',
+    r'NIH: National.*',
+    r'Start Here.*?(?=\.|$)',
+    r'Learn More.*?(?=\.|$)',
+    r'Related Issues.*',
+    r'Diagnosis and Tests.*',
+    r'Statistics and Research.*',
+    r'Clinical Trials.*',
+    r'Journal Articles.*',
+]
 
-    for pattern in summary_patterns:
-        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
-        if match:
-            content = extract_text(match.group(1))
-            if len(content) > 100:
-                break
-
-    # Try main article content
-    if not content or len(content) < 100:
-        article_match = re.search(
-            r'<article[^>]*>(.*?)</article>',
-            html, re.DOTALL | re.IGNORECASE
-        )
-        if article_match:
-            content = extract_text(article_match.group(1))
-
-    # Fallback to main element
-    if not content or len(content) < 100:
-        main_match = re.search(
-            r'<main[^>]*>(.*?)</main>',
-            html, re.DOTALL | re.IGNORECASE
-        )
-        if main_match:
-            content = extract_text(main_match.group(1))
-
-    # Clean up
-    content = re.sub(r'\s+', ' ', content).strip()
+
+def parse_medlineplus_topic(job: tuple, html: str) -> Optional[tuple[str, list[tuple[str, str]]]]:
+    """Parse stage: (title, (section, chunk) pairs) of a fetched MedlinePlus
+    topic page. Without a title, the page's <h1> is used."""
+    _, (url, title, _) = job
+    title = title or page_heading(html) or sitemap.slug_title(MEDLINEPLUS_PAGES.slug(url) or url)
+
+    # Topic summary first, then the article, then the whole <main>
+    sections = page_guard.extract_sections(
+        'MedlinePlus', url, html,
+        lambda page, budget: first_long_region(
+            extract_regions(page, MEDLINEPLUS_REGIONS, first_over=100, budget=budget)))
 
     # Remove boilerplate
-    boilerplate = [
-        r'See, Play and Learn.*?(?=\.|$)',
-        r'No links available.*?(?=\.|$)',
-        r'NIH: National.*',
-        r'Start Here.*?(?=\.|$)',
-        r'Learn More.*?(?=\.|$)',
-        r'Related Issues.*',
-        r'Diagnosis and Tests.*',
-        r'Statistics and Research.*',
-        r'Clinical Trials.*',
-        r'Journal Articles.*',
-    ]
-    for pattern in boilerplate:
-        content = re.sub(pattern, '', content, flags=re.IGNORECASE)
+    sections = boilerplate.trimmer('MedlinePlus', MEDLINEPLUS_BOILERPLATE).trim_sections(sections)
 
-    return content.strip() if len(content) > 50 else None
+    if section_chars(sections) <= 50:
+        return None
+    return title, chunk_sections(sections, chunk_text, MAX_CHUNK_SIZE)
 
 
 def scrape_medlineplus_topics() -> list[RagEntry]:
@@ -266,16 +238,19 @@ def scrape_medlineplus_topics() -> list[RagEntry]:
     entries = []
     topics = get_medlineplus_topic_links()
 
-    for i, (url, title) in enumerate(topics):
-        print(f"  [{i+1}/{len(topics)}] {title}...", flush=True)
-
-        content = scrape_medlineplus_topic(url, title)
-        if not content:
-            continue
+    def fetch(job):
+        i, (url, title, lastmod) = job
+        print(f"  [{i+1}/{len(topics)}] {title or url}...", flush=True)
+        # Every region lives inside <main>, so stop downloading once it closes
+        return fetch_url(url, stop_after=('main',), lastmod=lastmod)
 
-        chunks = chunk_text(content)
+    def write(job, result):
+        i, (url, _, _) = job
+        if not result:
+            return
+        title, chunks = result
 
-        for j, chunk in enumerate(chunks):
+        for j, (section, chunk) in enumerate(chunks):
             entry_id = f"medlineplus_{i+1:04d}"
             if len(chunks) > 1:
                 entry_id += f"_{j+1}"
@@ -288,9 +263,12 @@ def scrape_medlineplus_topics() -> list[RagEntry]:
                 license="Public Domain",
                 date_accessed=TODAY,
                 text_chunk=chunk,
-                category="condition"
+                category="condition",
+                section=section
             ))
 
+    pipeline.run('MedlinePlus', enumerate(topics), fetch, parse_medlineplus_topic, write)
+
     print(f"\n  Total MedlinePlus entries: {len(entries)}", flush=True)
     return entries
 
@@ -353,44 +331,65 @@ ODS_FACTSHEETS = [
 ]
 
 
-def scrape_ods_factsheet(url_name: str, title: str) -> Optional[str]:
-    """Scrape content from an NIH ODS fact sheet."""
-    url = f"https://ods.od.nih.gov/factsheets/{url_name}-Consumer/"
-    html = fetch_url(url)
-    if not html:
-        return None
+ODS_SITEMAP = "https://ods.od.nih.gov/sitemap.xml"
+ODS_PAGES = sitemap.PathRules(include=r'/factsheets/([A-Za-z0-9]+)-Consumer/?')
 
-    content = ""
 
-    # Look for main content
-    main_patterns = [
-        r'<main[^>]*>(.*?)</main>',
-        r'<article[^>]*>(.*?)</article>',
-        r'<div[^>]*class="[^"]*main-content[^"]*"[^>]*>(.*?)</div>',
-        r'<div[^>]*id="main-content"[^>]*>(.*?)</div>',
-    ]
+def get_ods_factsheets() -> list[tuple[str, str, Optional[float]]]:
+    """Curated fact sheets, then any other consumer fact sheet listed in the
+    ODS sitemap, as (url_name, title, lastmod)."""
+    print("Fetching NIH ODS sitemap...", flush=True)
+
+    pages = sitemap.discover('NIH ODS', ODS_SITEMAP, ODS_PAGES,
+                             headers={'User-Agent': USER_AGENT},
+                             pace=crawl_engine.pacer(REQUEST_DELAY, wait=False))
+    discovered = {page.slug: page.lastmod for page in pages}
+
+    factsheets = [(url_name, title, discovered.pop(url_name, None))
+                  for url_name, title in ODS_FACTSHEETS]
+    factsheets += [(url_name, sitemap.slug_title(url_name), lastmod)
+                   for url_name, lastmod in discovered.items()]
+    if discovered:
+        print(f"  {len(discovered)} fact sheets not in the curated list", flush=True)
+    return factsheets[:MAX_ENTRIES_PER_SOURCE]
+
+
+ODS_REGIONS = [
+    Selector('main'),
+    Selector('article'),
+    Selector('div', class_contains='main-content'),
+    Selector('div', id='main-content'),
+]
+
+
+ODS_BOILERPLATE = [
+    r'Printer friendly version.*',
+    r'For more information.*',
+    r'This fact sheet.*Office of Dietary Supplements.*',
+    r'Disclaimers.*',
+]
 
-    for pattern in main_patterns:
-        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
-        if match:
-            extracted = extract_text(match.group(1))
-            if len(extracted) > len(content):
-                content = extracted
 
-    # Clean up
-    content = re.sub(r'\s+', ' ', content).strip()
+def ods_url(url_name: str) -> str:
+    return f"https://ods.od.nih.gov/factsheets/{url_name}-Consumer/"
+
+
+def parse_ods_factsheet(job: tuple, html: str) -> Optional[list[tuple[str, str]]]:
+    """Parse stage: (section, chunk) pairs of a fetched NIH ODS fact sheet."""
+    _, (url_name, _, _) = job
+    url = ods_url(url_name)
+
+    # Look for main content
+    sections = page_guard.extract_sections(
+        'NIH ODS', url, html,
+        lambda page, budget: longest_region(extract_regions(page, ODS_REGIONS, budget=budget)))
 
     # Remove boilerplate
-    boilerplate = [
-        r'Printer friendly version.*',
-        r'For more information.*',
-        r'This fact sheet.*Office of Dietary Supplements.*',
-        r'Disclaimers.*',
-    ]
-    for pattern in boilerplate:
-        content = re.sub(pattern, '', content, flags=re.IGNORECASE)
+    sections = boilerplate.trimmer('NIH ODS', ODS_BOILERPLATE).trim_sections(sections)
 
-    return content if len(content) > 50 else None
+    if section_chars(sections) <= 50:
+        return None
+    return chunk_sections(sections, chunk_text, MAX_CHUNK_SIZE)
 
 
 def scrape_ods_factsheets() -> list[RagEntry]:
@@ -400,15 +399,17 @@ def scrape_ods_factsheets() -> list[RagEntry]:
     print("="*60, flush=True)
 
     entries = []
+    factsheets = get_ods_factsheets()
 
-    for i, (url_name, title) in enumerate(ODS_FACTSHEETS):
-        print(f"  [{i+1}/{len(ODS_FACTSHEETS)}] {title}...", flush=True)
-
-        content = scrape_ods_factsheet(url_name, title)
-        if not content:
-            continue
+    def fetch(job):
+        i, (url_name, title, lastmod) = job
+        print(f"  [{i+1}/{len(factsheets)}] {title}...", flush=True)
+        return fetch_url(ods_url(url_name), lastmod=lastmod)
 
-        chunks = chunk_text(content)
+    def write(job, chunks):
+        i, (url_name, title, _) = job
+        if not chunks:
+            return
 
         # Determine category
         if any(x in title.lower() for x in ['vitamin', 'mineral', 'calcium', 'iron', 'zinc', 'magnesium', 'potassium']):
@@ -416,23 +417,25 @@ def scrape_ods_factsheets() -> list[RagEntry]:
         else:
             category = "natural_remedy"
 
-        for j, chunk in enumerate(chunks):
+        for j, (section, chunk) in enumerate(chunks):
             entry_id = f"nih_ods_{i+1:04d}"
             if len(chunks) > 1:
                 entry_id += f"_{j+1}"
 
-            url = f"https://ods.od.nih.gov/factsheets/{url_name}-Consumer/"
             entries.append(RagEntry(
                 id=entry_id,
                 title=title,
                 source_name="NIH Office of Dietary Supplements",
-                url=url,
+                url=ods_url(url_name),
                 license="Public Domain",
                 date_accessed=TODAY,
                 text_chunk=chunk,
-                category=category
+                category=category,
+                section=section
             ))
 
+    pipeline.run('NIH ODS', enumerate(factsheets), fetch, parse_ods_factsheet, write)
+
     print(f"\n  Total NIH ODS entries: {len(entries)}", flush=True)
     return entries
 
@@ -441,8 +444,13 @@ def scrape_ods_factsheets() -> list[RagEntry]:
 # CDC Health Topics Scraper
 # ============================================================================
 
-def get_cdc_topics() -> list[tuple[str, str, str]]:
-    """Get CDC health topics from their JSON API."""
+CDC_SITEMAP = "https://www.cdc.gov/sitemap.xml"
+CDC_SKIP = ('/media/', '/images/', '.pdf', '.zip', '/forms/', '/data/')  # not content pages
+
+
+def get_cdc_topics() -> list[tuple[str, str, str, Optional[float]]]:
+    """Get CDC health topics from their JSON API as (url, title, category,
+    lastmod)."""
     print("Fetching CDC topics from API...", flush=True)
 
     topics = []
@@ -471,7 +479,7 @@ def get_cdc_topics() -> list[tuple[str, str, str]]:
 
         if url and title and url not in seen_urls:
             # Skip non-content URLs
-            if any(x in url for x in ['/media/', '/images/', '.pdf', '.zip', '/forms/', '/data/']):
+            if any(x in url for x in CDC_SKIP):
                 continue
             seen_urls.add(url)
 
@@ -486,49 +494,55 @@ def get_cdc_topics() -> list[tuple[str, str, str]]:
             topics.append((url, title, category))
 
     print(f"  Found {len(topics)} CDC topics", flush=True)
-    return topics[:MAX_ENTRIES_PER_SOURCE]
-
+    topics = topics[:MAX_ENTRIES_PER_SOURCE]
+
+    # The A-Z list decides which pages are topics; the sitemap only says
+    # when each one last changed, so only those pages are looked for
+    rules = sitemap.PathRules.listed((url for url, _, _ in topics), exclude=CDC_SKIP)
+    lastmods = sitemap.lastmods(sitemap.discover(
+        'CDC', CDC_SITEMAP, rules, headers={'User-Agent': USER_AGENT},
+        pace=crawl_engine.pacer(REQUEST_DELAY, wait=False)))
+    missing = sum(1 for url, _, _ in topics if url not in lastmods)
+    if missing:
+        print(f"  {missing} topics not in the sitemap will be fetched without a lastmod",
+              flush=True)
+    return [(url, title, category, lastmods.get(url)) for url, title, category in topics]
+
+
+CDC_REGIONS = [
+    Selector('main'),
+    Selector('article'),
+    Selector('div', class_contains='content'),
+    Selector('div', id='content'),
+    Selector('div', class_contains='cdc-main'),
+]
 
-def scrape_cdc_topic(url: str, title: str) -> Optional[str]:
-    """Scrape content from a CDC topic page."""
-    html = fetch_url(url)
-    if not html:
-        return None
 
-    content = ""
+CDC_BOILERPLATE = [
+    r'Centers for Disease Control and Prevention.*',
+    r'File Formats Help.*',
+    r'Page last reviewed.*',
+    r'Content source.*',
+    r'CDC 24/7.*',
+    r'Share Facebook Twitter.*',
+]
 
-    # Try main content areas
-    patterns = [
-        r'<main[^>]*>(.*?)</main>',
-        r'<article[^>]*>(.*?)</article>',
-        r'<div[^>]*class="[^"]*content[^"]*"[^>]*>(.*?)</div>',
-        r'<div[^>]*id="content"[^>]*>(.*?)</div>',
-        r'<div[^>]*class="[^"]*cdc-main[^"]*"[^>]*>(.*?)</div>',
-    ]
 
-    for pattern in patterns:
-        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
-        if match:
-            extracted = extract_text(match.group(1))
-            if len(extracted) > len(content):
-                content = extracted
+def parse_cdc_topic(job: tuple, html: str) -> Optional[list[tuple[str, str]]]:
+    """Parse stage: (section, chunk) pairs of a fetched CDC topic page."""
+    _, (url, _, _, _) = job
 
-    # Clean up
-    content = re.sub(r'\s+', ' ', content).strip()
+    # Try main content areas
+    sections = page_guard.extract_sections(
+        'CDC', url, html,
+        lambda page, budget: longest_region(extract_regions(page, CDC_REGIONS, budget=budget)))
 
     # Remove boilerplate
-    boilerplate = [
-        r'Centers for Disease Control and Prevention.*',
-        r'File Formats Help.*',
-        r'Page last reviewed.*',
-        r'Content source.*',
-        r'CDC 24/7.*',
-        r'Share Facebook Twitter.*',
-    ]
-    for pattern in boilerplate:
-        content = re.sub(pattern, '', content, flags=re.IGNORECASE)
+    sections = boilerplate.trimmer('CDC', CDC_BOILERPLATE).trim_sections(sections)
 
-    return content if len(content) > 50 else None
+    if section_chars(sections) <= 50:
+        return None
+    return chunk_sections(sections, chunk_text, MAX_CHUNK_SIZE)
 
 
 def scrape_cdc_topics() -> list[RagEntry]:
@@ -540,16 +554,18 @@ def scrape_cdc_topics() -> list[RagEntry]:
     entries = []
     topics = get_cdc_topics()
 
-    for i, (url, title, category) in enumerate(topics):
+    def fetch(job):
+        i, (url, title, _, lastmod) = job
         print(f"  [{i+1}/{len(topics)}] {title}...", flush=True)
+        # All candidate regions are inside <main>; the footer after it is skipped
+        return fetch_url(url, stop_after=('main',), lastmod=lastmod)
 
-        content = scrape_cdc_topic(url, title)
-        if not content:
-            continue
-
-        chunks = chunk_text(content)
+    def write(job, chunks):
+        i, (url, title, category, _) = job
+        if not chunks:
+            return
 
-        for j, chunk in enumerate(chunks):
+        for j, (section, chunk) in enumerate(chunks):
             entry_id = f"cdc_{i+1:04d}"
             if len(chunks) > 1:
                 entry_id += f"_{j+1}"
@@ -562,9 +578,12 @@ def scrape_cdc_topics() -> list[RagEntry]:
                 license="Public Domain",
                 date_accessed=TODAY,
                 text_chunk=chunk,
-                category=category
+                category=category,
+                section=section
             ))
 
+    pipeline.run('CDC', enumerate(topics), fetch, parse_cdc_topic, write)
+
     print(f"\n  Total CDC entries: {len(entries)}", flush=True)
     return entries
 
@@ -581,7 +600,7 @@ def write_csv(entries: list[RagEntry], output_path: str):
         # Header
         writer.writerow([
             'id', 'title', 'source_name', 'url', 'license',
-            'date_accessed', 'text_chunk', 'category'
+            'date_accessed', 'text_chunk', 'category', 'section'
         ])
 
         # Data rows
@@ -594,7 +613,8 @@ def write_csv(entries: list[RagEntry], output_path: str):
                 entry.license,
                 entry.date_accessed,
                 entry.text_chunk,
-                entry.category
+                entry.category,
+                entry.section
             ])
 
 
@@ -604,30 +624,26 @@ def main():
     print("HeyDoc Medical Knowledge Base Scraper", flush=True)
     print("="*60, flush=True)
     print(f"Date: {TODAY}", flush=True)
-    print(f"Request delay: {REQUEST_DELAY}s between requests", flush=True)
+    print(f"Request delay: {REQUEST_DELAY}s between requests (per host)", flush=True)
     print(f"Max entries per source: {MAX_ENTRIES_PER_SOURCE}", flush=True)
     print("="*60, flush=True)
 
     all_entries = []
 
-    # Scrape each source
-    try:
-        medlineplus_entries = scrape_medlineplus_topics()
-        all_entries.extend(medlineplus_entries)
-    except Exception as e:
-        print(f"Error scraping MedlinePlus: {e}", flush=True)
-
-    try:
-        ods_entries = scrape_ods_factsheets()
-        all_entries.extend(ods_entries)
-    except Exception as e:
-        print(f"Error scraping NIH ODS: {e}", flush=True)
+    # Scrape each source concurrently - they are on different hosts, and
+    # each host keeps its own REQUEST_DELAY spacing
+    sources = [
+        ("MedlinePlus", scrape_medlineplus_topics),
+        ("NIH ODS", scrape_ods_factsheets),
+        ("CDC", scrape_cdc_topics),
+    ]
+    results = crawl_engine.run_sources([scrape for _, scrape in sources])
 
-    try:
-        cdc_entries = scrape_cdc_topics()
-        all_entries.extend(cdc_entries)
-    except Exception as e:
-        print(f"Error scraping CDC: {e}", flush=True)
+    for (name, _), result in zip(sources, results):
+        if isinstance(result, Exception):
+            print(f"Error scraping {name}: {result}", flush=True)
+        else:
+            all_entries.extend(result)
 
     # Summary
     print("\n" + "="*60, flush=True)
@@ -659,6 +675,13 @@ def main():
 
     write_csv(all_entries, output_path)
     print(f"\nOutput written to: {output_path}", flush=True)
+    http_client.print_stats()
+    sitemap.print_stats()
+    pipeline.print_stats()
+    boilerplate.print_stats()
+    page_guard.print_stats()
+    fetch_metrics.write_summary(output_path, total=len(all_entries),
+                                by_source=by_source, by_category=by_category)
 
     return all_entries
 
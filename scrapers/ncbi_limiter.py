@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+NCBI E-utilities Rate Limiter
+One request budget for eutils.ncbi.nlm.nih.gov shared by every process.
+
+NCBI allows 3 requests/second per client without an API key and 10 with
+one. pubmed_api.py and pmc_reviews.py each used to sleep a fixed 0.35 s,
+so running both at once broke the limit while a configured key left most
+of the allowance unused.
+
+The limiter keeps its schedule in a small state file guarded by an
+exclusive file lock, so all processes on the machine draw from the same
+budget. Setting NCBI_API_KEY raises the rate to 10 req/s (and adds the
+key to requests via with_api_key). A 429 from NCBI halves the rate; the
+slowdown decays back to the full rate over a few minutes.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - fall back to an in-process lock only
+    fcntl = None
+
+# Configuration
+API_KEY = os.environ.get('NCBI_API_KEY', '').strip()
+RATE_WITHOUT_KEY = 3.0  # requests/second
+RATE_WITH_KEY = 10.0  # requests/second
+SAFETY_MARGIN = 0.95  # stay just under the published limit
+MAX_SLOWDOWN = 16.0  # never slow down by more than this factor
+SLOWDOWN_HALF_LIFE = 60.0  # seconds for a 429 slowdown to halve
+STATE_PATH = os.environ.get(
+    'NCBI_LIMITER_STATE',
+    os.path.join(tempfile.gettempdir(), 'heydoc_ncbi_eutils.json'),
+)
+
+
+def requests_per_second() -> float:
+    """Nominal request rate for this client (before any 429 slowdown)."""
+    rate = RATE_WITH_KEY if API_KEY else RATE_WITHOUT_KEY
+    return rate * SAFETY_MARGIN
+
+
+def with_api_key(params: dict) -> dict:
+    """Return E-utilities query params with api_key added when configured."""
+    if API_KEY:
+        params = dict(params, api_key=API_KEY)
+    return params
+
+
+class SharedRateLimiter:
+    """Token bucket (burst of one) whose state lives in a locked file."""
+
+    def __init__(self, path: str = STATE_PATH, rate: Optional[float] = None):
+        self.path = path
+        self.rate = rate or requests_per_second()
+        self._thread_lock = threading.Lock()
+        self.waited = 0.0  # seconds this process spent waiting for slots
+        self.throttle_events = 0
+
+    def _update(self, update) -> dict:
+        """Apply update(state, now) under the cross-process lock."""
+        with self._thread_lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = b''
+                while True:
+                    chunk = os.read(fd, 4096)
+                    if not chunk:
+                        break
+                    raw += chunk
+                try:
+                    state = json.loads(raw) if raw else {}
+                except ValueError:
+                    state = {}
+
+                update(state, time.time())
+
+                data = json.dumps(state).encode('utf-8')
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, data)
+                return state
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    @staticmethod
+    def _slowdown(state: dict, now: float) -> float:
+        factor = state.get('slowdown', 1.0)
+        elapsed = now - state.get('throttled_at', now)
+        return max(1.0, factor * 0.5 ** (elapsed / SLOWDOWN_HALF_LIFE))
+
+    def reserve(self) -> float:
+        """Book the next shared slot and return seconds until it opens."""
+        result = {}
+
+        def book(state, now):
+            interval = self._slowdown(state, now) / self.rate
+            slot = max(now, state.get('next_slot', now))
+            state['next_slot'] = slot + interval
+            result['wait'] = slot - now
+
+        self._update(book)
+        return result['wait']
+
+    def acquire(self):
+        """Block until this process may send its next E-utilities request."""
+        wait_time = self.reserve()
+        if wait_time > 0:
+            self.waited += wait_time
+            time.sleep(wait_time)
+
+    def throttled(self):
+        """Record a 429 from NCBI: halve the shared rate for a while."""
+        self.throttle_events += 1
+
+        def slow_down(state, now):
+            factor = min(MAX_SLOWDOWN, self._slowdown(state, now) * 2)
+            state['slowdown'] = factor
+            state['throttled_at'] = now
+            # Push the schedule back so queued callers also feel the slowdown
+            state['next_slot'] = max(state.get('next_slot', now), now) + factor / self.rate
+
+        self._update(slow_down)
+
+
+class _Pacer:
+    """pace callback for http_client.fetch backed by the shared limiter."""
+
+    def __init__(self, limiter: SharedRateLimiter):
+        self.limiter = limiter
+
+    def __call__(self, url: str):
+        self.limiter.acquire()
+
+    def throttled(self, url: str):
+        self.limiter.throttled()
+
+
+# Shared limiter for this process
+_LIMITER = SharedRateLimiter()
+pace = _Pacer(_LIMITER)
+
+
+def get_limiter() -> SharedRateLimiter:
+    """Return this process's handle on the shared limiter."""
+    return _LIMITER
+
+
+def print_stats():
+    """Print the rate in use and time spent waiting on the shared budget."""
+    tier = "API key" if API_KEY else "no API key"
+    print(f"\nNCBI E-utilities: {requests_per_second():.1f} req/s shared ({tier}), "
+          f"{_LIMITER.waited:.1f}s waiting, {_LIMITER.throttle_events} x 429", flush=True)
@@ -13,15 +13,22 @@ License: Public Domain (U.S. Government)
 
 import csv
 import re
-import time
-import urllib.request
 import urllib.error
 import sys
 from datetime import date
-from html.parser import HTMLParser
 from typing import Optional
 from dataclasses import dataclass
 
+import boilerplate
+import crawl_engine
+import fetch_metrics
+import http_client
+import page_guard
+import pipeline
+import sitemap
+from html_text import (RegionWatcher, Selector, chunk_sections, extract_regions, longest_region,
+                       section_chars)
+
 # Configuration
 REQUEST_DELAY = 2.5  # slightly longer delay for politeness
 MAX_CHUNK_SIZE = 2000
@@ -43,60 +50,23 @@ class RagEntry:
     date_accessed: str
     text_chunk: str
     category: str
+    section: str = ""  # heading path of the chunk within its page
 
 
-class TextExtractor(HTMLParser):
-    """Extract clean text from HTML, preserving some structure."""
-
-    def __init__(self):
-        super().__init__()
-        self.text_parts = []
-        self.skip_tags = {'script', 'style', 'nav', 'header', 'footer', 'aside', 'noscript'}
-        self.current_skip = 0
-
-    def handle_starttag(self, tag, attrs):
-        if tag in self.skip_tags:
-            self.current_skip += 1
-        if tag in ('p', 'li', 'h1', 'h2', 'h3', 'h4', 'br', 'div'):
-            self.text_parts.append(' ')
-
-    def handle_endtag(self, tag):
-        if tag in self.skip_tags:
-            self.current_skip = max(0, self.current_skip - 1)
-        if tag in ('p', 'li', 'h1', 'h2', 'h3', 'h4'):
-            self.text_parts.append(' ')
-
-    def handle_data(self, data):
-        if self.current_skip == 0:
-            self.text_parts.append(data)
-
-    def get_text(self) -> str:
-        text = ' '.join(self.text_parts)
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
-
-
-def extract_text(html: str) -> str:
-    """Extract clean text from HTML."""
-    parser = TextExtractor()
-    try:
-        parser.feed(html)
-    except Exception:
-        pass
-    return parser.get_text()
-
-
-def fetch_url(url: str, delay: bool = True) -> Optional[str]:
-    """Fetch URL content with polite delay."""
-    if delay:
-        time.sleep(REQUEST_DELAY)
+def fetch_url(url: str, delay: bool = True, stop_after: Optional[tuple] = None,
+              lastmod: Optional[float] = None) -> Optional[str]:
+    """Fetch URL content with polite delay.
 
+    With stop_after (e.g. ('main',)) the page is parsed while it downloads
+    and reading stops once that element has closed. With lastmod (from the
+    sitemap) a cached copy newer than that is used without a request.
+    """
     headers = {'User-Agent': USER_AGENT}
-    req = urllib.request.Request(url, headers=headers)
-
+    stop_when = RegionWatcher(stop_after) if stop_after else None
     try:
-        with urllib.request.urlopen(req, timeout=30) as response:
-            return response.read().decode('utf-8', errors='ignore')
+        return http_client.fetch_text(url, headers=headers, timeout=30,
+                                      pace=crawl_engine.pacer(REQUEST_DELAY, wait=delay),
+                                      stop_when=stop_when, lastmod=lastmod)
     except urllib.error.HTTPError as e:
         print(f"  HTTP Error {e.code} fetching {url}", flush=True)
         return None
@@ -202,12 +172,31 @@ ADDITIONAL_HERBS = [
 ALL_NCCIH_HERBS = PRIORITY_HERBS + ADDITIONAL_HERBS
 
 
-def get_herb_links_from_index() -> list[tuple[str, str]]:
+NCCIH_SITEMAP = "https://www.nccih.nih.gov/sitemap.xml"
+
+# Herb fact sheets share /health/ with every other topic, so the index page
+# still decides which pages are herbs; the sitemap says when each changed
+NCCIH_PAGES = sitemap.PathRules(include=r'/health/([a-z0-9-]+)')
+
+
+def get_herb_links() -> list[tuple[str, str, Optional[float]]]:
+    """Herbs to scrape as (slug, title, lastmod), lastmod from the sitemap."""
+    print("Fetching NCCIH sitemap...", flush=True)
+    pages = sitemap.discover('NCCIH', NCCIH_SITEMAP, NCCIH_PAGES,
+                             headers={'User-Agent': USER_AGENT},
+                             pace=crawl_engine.pacer(REQUEST_DELAY, wait=False))
+    lastmods = {page.slug: page.lastmod for page in pages}
+
+    herbs = get_herb_links_from_index(lastmods.get('herbsataglance'))
+    return [(slug, title, lastmods.get(slug)) for slug, title in herbs]
+
+
+def get_herb_links_from_index(lastmod: Optional[float] = None) -> list[tuple[str, str]]:
     """Scrape the herbs-at-a-glance index to get all herb links."""
     print("Fetching NCCIH Herbs at a Glance index...", flush=True)
 
     index_url = "https://www.nccih.nih.gov/health/herbsataglance"
-    html = fetch_url(index_url, delay=False)
+    html = fetch_url(index_url, delay=False, lastmod=lastmod)
 
     if not html:
         print("  Failed to fetch index, using predefined list", flush=True)
@@ -246,72 +235,69 @@ def get_herb_links_from_index() -> list[tuple[str, str]]:
     return herbs
 
 
-def scrape_nccih_herb(slug: str, title: str) -> Optional[str]:
-    """Scrape content from an NCCIH herb fact sheet."""
-    url = f"https://www.nccih.nih.gov/health/{slug}"
-    html = fetch_url(url)
+NCCIH_BOILERPLATE = [
+    r'National Center for Complementary and Integrative Health.*?(?=\s[A-Z])',
+    r'NCCIH Clearinghouse.*',
+    r'This publication is not copyrighted.*',
+    r'Last Updated.*',
+    r'Skip to main content.*',
+    r'An official website of.*',
+    r'Menu.*?(?=\s[A-Z][a-z])',
+    r'Search.*?(?=\s[A-Z][a-z])',
+    r'Share this page.*',
+    r'Print this page.*',
+    r'Email Updates.*',
+    r'Follow us on.*',
+    r'More information.*',
+    r'References.*',
+    r'Disclaimers.*',
+]
 
-    if not html:
-        return None
 
-    content = ""
+HERB_REGIONS = [
+    Selector('main'),
+    Selector('article'),
+    Selector('div', class_contains='main-content'),
+    Selector('div', id='main'),
+    Selector('div', class_contains='field--name-body'),
+    Selector('body'),
+]
+
+
+def herb_text(html: str, budget: Optional[page_guard.PageBudget] = None) -> str:
+    """Longest main content region of a fact sheet, else the whole body."""
+    regions = extract_regions(html, HERB_REGIONS, budget=budget)
 
     # NCCIH pages have specific structure - look for main content
-    main_patterns = [
-        r'<main[^>]*>(.*?)</main>',
-        r'<article[^>]*>(.*?)</article>',
-        r'<div[^>]*class="[^"]*main-content[^"]*"[^>]*>(.*?)</div>',
-        r'<div[^>]*id="main"[^>]*>(.*?)</div>',
-        r'<div[^>]*class="[^"]*field--name-body[^"]*"[^>]*>(.*?)</div>',
-    ]
-
-    for pattern in main_patterns:
-        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
-        if match:
-            extracted = extract_text(match.group(1))
-            if len(extracted) > len(content):
-                content = extracted
+    content = longest_region(regions[:-1])
 
     # If still no content, try broader extraction
     if not content or len(content) < 100:
-        # Look for content between specific markers
-        body_match = re.search(r'<body[^>]*>(.*?)</body>', html, re.DOTALL | re.IGNORECASE)
-        if body_match:
-            content = extract_text(body_match.group(1))
+        if regions[-1] is not None:
+            content = regions[-1]
+
+    return content
+
+
+def herb_url(slug: str) -> str:
+    return f"https://www.nccih.nih.gov/health/{slug}"
+
 
-    # Clean up whitespace
-    content = re.sub(r'\s+', ' ', content).strip()
+def parse_nccih_herb(job: tuple, html: str) -> Optional[tuple[int, list[tuple[str, str]]]]:
+    """Parse stage: content length and (section, chunk) pairs of a fetched
+    NCCIH herb fact sheet."""
+    _, (slug, _, _) = job
+    sections = page_guard.extract_sections('NCCIH', herb_url(slug), html, herb_text)
 
     # Remove boilerplate phrases
-    boilerplate = [
-        r'National Center for Complementary and Integrative Health.*?(?=\s[A-Z])',
-        r'NCCIH Clearinghouse.*',
-        r'This publication is not copyrighted.*',
-        r'Last Updated.*',
-        r'Skip to main content.*',
-        r'An official website of.*',
-        r'Menu.*?(?=\s[A-Z][a-z])',
-        r'Search.*?(?=\s[A-Z][a-z])',
-        r'Share this page.*',
-        r'Print this page.*',
-        r'Email Updates.*',
-        r'Follow us on.*',
-        r'More information.*',
-        r'References.*',
-        r'Disclaimers.*',
-    ]
-
-    for pattern in boilerplate:
-        content = re.sub(pattern, '', content, flags=re.IGNORECASE)
-
-    # Final cleanup
-    content = re.sub(r'\s+', ' ', content).strip()
+    sections = boilerplate.trimmer('NCCIH', NCCIH_BOILERPLATE).trim_sections(sections)
 
     # Ensure we have meaningful content
-    if len(content) < 100:
+    chars = section_chars(sections)
+    if chars < 100:
         return None
 
-    return content
+    return chars, chunk_sections(sections, chunk_text, MAX_CHUNK_SIZE)
 
 
 def scrape_nccih_herbs() -> list[RagEntry]:
@@ -321,41 +307,48 @@ def scrape_nccih_herbs() -> list[RagEntry]:
     print("="*60, flush=True)
 
     entries = []
-    herbs = get_herb_links_from_index()
+    herbs = get_herb_links()
 
     successful = 0
     failed = 0
 
-    for i, (slug, title) in enumerate(herbs):
+    def fetch(job):
+        i, (slug, title, lastmod) = job
         print(f"  [{i+1}/{len(herbs)}] {title}...", flush=True)
-
-        content = scrape_nccih_herb(slug, title)
-        if not content:
-            print(f"    -> Failed or no content", flush=True)
+        # The fact sheet body is inside <main>; skip the long footer after it
+        return fetch_url(herb_url(slug), stop_after=('main',), lastmod=lastmod)
+
+    def write(job, result):
+        nonlocal successful, failed
+        i, (slug, title, _) = job
+        if not result:
+            print(f"    -> {title}: failed or no content", flush=True)
             failed += 1
-            continue
+            return
 
         successful += 1
-        chunks = chunk_text(content)
-        print(f"    -> {len(content)} chars, {len(chunks)} chunk(s)", flush=True)
+        chars, chunks = result
+        print(f"    -> {title}: {chars} chars, {len(chunks)} chunk(s)", flush=True)
 
-        for j, chunk in enumerate(chunks):
+        for j, (section, chunk) in enumerate(chunks):
             entry_id = f"nccih_{i+1:04d}"
             if len(chunks) > 1:
                 entry_id += f"_{j+1}"
 
-            url = f"https://www.nccih.nih.gov/health/{slug}"
             entries.append(RagEntry(
                 id=entry_id,
                 title=title,
                 source_name="NCCIH (NIH)",
-                url=url,
+                url=herb_url(slug),
                 license="Public Domain",
                 date_accessed=TODAY,
                 text_chunk=chunk,
-                category="natural_remedy"
+                category="natural_remedy",
+                section=section
             ))
 
+    pipeline.run('NCCIH', enumerate(herbs), fetch, parse_nccih_herb, write)
+
     print(f"\n  Successful: {successful}, Failed: {failed}", flush=True)
     print(f"  Total NCCIH entries: {len(entries)}", flush=True)
     return entries
@@ -369,7 +362,7 @@ def write_csv(entries: list[RagEntry], output_path: str):
         # Header
         writer.writerow([
             'id', 'title', 'source_name', 'url', 'license',
-            'date_accessed', 'text_chunk', 'category'
+            'date_accessed', 'text_chunk', 'category', 'section'
         ])
 
         # Data rows
@@ -382,7 +375,8 @@ def write_csv(entries: list[RagEntry], output_path: str):
                 entry.license,
                 entry.date_accessed,
                 entry.text_chunk,
-                entry.category
+                entry.category,
+                entry.section
             ])
 
 
@@ -410,6 +404,12 @@ def main():
 
     write_csv(entries, output_path)
     print(f"\nOutput written to: {output_path}", flush=True)
+    http_client.print_stats()
+    sitemap.print_stats()
+    pipeline.print_stats()
+    boilerplate.print_stats()
+    page_guard.print_stats()
+    fetch_metrics.write_summary(output_path, total=len(entries))
 
     return entries
 
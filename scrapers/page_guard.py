@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Page Guard
+Size cap and CPU budget for the extraction stage of the HTML scrapers.
+
+The extractors are linear-time scans (html_text.extract_regions,
+section_after, boilerplate.Trimmer), but one malformed or enormous page
+should still not be able to stall a sequential crawl. Each page's
+extraction runs through extract():
+
+  - a page over MAX_PAGE_CHARS (after pre-stripping) is not given to the
+    extractor at all;
+  - otherwise the extractor gets a PageBudget of PAGE_CPU_BUDGET seconds
+    of thread CPU time, which the region scanner checks as it goes;
+
+and in both cases the page degrades to main_text(), the text of its
+<main> element taken with a single tag-stripping pass. print_stats()
+shows how often that happened per source, and the slowest page.
+
+A page that was extracted normally is then classified from the
+RegionFeatures the region scan counted. Navigation hubs and index pages
+(e.g. MedlinePlus "Drugs & Supplements": mostly short link labels in
+lists) come back as "", so the scraper drops them before chunking, and
+the chunks and embedding tokens they would have cost are counted. This
+happens once the page has been fetched (up to the end of the region the
+scraper reads) and scanned: what is saved is the chunking and embedding,
+not the download.
+
+bench_guard.py feeds adversarial HTML through every scraper's extractor
+and checks the time bound.
+"""
+
+import html
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from html_text import RegionFeatures, RegionTexts, Section
+
+# Configuration
+MAX_PAGE_CHARS = 2_000_000  # larger pages go straight to the <main> fallback
+PAGE_CPU_BUDGET = 2.0  # seconds of CPU per page for extraction
+MAX_FALLBACK_CHARS = 200_000  # markup of <main> read by the fallback
+
+# Hub pages: at least HUB_MIN_LINKS links, and either most of the text is
+# link labels, or much of it is and it comes in short runs or list items
+# (links with a blurb each). A plain bulleted list without links is content.
+HUB_MIN_LINKS = 5
+HUB_LINK_DENSITY = 0.5
+HUB_LINK_LIST_DENSITY = 0.3
+HUB_LINK_LIST_RUN = 60  # average characters per text run
+HUB_LIST_RATIO = 0.6
+
+CHUNK_CHARS = 2000  # the scrapers' MAX_CHUNK_SIZE, for the chunks-avoided estimate
+CHARS_PER_TOKEN = 4  # rough English average for embedding models
+
+_MAIN_START = re.compile(r'<main\b', re.IGNORECASE)
+_MAIN_END = re.compile(r'</main\s*>', re.IGNORECASE)
+# [^<>] rather than [^>]: a '<' with no '>' after it costs a scan to the
+# next '<' instead of to the end of the page
+_TAG = re.compile(r'<[^<>]*>')
+
+
+class BudgetExceeded(Exception):
+    """A page used up its extraction CPU budget."""
+
+
+class PageBudget:
+    """CPU time allowed for extracting one page (measured per thread).
+
+    Region scans also hand it the regions they found (note), so extract()
+    can look at the structure of the text the extractor returned.
+    """
+
+    def __init__(self, seconds: float = PAGE_CPU_BUDGET):
+        self.seconds = seconds
+        self.started = time.thread_time()
+        self.regions: list[RegionTexts] = []
+
+    def used(self) -> float:
+        return time.thread_time() - self.started
+
+    def check(self):
+        """Raise BudgetExceeded once the budget is used up."""
+        if self.used() > self.seconds:
+            raise BudgetExceeded(f"extraction took over {self.seconds:.1f}s of CPU")
+
+    def note(self, regions: RegionTexts):
+        self.regions.append(regions)
+
+    def features_within(self, content: str) -> Optional[RegionFeatures]:
+        """Structure of the longest scanned region that is part of content."""
+        best = None
+        for regions in self.regions:
+            features = regions.features_within(content)
+            if features is not None and (best is None or features.chars > best.chars):
+                best = features
+        return best
+
+    def sections_of(self, content: str) -> Optional[list[Section]]:
+        """Sections of the scanned region whose text is content, if any."""
+        for regions in self.regions:
+            sections = regions.sections_of(content)
+            if sections is not None:
+                return sections
+        return None
+
+
+def hub_reason(features: RegionFeatures) -> Optional[str]:
+    """Why a region looks like a navigation hub or index, or None if it
+    reads like an article."""
+    if features.links < HUB_MIN_LINKS:
+        return None
+    if features.link_density >= HUB_LINK_DENSITY:
+        return 'links'
+    if features.link_density < HUB_LINK_LIST_DENSITY:
+        return None
+    if features.avg_run < HUB_LINK_LIST_RUN:
+        return 'short runs'
+    if features.list_ratio >= HUB_LIST_RATIO:
+        return 'link list'
+    return None
+
+
+def main_text(page: str) -> str:
+    """Text of the page's <main> element (or of the whole page if it has
+    none), in one pass and without parsing - the degraded fallback."""
+    start = _MAIN_START.search(page)
+    if start is None:
+        markup = page[:MAX_FALLBACK_CHARS]
+    else:
+        body = page.find('>', start.end())
+        body = len(page) if body < 0 else body + 1
+        end = _MAIN_END.search(page, body, body + MAX_FALLBACK_CHARS)
+        markup = page[body:end.start() if end else body + MAX_FALLBACK_CHARS]
+    return ' '.join(html.unescape(_TAG.sub(' ', markup)).split())
+
+
+@dataclass
+class GuardStats:
+    """Extraction outcomes for one source."""
+    pages: int = 0
+    oversized: int = 0
+    over_budget: int = 0
+    seconds: float = 0.0  # CPU time spent extracting
+    slowest: float = 0.0
+    slowest_url: str = ''
+    hubs: int = 0  # hub / index pages dropped
+    hub_chunks: int = 0  # chunks they would have produced
+    hub_chars: int = 0
+
+
+_STATS: dict[str, GuardStats] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def _record(source: str, url: str, outcome: Optional[str], seconds: float, dropped: str = ''):
+    with _STATS_LOCK:
+        s = _STATS.setdefault(source, GuardStats())
+        s.pages += 1
+        s.seconds += seconds
+        if outcome == 'oversized':
+            s.oversized += 1
+        elif outcome == 'over_budget':
+            s.over_budget += 1
+        elif outcome == 'hub':
+            s.hubs += 1
+            s.hub_chunks += -(-len(dropped) // CHUNK_CHARS)
+            s.hub_chars += len(dropped)
+        if seconds > s.slowest:
+            s.slowest = seconds
+            s.slowest_url = url
+
+
+def extract(source: str, url: str, page: str,
+            extractor: Callable[[str, PageBudget], str],
+            fallback: Callable[[str], str] = main_text) -> str:
+    """Run extractor(page, budget) under the size cap and CPU budget,
+    returning fallback(page) instead if either is exceeded, and "" if the
+    extracted text is a hub page (see hub_reason)."""
+    return _extract(source, url, page, extractor, fallback)[0]
+
+
+def extract_sections(source: str, url: str, page: str,
+                     extractor: Callable[[str, PageBudget], str],
+                     fallback: Callable[[str], str] = main_text) -> list[Section]:
+    """extract(), split into the heading Sections of the region the text
+    came from. Text that is not a single region's (joined from several,
+    or the fallback) is one Section without a heading."""
+    content, budget = _extract(source, url, page, extractor, fallback)
+    if not content:
+        return []
+    sections = budget.sections_of(content) if budget is not None else None
+    return sections or [Section((), content)]
+
+
+def _extract(source: str, url: str, page: str, extractor: Callable[[str, PageBudget], str],
+             fallback: Callable[[str], str]) -> tuple[str, Optional[PageBudget]]:
+    """The extracted text, and the budget its regions were noted on (None
+    if the text is the fallback's)."""
+    budget = PageBudget()
+    if len(page) > MAX_PAGE_CHARS:
+        content = fallback(page)
+        _record(source, url, 'oversized', budget.used())
+        return content, None
+
+    try:
+        content = extractor(page, budget)
+    except BudgetExceeded:
+        content = fallback(page)
+        _record(source, url, 'over_budget', budget.used())
+        return content, None
+
+    features = budget.features_within(content) if content else None
+    reason = hub_reason(features) if features is not None else None
+    if reason:
+        print(f"  Dropped hub page ({reason}): {url}", flush=True)
+        _record(source, url, 'hub', budget.used(), dropped=content)
+        return "", None
+    _record(source, url, None, budget.used())
+    return content, budget
+
+
+def stats() -> dict[str, GuardStats]:
+    """Per-source outcomes (copy)."""
+    with _STATS_LOCK:
+        return {source: GuardStats(**vars(s)) for source, s in _STATS.items()}
+
+
+def take_stats() -> dict[str, GuardStats]:
+    """Per-source outcomes recorded since the last call, resetting them
+    (how pipeline workers hand their counters back)."""
+    global _STATS
+    with _STATS_LOCK:
+        taken, _STATS = _STATS, {}
+    return taken
+
+
+def merge_stats(per_source: dict[str, GuardStats]):
+    """Add outcomes recorded in another process."""
+    with _STATS_LOCK:
+        for source, other in per_source.items():
+            s = _STATS.setdefault(source, GuardStats())
+            s.pages += other.pages
+            s.oversized += other.oversized
+            s.over_budget += other.over_budget
+            s.seconds += other.seconds
+            s.hubs += other.hubs
+            s.hub_chunks += other.hub_chunks
+            s.hub_chars += other.hub_chars
+            if other.slowest > s.slowest:
+                s.slowest = other.slowest
+                s.slowest_url = other.slowest_url
+
+
+def print_stats():
+    """Print extraction time per source and pages that hit the guard."""
+    per_source = stats()
+    if not per_source:
+        return
+
+    print("\nExtraction:", flush=True)
+    for source, s in sorted(per_source.items()):
+        line = (f"  - {source}: {s.pages} pages, {s.seconds:.2f}s CPU, "
+                f"slowest {s.slowest * 1000:.0f} ms")
+        if s.oversized or s.over_budget:
+            line += (f", {s.oversized} over {MAX_PAGE_CHARS:,} chars and {s.over_budget} over "
+                     f"the {PAGE_CPU_BUDGET:.0f}s budget fell back to <main>")
+        print(line, flush=True)
+        if s.slowest_url and (s.oversized or s.over_budget):
+            print(f"      slowest page: {s.slowest_url}", flush=True)
+        if s.hubs:
+            print(f"      {s.hubs} hub/index pages dropped: {s.hub_chunks} chunks, "
+                  f"~{s.hub_chars // CHARS_PER_TOKEN:,} embedding tokens avoided", flush=True)
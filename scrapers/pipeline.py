@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Fetch / Parse / Write Pipeline
+Overlaps network I/O with CPU-bound parsing in worker processes.
+
+The scrapers used to fetch a page and then extract regions, strip
+boilerplate and chunk it inline on the same thread, so each page's
+parsing pushed back the next request. With several sources in one
+process, the GIL also kept their parsing from overlapping. A Pipeline
+splits that loop into stages:
+
+  fetch   fetcher thread(s) call fetch(job) and hand the raw body on
+  parse   a shared ProcessPoolExecutor runs parse(job, body)
+  write   the calling thread gets the results back in job order and calls
+          write(job, result); it is the only stage that touches the
+          scraper's output, so the output needs no locking
+
+At most QUEUE_SIZE bodies per pipeline are in the parse stage or waiting
+to be written. A fetcher that gets ahead blocks until the writer catches
+up (backpressure), so memory stays bounded. Each stage counts the time
+it was busy and the time it waited on its neighbour; print_stats() shows
+these counters and how much of the run overlapped.
+
+parse must be a module-level function, so that it can be pickled to a
+worker. page_guard and boilerplate counters recorded in the worker are
+sent back with each result. HEYDOC_PARSE_WORKERS sets the pool size;
+with 0, parsing runs on the fetcher thread as before.
+"""
+
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Optional
+
+import boilerplate
+import page_guard
+
+# Configuration
+PARSE_WORKERS = int(os.environ.get('HEYDOC_PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+QUEUE_SIZE = 8  # bodies per pipeline fetched but not yet written
+
+# Modules whose counters are collected in the workers and merged here
+_WORKER_STATS = (page_guard, boilerplate)
+
+_DONE = object()
+
+
+class Stop(Exception):
+    """Raised by a write callback to end the pipeline early."""
+
+
+@dataclass
+class StageStats:
+    """Time one stage spent working and waiting."""
+    items: int = 0
+    busy: float = 0.0  # seconds working (summed over threads / workers)
+    waited: float = 0.0  # seconds blocked on the neighbouring stage
+
+
+@dataclass
+class PipelineStats:
+    """Stage counters for one source's pipeline run."""
+    fetchers: int = 1
+    workers: int = 0
+    queue_size: int = QUEUE_SIZE
+    wall: float = 0.0
+    peak_queued: int = 0
+    fetch: StageStats = field(default_factory=StageStats)
+    parse: StageStats = field(default_factory=StageStats)
+    write: StageStats = field(default_factory=StageStats)
+
+    @property
+    def overlap(self) -> float:
+        """Seconds saved over running the stages one after another."""
+        return max(0.0, self.fetch.busy + self.parse.busy + self.write.busy - self.wall)
+
+
+_EXECUTOR: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            # spawn rather than fork: forking while fetcher threads hold
+            # locks (connection pool, stats) could leave a worker deadlocked
+            _EXECUTOR = concurrent.futures.ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _EXECUTOR
+
+
+def _parse_in_worker(parse: Callable, job: Any, payload: Any, submitted: float) -> tuple:
+    """Run parse in a worker; returns (result, seconds queued, seconds
+    parsing, counters recorded meanwhile)."""
+    started = time.time()
+    result = parse(job, payload)
+    seconds = time.time() - started
+    counters = {module.__name__: module.take_stats() for module in _WORKER_STATS}
+    return result, max(0.0, started - submitted), seconds, counters
+
+
+def _parse_inline(parse: Callable, job: Any, payload: Any) -> tuple:
+    # Counters are recorded in this process already
+    started = time.time()
+    result = parse(job, payload)
+    return result, 0.0, time.time() - started, None
+
+
+def _merge_worker_stats(counters: Optional[dict]):
+    for module in _WORKER_STATS:
+        if counters and counters.get(module.__name__):
+            module.merge_stats(counters[module.__name__])
+
+
+class Pipeline:
+    """fetch -> parse -> write for one source.
+
+    fetch(job) returns the raw body, or None if the fetch failed (the
+    writer then gets None without a parse). write(job, result) may return
+    a follow-up job, such as a fallback URL to try when the result was
+    unusable. The follow-up is fetched on the writer thread, and its result
+    is written in place of the original.
+    """
+
+    def __init__(self, source: str, fetch: Callable[[Any], Any],
+                 parse: Callable[[Any, Any], Any], write: Callable[[Any, Any], Any],
+                 fetchers: int = 1, workers: Optional[int] = None,
+                 queue_size: int = QUEUE_SIZE):
+        self.source = source
+        self.fetch = fetch
+        self.parse = parse
+        self.write = write
+        self.fetchers = fetchers
+        self.workers = PARSE_WORKERS if workers is None else workers
+        self.queue_size = queue_size
+        self.stats = PipelineStats(fetchers=fetchers, workers=self.workers, queue_size=queue_size)
+        self._lock = threading.Lock()
+
+    def _fetch(self, job) -> Any:
+        started = time.perf_counter()
+        try:
+            return self.fetch(job)
+        finally:
+            with self._lock:
+                self.stats.fetch.items += 1
+                self.stats.fetch.busy += time.perf_counter() - started
+
+    def _start_parse(self, job, payload) -> concurrent.futures.Future:
+        if payload is None:
+            future = concurrent.futures.Future()
+            future.set_result((None, 0.0, 0.0, None))
+            return future
+        if self.workers <= 0:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(_parse_inline(self.parse, job, payload))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return _executor().submit(_parse_in_worker, self.parse, job, payload, time.time())
+
+    def _finish_parse(self, future: concurrent.futures.Future) -> Any:
+        result, queued, seconds, counters = future.result()
+        _merge_worker_stats(counters)
+        with self._lock:
+            if seconds or queued:
+                self.stats.parse.items += 1
+            self.stats.parse.busy += seconds
+            self.stats.parse.waited += queued
+        return result
+
+    def run(self, jobs: Iterable) -> PipelineStats:
+        """Process every job; returns the stage counters (also kept for
+        print_stats). Exceptions from any stage are re-raised here."""
+        started = time.perf_counter()
+        jobs = iter(jobs)
+        jobs_lock = threading.Lock()
+        slots = threading.Semaphore(self.queue_size)
+        results: queue.Queue = queue.Queue()
+        stop = threading.Event()
+        numbering = {'next': 0}
+        queued = {'now': 0}
+
+        def fetcher():
+            try:
+                while not stop.is_set():
+                    with jobs_lock:
+                        job = next(jobs, _DONE)
+                        if job is _DONE:
+                            break
+                        seq = numbering['next']
+                        numbering['next'] += 1
+                    try:
+                        payload, failure = self._fetch(job), None
+                    except Exception as e:
+                        payload, failure = None, e
+
+                    waiting = time.perf_counter()
+                    slots.acquire()
+                    if stop.is_set():
+                        break
+                    with self._lock:
+                        self.stats.fetch.waited += time.perf_counter() - waiting
+                        queued['now'] += 1
+                        self.stats.peak_queued = max(self.stats.peak_queued, queued['now'])
+                    if failure is not None:
+                        future = concurrent.futures.Future()
+                        future.set_exception(failure)
+                    else:
+                        future = self._start_parse(job, payload)
+                    results.put((seq, job, future))
+            finally:
+                results.put(_DONE)
+
+        threads = [threading.Thread(target=fetcher, name=f'fetch-{self.source}-{i}', daemon=True)
+                   for i in range(self.fetchers)]
+        for thread in threads:
+            thread.start()
+
+        pending = {}
+        expected = 0
+        running = len(threads)
+        try:
+            while running or expected in pending:
+                if expected not in pending:
+                    waiting = time.perf_counter()
+                    item = results.get()
+                    self.stats.write.waited += time.perf_counter() - waiting
+                    if item is _DONE:
+                        running -= 1
+                    else:
+                        pending[item[0]] = item
+                    continue
+
+                _, job, future = pending.pop(expected)
+                expected += 1
+                result = self._finish_parse(future)
+                while True:
+                    writing = time.perf_counter()
+                    try:
+                        follow_up = self.write(job, result)
+                    finally:
+                        self.stats.write.items += 1
+                        self.stats.write.busy += time.perf_counter() - writing
+                    if follow_up is None:
+                        break
+                    job = follow_up
+                    result = self._finish_parse(self._start_parse(job, self._fetch(job)))
+                with self._lock:
+                    queued['now'] -= 1
+                slots.release()
+        except Stop:
+            pass
+        finally:
+            stop.set()
+            for _, _, future in pending.values():
+                future.cancel()
+            for _ in threads:
+                slots.release()  # wake fetchers blocked on backpressure
+            for thread in threads:
+                thread.join()
+
+        self.stats.wall = time.perf_counter() - started
+        with _STATS_LOCK:
+            _STATS[self.source] = self.stats
+        return self.stats
+
+
+def run(source: str, jobs: Iterable, fetch: Callable[[Any], Any],
+        parse: Callable[[Any, Any], Any], write: Callable[[Any, Any], Any],
+        **options) -> PipelineStats:
+    """Build a Pipeline and run it over jobs (see Pipeline)."""
+    return Pipeline(source, fetch, parse, write, **options).run(jobs)
+
+
+# ============================================================================
+# Reporting
+# ============================================================================
+
+_STATS: dict[str, PipelineStats] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def stats() -> dict[str, PipelineStats]:
+    """Per-source stage counters of the last run (shared - read only)."""
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+
+def _share(seconds: float, wall: float, lanes: int) -> str:
+    return f"{seconds / (wall * lanes):.0%}" if wall and lanes else "-"
+
+
+def print_stats():
+    """Print per-stage utilization and the time saved by overlapping them."""
+    per_source = stats()
+    if not per_source:
+        return
+
+    print("\nPipeline (fetch -> parse -> write):", flush=True)
+    for source, s in sorted(per_source.items()):
+        where = f"{s.workers} worker processes" if s.workers > 0 else "inline"
+        print(f"  - {source}: {s.write.items} items in {s.wall:.1f}s, "
+              f"overlap saved {s.overlap:.1f}s", flush=True)
+        print(f"      fetch  {s.fetch.busy:7.1f}s busy ({_share(s.fetch.busy, s.wall, s.fetchers)} "
+              f"of {s.fetchers} thread), {s.fetch.waited:.1f}s blocked on a full queue "
+              f"(peak {s.peak_queued}/{s.queue_size})", flush=True)
+        print(f"      parse  {s.parse.busy:7.1f}s busy ({_share(s.parse.busy, s.wall, max(1, s.workers))} "
+              f"of {where}), {s.parse.waited:.1f}s queued for a worker", flush=True)
+        print(f"      write  {s.write.busy:7.1f}s busy ({_share(s.write.busy, s.wall, 1)}), "
+              f"{s.write.waited:.1f}s waiting for results", flush=True)
@@ -8,20 +8,25 @@ License: Open Access (various CC licenses)
 """
 
 import csv
+import io
 import json
 import re
-import time
-import urllib.request
 import urllib.error
 import urllib.parse
 import sys
 from datetime import date
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterator, Optional
 from xml.etree import ElementTree
 
+import eutils_history
+import fetch_metrics
+import http_client
+import ncbi_limiter
+import pipeline
+import watermarks
+
 # Configuration
-REQUEST_DELAY = 0.35  # Max 3 requests/second without API key
 MAX_CHUNK_SIZE = 2000
 TARGET_ENTRIES = 200
 TODAY = date.today().isoformat()
@@ -43,6 +48,8 @@ class RagEntry:
     date_accessed: str
     text_chunk: str
     category: str
+    section: str = ""  # heading path of the chunk within its page
+    queries: str = ""  # search queries that matched the article, ' | '-joined
 
 
 # Search queries for systematic reviews on medical topics
@@ -76,17 +83,11 @@ SEARCH_QUERIES = [
 TARGET_PER_QUERY = 15
 
 
-def fetch_url(url: str, delay: bool = True) -> Optional[str]:
-    """Fetch URL content with polite delay."""
-    if delay:
-        time.sleep(REQUEST_DELAY)
-
+def fetch_url(url: str) -> Optional[str]:
+    """Fetch URL content within the shared NCBI request budget."""
     headers = {'User-Agent': USER_AGENT}
-    req = urllib.request.Request(url, headers=headers)
-
     try:
-        with urllib.request.urlopen(req, timeout=30) as response:
-            return response.read().decode('utf-8', errors='ignore')
+        return http_client.fetch_text(url, headers=headers, timeout=30, pace=ncbi_limiter.pace)
     except Exception as e:
         print(f"  Error fetching: {e}", flush=True)
         return None
@@ -124,194 +125,286 @@ def chunk_text(text: str, max_size: int = MAX_CHUNK_SIZE) -> list[str]:
     return chunks
 
 
-def search_pmc(query: str, max_results: int = 20) -> list[str]:
-    """Search PMC for open access articles."""
-    params = {
-        'db': 'pmc',
-        'term': query,
-        'retmax': max_results,
-        'retmode': 'json',
-        'sort': 'relevance',
-    }
+SEARCH_FILTERS = {'sort': 'relevance'}
+EFETCH_PARAMS = {'retmode': 'xml'}
 
-    url = f"{BASE_URL}/esearch.fcgi?" + urllib.parse.urlencode(params)
+
+def search_pmc(query: str, max_results: int = 20,
+               since: Optional[str] = None) -> Optional[list[str]]:
+    """Search PMC for open access articles (None if the search failed).
+    With since, only articles added to PMC from that date on."""
+    if since:
+        query = f"({query}) AND {watermarks.edat_clause(since)}"
+    params = dict(SEARCH_FILTERS, db='pmc', term=query, retmax=max_results, retmode='json')
+
+    url = f"{BASE_URL}/esearch.fcgi?" + urllib.parse.urlencode(ncbi_limiter.with_api_key(params))
 
     response = fetch_url(url)
     if not response:
-        return []
+        return None
 
     try:
         data = json.loads(response)
         pmcids = data.get('esearchresult', {}).get('idlist', [])
         return pmcids
     except json.JSONDecodeError:
-        return []
+        return None
 
 
-def fetch_pmc_abstracts(pmcids: list[str]) -> list[dict]:
-    """Fetch article abstracts from PMC."""
-    if not pmcids:
-        return []
+EFETCH_BATCH = 50  # PMC ids per efetch request
 
-    all_articles = []
 
-    for i in range(0, len(pmcids), 50):
-        batch = pmcids[i:i+50]
-        params = {
-            'db': 'pmc',
-            'id': ','.join(batch),
-            'retmode': 'xml',
-        }
+def efetch_url(pmcids: list[str]) -> str:
+    """efetch URL for a batch of PMC articles."""
+    params = dict(EFETCH_PARAMS, db='pmc', id=','.join(pmcids))
+    return f"{BASE_URL}/efetch.fcgi?" + urllib.parse.urlencode(ncbi_limiter.with_api_key(params))
 
-        url = f"{BASE_URL}/efetch.fcgi?" + urllib.parse.urlencode(params)
 
-        xml_data = fetch_url(url)
-        if not xml_data:
-            continue
+def stream_reviews(url: str) -> Optional[list[dict]]:
+    """Fetch an efetch response and parse it while it downloads; only the
+    front matter of each article is kept, never the XML. None if the
+    request fails."""
+    headers = {'User-Agent': USER_AGENT}
+    try:
+        stream = http_client.request_with_retries('GET', url, headers=headers, timeout=30,
+                                                  pace=ncbi_limiter.pace, stream=True)
+        with stream:
+            return list(iter_pmc_articles(stream))
+    except Exception as e:
+        print(f"  Error fetching {url}: {e}", flush=True)
+        return None
 
-        try:
-            articles = parse_pmc_xml(xml_data)
-            all_articles.extend(articles)
-        except Exception as e:
-            print(f"  Error parsing: {e}", flush=True)
 
-    return all_articles
+def chunk_reviews(batch: tuple, articles: list[dict]) -> list[tuple[dict, list[str]]]:
+    """Parse stage: (article, chunks) for each article of an efetch batch."""
+    return [(article, chunk_text(article['content'])) for article in articles]
 
 
-def parse_pmc_xml(xml_data: str) -> list[dict]:
-    """Parse PMC XML response."""
-    articles = []
+def _review_record(article) -> Optional[dict]:
+    """The entry for an <article> element (only its <front> is needed), or
+    None if it lacks an ID, a title or a meaningful abstract."""
+    # Get PMC ID - try multiple formats
+    pmcid = None
+    for id_elem in article.findall('.//article-id'):
+        pub_type = id_elem.get('pub-id-type', '')
+        if pub_type in ('pmcid', 'pmc', 'pmcaid'):
+            pmcid = id_elem.text
+            if pmcid and pmcid.startswith('PMC'):
+                pmcid = pmcid[3:]  # Remove PMC prefix
+            break
 
+    if not pmcid:
+        return None
+
+    # Get title
+    title_elem = article.find('.//article-title')
+    title = ""
+    if title_elem is not None:
+        title = ElementTree.tostring(title_elem, encoding='unicode', method='text').strip()
+    if not title:
+        return None
+
+    # Get abstract - extract all text content
+    abstract = ""
+    abstract_elem = article.find('.//abstract')
+    if abstract_elem is not None:
+        abstract = ElementTree.tostring(abstract_elem, encoding='unicode', method='text')
+        abstract = re.sub(r'\s+', ' ', abstract).strip()
+
+    if not abstract or len(abstract) < 100:
+        return None
+
+    # Get authors
+    authors = []
+    for contrib in article.findall('.//contrib[@contrib-type="author"]'):
+        surname = contrib.find('.//surname')
+        given = contrib.find('.//given-names')
+        if surname is not None and surname.text:
+            name = surname.text
+            if given is not None and given.text:
+                name = f"{given.text} {name}"
+            authors.append(name)
+
+    author_str = ', '.join(authors[:3])
+    if len(authors) > 3:
+        author_str += ' et al.'
+
+    # Get publication date
+    pub_date = ""
+    date_elem = article.find('.//pub-date[@pub-type="epub"]')
+    if date_elem is None:
+        date_elem = article.find('.//pub-date')
+    if date_elem is not None:
+        year = date_elem.find('year')
+        if year is not None and year.text:
+            pub_date = year.text
+
+    # Get journal
+    journal_elem = article.find('.//journal-title')
+    journal = journal_elem.text if journal_elem is not None else ""
+
+    # Build content
+    content = f"Systematic Review: {title}\n"
+    if author_str:
+        content += f"Authors: {author_str}\n"
+    if journal:
+        content += f"Journal: {journal}\n"
+    if pub_date:
+        content += f"Published: {pub_date}\n"
+    content += f"\nAbstract: {abstract}"
+
+    return {
+        'pmcid': pmcid,
+        'title': title,
+        'content': content,
+        'url': f"https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{pmcid}/",
+    }
+
+
+def iter_pmc_articles(source) -> Iterator[dict]:
+    """Stream articles out of PMC efetch XML (a file-like object or a path).
+
+    efetch only serves whole JATS articles for db=pmc, but everything we
+    read is in <front>. The other parts of each <article> (<body>, <back>,
+    <floats-group>, <sub-article>) are still tokenized, but each of their
+    elements is dropped as soon as it ends, so memory holds one article's
+    front matter plus the innermost open element, however large the
+    response. Malformed XML ends the stream with the articles read so far.
+    """
+    stack = []
+    article = None
+    skip_depth = 0  # depth of the <article> child being dropped
     try:
-        root = ElementTree.fromstring(xml_data)
-    except ElementTree.ParseError:
-        return articles
-
-    for article in root.findall('.//article'):
-        try:
-            # Get PMC ID - try multiple formats
-            pmcid = None
-            for id_elem in article.findall('.//article-id'):
-                pub_type = id_elem.get('pub-id-type', '')
-                if pub_type in ('pmcid', 'pmc', 'pmcaid'):
-                    pmcid = id_elem.text
-                    if pmcid and pmcid.startswith('PMC'):
-                        pmcid = pmcid[3:]  # Remove PMC prefix
-                    break
-
-            if not pmcid:
+        for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                if article is None:
+                    if elem.tag == 'article':
+                        article = elem
+                elif not skip_depth and stack[-2] is article and elem.tag != 'front':
+                    skip_depth = len(stack)
                 continue
 
-            # Get title
-            title_elem = article.find('.//article-title')
-            title = ""
-            if title_elem is not None:
-                title = ElementTree.tostring(title_elem, encoding='unicode', method='text').strip()
-            if not title:
-                continue
+            depth = len(stack)
+            stack.pop()
+            if skip_depth and depth >= skip_depth:
+                stack[-1].remove(elem)
+                if depth == skip_depth:
+                    skip_depth = 0
+            elif elem is article:
+                try:
+                    record = _review_record(article)
+                except Exception:
+                    record = None
+                article = None
+                elem.clear()
+                if stack:
+                    stack[-1].remove(elem)
+                if record is not None:
+                    yield record
+    except ElementTree.ParseError as e:
+        print(f"  XML parse error: {e}", flush=True)
 
-            # Get abstract - extract all text content
-            abstract = ""
-            abstract_elem = article.find('.//abstract')
-            if abstract_elem is not None:
-                abstract = ElementTree.tostring(abstract_elem, encoding='unicode', method='text')
-                abstract = re.sub(r'\s+', ' ', abstract).strip()
 
-            if not abstract or len(abstract) < 100:
-                continue
+def parse_pmc_xml(xml_data: str) -> list[dict]:
+    """Parse PMC XML response."""
+    return list(iter_pmc_articles(io.BytesIO(xml_data.encode('utf-8'))))
 
-            # Get authors
-            authors = []
-            for contrib in article.findall('.//contrib[@contrib-type="author"]'):
-                surname = contrib.find('.//surname')
-                given = contrib.find('.//given-names')
-                if surname is not None and surname.text:
-                    name = surname.text
-                    if given is not None and given.text:
-                        name = f"{given.text} {name}"
-                    authors.append(name)
-
-            author_str = ', '.join(authors[:3])
-            if len(authors) > 3:
-                author_str += ' et al.'
-
-            # Get publication date
-            pub_date = ""
-            date_elem = article.find('.//pub-date[@pub-type="epub"]')
-            if date_elem is None:
-                date_elem = article.find('.//pub-date')
-            if date_elem is not None:
-                year = date_elem.find('year')
-                if year is not None and year.text:
-                    pub_date = year.text
-
-            # Get journal
-            journal_elem = article.find('.//journal-title')
-            journal = journal_elem.text if journal_elem is not None else ""
-
-            # Build content
-            content = f"Systematic Review: {title}\n"
-            if author_str:
-                content += f"Authors: {author_str}\n"
-            if journal:
-                content += f"Journal: {journal}\n"
-            if pub_date:
-                content += f"Published: {pub_date}\n"
-            content += f"\nAbstract: {abstract}"
-
-            articles.append({
-                'pmcid': pmcid,
-                'title': title,
-                'content': content,
-                'url': f"https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{pmcid}/",
-            })
-
-        except Exception:
-            continue
-
-    return articles
-
-
-def fetch_pmc_reviews() -> list[RagEntry]:
-    """Fetch systematic reviews from PMC."""
+
+def fetch_pmc_reviews(run: Optional[watermarks.Run] = None) -> list[RagEntry]:
+    """Fetch systematic reviews from PMC. An incremental run only searches
+    each query from its watermark and skips reviews already written."""
+    run = run or watermarks.Run()
     print("\n" + "="*60, flush=True)
     print("FETCHING: PMC Open Access Systematic Reviews", flush=True)
     print("="*60, flush=True)
 
     entries = []
-    seen_ids = set()
+    seen_ids = set(run.known or ())
+    matched = {}  # PMC id -> queries that found it
     entry_count = 0
 
-    for query in SEARCH_QUERIES:
-        if entry_count >= TARGET_ENTRIES:
-            print(f"\nReached target of {TARGET_ENTRIES} entries", flush=True)
-            break
-
-        # Extract topic from query for display
-        topic_match = re.search(r'AND (\w+)\[Title', query)
-        topic = topic_match.group(1) if topic_match else "topic"
-        print(f"\nSearching: {topic}...", flush=True)
-
-        pmcids = search_pmc(query, max_results=TARGET_PER_QUERY)
-
-        # Filter out seen IDs
-        new_ids = [p for p in pmcids if p not in seen_ids]
-        seen_ids.update(new_ids)
-
-        if not new_ids:
-            print(f"  No new results", flush=True)
-            continue
+    searched = set()  # queries whose search succeeded
 
-        print(f"  Found {len(new_ids)} articles", flush=True)
+    def search(query):
+        pmcids = search_pmc(query, max_results=TARGET_PER_QUERY, since=run.since(query))
+        if pmcids is None:
+            return []
+        searched.add(query)
+        return pmcids
 
-        articles = fetch_pmc_abstracts(new_ids)
-        print(f"  Fetched {len(articles)} abstracts", flush=True)
+    def batches():
+        if eutils_history.MODE in ('collect', 'epost'):
+            yield from collected_batches()
+            return
+        # Searched lazily by the fetcher, so no query is searched once the
+        # writer has reached the target
+        for query in SEARCH_QUERIES:
+            # Extract topic from query for display
+            topic_match = re.search(r'AND (\w+)\[Title', query)
+            topic = topic_match.group(1) if topic_match else "topic"
+            print(f"\nSearching: {topic}...", flush=True)
+
+            pmcids = search(query)
+
+            # Filter out seen IDs
+            new_ids = [p for p in pmcids if p not in seen_ids]
+            seen_ids.update(new_ids)
+
+            if not new_ids:
+                print(f"  No new results", flush=True)
+                if query in searched:
+                    run.done.add(query)
+                continue
 
-        for article in articles:
+            print(f"  Found {len(new_ids)} articles", flush=True)
+            for pmcid in new_ids:
+                matched[pmcid] = [query]
+
+            jobs = ((topic, efetch_url(new_ids[i:i+EFETCH_BATCH]))
+                    for i in range(0, len(new_ids), EFETCH_BATCH))
+            yield from watermarks.completing(run, jobs, [query])
+
+    def collected_batches():
+        # Every search first, so each review is fetched once however many
+        # queries found it, and credited to all of them
+        print(f"\nSearching: {len(SEARCH_QUERIES)} queries, "
+              f"{eutils_history.SEARCH_WORKERS} at a time...", flush=True)
+        matched.update(eutils_history.collect(SEARCH_QUERIES, search))
+        pmcids = [p for p in matched if p not in seen_ids]
+        print(f"  Found {len(pmcids)} unique articles "
+              f"({sum(map(len, matched.values()))} query matches)", flush=True)
+
+        if eutils_history.MODE == 'epost' and pmcids:
+            history = eutils_history.epost('pmc', pmcids)
+            if history is None:
+                return
+            jobs = eutils_history.pages(history, params=EFETCH_PARAMS, page_size=EFETCH_BATCH)
+        else:
+            jobs = ((f"articles {i + 1}-{i + len(pmcids[i:i+EFETCH_BATCH])}",
+                     efetch_url(pmcids[i:i+EFETCH_BATCH]))
+                    for i in range(0, len(pmcids), EFETCH_BATCH))
+        yield from watermarks.completing(run, jobs, searched)
+
+    def fetch(batch):
+        _, url, _ = batch
+        return stream_reviews(url)
+
+    def write(batch, articles):
+        nonlocal entry_count
+        topic, _, completes = batch
+        if articles is None:
+            run.incomplete = True  # keep the watermarks so these are retried
+        articles = articles or []
+        print(f"  Fetched {len(articles)} abstracts ({topic})", flush=True)
+
+        handled = 0
+        for article, chunks in articles:
             if entry_count >= TARGET_ENTRIES:
                 break
-
-            chunks = chunk_text(article['content'])
+            handled += 1
+            if run.is_known(article['pmcid']):
+                continue  # already in the CSV
 
             for j, chunk in enumerate(chunks):
                 entry_id = f"pmc_{article['pmcid']}"
@@ -326,38 +419,58 @@ def fetch_pmc_reviews() -> list[RagEntry]:
                     license="Open Access",
                     date_accessed=TODAY,
                     text_chunk=chunk,
-                    category="systematic_review"
+                    category="systematic_review",
+                    queries=' | '.join(matched.get(article['pmcid'], ())),
                 ))
 
             entry_count += 1
 
+        if handled == len(articles):
+            run.done.update(completes)
+        if entry_count >= TARGET_ENTRIES:
+            print(f"\nReached target of {TARGET_ENTRIES} entries", flush=True)
+            raise pipeline.Stop
+
+    fetchers = eutils_history.EFETCH_WORKERS if eutils_history.MODE == 'collect' else 1
+    pipeline.run('PMC', batches(), fetch, chunk_reviews, write, fetchers=fetchers)
+
     print(f"\n  Total PMC entries: {len(entries)}", flush=True)
     return entries
 
 
+CSV_COLUMNS = [
+    'id', 'title', 'source_name', 'url', 'license',
+    'date_accessed', 'text_chunk', 'category', 'section', 'queries'
+]
+
+
+def _csv_row(entry: RagEntry) -> list[str]:
+    return [
+        entry.id,
+        entry.title,
+        entry.source_name,
+        entry.url,
+        entry.license,
+        entry.date_accessed,
+        entry.text_chunk,
+        entry.category,
+        entry.section,
+        entry.queries
+    ]
+
+
 def write_csv(entries: list[RagEntry], output_path: str):
     """Write entries to CSV file."""
     with open(output_path, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(_csv_row(entry) for entry in entries)
 
-        # Header
-        writer.writerow([
-            'id', 'title', 'source_name', 'url', 'license',
-            'date_accessed', 'text_chunk', 'category'
-        ])
-
-        # Data rows
-        for entry in entries:
-            writer.writerow([
-                entry.id,
-                entry.title,
-                entry.source_name,
-                entry.url,
-                entry.license,
-                entry.date_accessed,
-                entry.text_chunk,
-                entry.category
-            ])
+
+def append_csv(entries: list[RagEntry], output_path: str):
+    """Append entries to an existing CSV file written by write_csv."""
+    with open(output_path, 'a', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(_csv_row(entry) for entry in entries)
 
 
 def main():
@@ -369,7 +482,14 @@ def main():
     print(f"Target entries: {TARGET_ENTRIES}", flush=True)
     print("="*60, flush=True)
 
-    entries = fetch_pmc_reviews()
+    import os
+    output_path = os.path.join(os.path.dirname(__file__), 'pmc_reviews.csv')
+    output_path = os.path.abspath(output_path)
+    run = watermarks.start(output_path, 'pmc_', CSV_COLUMNS)
+    if run.incremental:
+        print(f"Incremental refresh: {len(run.known)} reviews already in the CSV", flush=True)
+
+    entries = fetch_pmc_reviews(run)
 
     # Summary
     print("\n" + "="*60, flush=True)
@@ -378,12 +498,17 @@ def main():
     print(f"Total entries collected: {len(entries)}", flush=True)
 
     # Write output
-    import os
-    output_path = os.path.join(os.path.dirname(__file__), 'pmc_reviews.csv')
-    output_path = os.path.abspath(output_path)
-
-    write_csv(entries, output_path)
-    print(f"\nOutput written to: {output_path}", flush=True)
+    if run.incremental:
+        append_csv(entries, output_path)
+        print(f"\nOutput appended to: {output_path}", flush=True)
+    else:
+        write_csv(entries, output_path)
+        print(f"\nOutput written to: {output_path}", flush=True)
+    watermarks.finish(run)
+    http_client.print_stats()
+    ncbi_limiter.print_stats()
+    pipeline.print_stats()
+    fetch_metrics.write_summary(output_path, total=len(entries))
 
     return entries
 
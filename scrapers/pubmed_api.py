@@ -8,20 +8,25 @@ License: Public Domain (US Government)
 """
 
 import csv
+import io
 import json
 import re
-import time
-import urllib.request
 import urllib.error
 import urllib.parse
 import sys
 from datetime import date
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterator, Optional
 from xml.etree import ElementTree
 
+import eutils_history
+import fetch_metrics
+import http_client
+import ncbi_limiter
+import pipeline
+import watermarks
+
 # Configuration
-REQUEST_DELAY = 0.35  # Max 3 requests/second without API key
 MAX_CHUNK_SIZE = 2000
 TODAY = date.today().isoformat()
 USER_AGENT = "HeyDoc-RAG-Fetcher/1.0 (Educational/Healthcare Research)"
@@ -42,6 +47,8 @@ class RagEntry:
     date_accessed: str
     text_chunk: str
     category: str
+    section: str = ""  # heading path of the chunk within its page
+    queries: str = ""  # search queries that matched the article, ' | '-joined
 
 
 # Search queries for relevant medical content
@@ -75,17 +82,11 @@ SEARCH_QUERIES = [
 TARGET_PER_QUERY = 20
 
 
-def fetch_url(url: str, delay: bool = True) -> Optional[str]:
-    """Fetch URL content with polite delay."""
-    if delay:
-        time.sleep(REQUEST_DELAY)
-
+def fetch_url(url: str) -> Optional[str]:
+    """Fetch URL content within the shared NCBI request budget."""
     headers = {'User-Agent': USER_AGENT}
-    req = urllib.request.Request(url, headers=headers)
-
     try:
-        with urllib.request.urlopen(req, timeout=30) as response:
-            return response.read().decode('utf-8', errors='ignore')
+        return http_client.fetch_text(url, headers=headers, timeout=30, pace=ncbi_limiter.pace)
     except Exception as e:
         print(f"  Error fetching {url}: {e}", flush=True)
         return None
@@ -123,26 +124,30 @@ def chunk_text(text: str, max_size: int = MAX_CHUNK_SIZE) -> list[str]:
     return chunks
 
 
-def search_pubmed(query: str, max_results: int = 50) -> list[str]:
-    """Search PubMed and return list of PMIDs."""
+# Filter: last 10 years, most relevant first
+SEARCH_FILTERS = {
+    'sort': 'relevance',
+    'datetype': 'pdat',
+    'mindate': '2015',
+    'maxdate': '2026',
+}
+EFETCH_PARAMS = {'retmode': 'xml', 'rettype': 'abstract'}
+
+
+def search_pubmed(query: str, max_results: int = 50,
+                  since: Optional[str] = None) -> Optional[list[str]]:
+    """Search PubMed and return list of PMIDs (None if the search failed).
+    With since, only articles added to PubMed from that date on."""
+    if since:
+        query = f"({query}) AND {watermarks.edat_clause(since)}"
     # Build search URL with filters
-    params = {
-        'db': 'pubmed',
-        'term': query,
-        'retmax': max_results,
-        'retmode': 'json',
-        'sort': 'relevance',
-        # Filter: last 10 years, English, has abstract
-        'datetype': 'pdat',
-        'mindate': '2015',
-        'maxdate': '2026',
-    }
-
-    url = f"{BASE_URL}/esearch.fcgi?" + urllib.parse.urlencode(params)
+    params = dict(SEARCH_FILTERS, db='pubmed', term=query, retmax=max_results, retmode='json')
+
+    url = f"{BASE_URL}/esearch.fcgi?" + urllib.parse.urlencode(ncbi_limiter.with_api_key(params))
 
     response = fetch_url(url)
     if not response:
-        return []
+        return None
 
     try:
         data = json.loads(response)
@@ -150,203 +155,325 @@ def search_pubmed(query: str, max_results: int = 50) -> list[str]:
         return pmids
     except json.JSONDecodeError as e:
         print(f"  Error parsing search results: {e}", flush=True)
-        return []
-
+        return None
 
-def fetch_abstracts(pmids: list[str]) -> list[dict]:
-    """Fetch article details for a list of PMIDs."""
-    if not pmids:
-        return []
 
-    # Fetch in batches of 50
-    all_articles = []
+EFETCH_BATCH = 200  # PMIDs per efetch request; responses are parsed as they stream in
 
-    for i in range(0, len(pmids), 50):
-        batch = pmids[i:i+50]
-        params = {
-            'db': 'pubmed',
-            'id': ','.join(batch),
-            'retmode': 'xml',
-            'rettype': 'abstract',
-        }
 
-        url = f"{BASE_URL}/efetch.fcgi?" + urllib.parse.urlencode(params)
+def efetch_url(pmids: list[str]) -> str:
+    """efetch URL for the abstracts of a batch of PMIDs."""
+    params = dict(EFETCH_PARAMS, db='pubmed', id=','.join(pmids))
+    return f"{BASE_URL}/efetch.fcgi?" + urllib.parse.urlencode(ncbi_limiter.with_api_key(params))
 
-        xml_data = fetch_url(url)
-        if not xml_data:
-            continue
 
-        try:
-            articles = parse_pubmed_xml(xml_data)
-            all_articles.extend(articles)
-        except Exception as e:
-            print(f"  Error parsing XML: {e}", flush=True)
+def stream_abstracts(url: str) -> Optional[list[dict]]:
+    """Fetch an efetch response and parse it while it downloads; only the
+    extracted articles are kept, never the XML. None if the request fails."""
+    headers = {'User-Agent': USER_AGENT}
+    try:
+        stream = http_client.request_with_retries('GET', url, headers=headers, timeout=30,
+                                                  pace=ncbi_limiter.pace, stream=True)
+        with stream:
+            return list(iter_pubmed_articles(stream))
+    except Exception as e:
+        print(f"  Error fetching {url}: {e}", flush=True)
+        return None
 
-    return all_articles
 
+def chunk_articles(batch: tuple, articles: list[dict]) -> list[tuple[dict, list[str]]]:
+    """Parse stage: (article, chunks) for each article of an efetch batch."""
+    return [(article, chunk_text(article['content'])) for article in articles]
+
+
+def _element_text(elem) -> str:
+    # All text inside the element, including mixed content like <i>...</i>
+    return ''.join(elem.itertext()).strip()
+
+
+class _ArticleFields:
+    """Fields of the PubmedArticle being read."""
+
+    __slots__ = ('pmid', 'title', 'abstract_parts', 'authors', 'pub_date', 'year',
+                 'publication_types', 'mesh')
+
+    def __init__(self):
+        self.pmid = None
+        self.title = ""
+        self.abstract_parts = []
+        self.authors = []
+        self.pub_date = ""
+        self.year = None
+        self.publication_types = []
+        self.mesh = []
+
+    def record(self) -> Optional[dict]:
+        """The article's entry, or None if it lacks a title or a
+        meaningful abstract."""
+        if not self.pmid or not self.title:
+            return None
+
+        abstract = ' '.join(self.abstract_parts)
+        if not abstract or len(abstract) < 100:
+            return None  # Skip articles without meaningful abstracts
+
+        author_str = ', '.join(self.authors[:3])  # First 3 authors
+        if len(self.authors) > 3:
+            author_str += ' et al.'
+
+        # Build full text content
+        content = f"Title: {self.title}\n"
+        if author_str:
+            content += f"Authors: {author_str}\n"
+        if self.pub_date:
+            content += f"Published: {self.pub_date}\n"
+        content += f"\nAbstract: {abstract}"
+
+        return {
+            'pmid': self.pmid,
+            'title': self.title,
+            'content': content,
+            'url': f"https://pubmed.ncbi.nlm.nih.gov/{self.pmid}/",
+            # For filtering locally (pubmed_bulk)
+            'abstract': abstract,
+            'year': self.year,
+            'publication_types': self.publication_types,
+            'mesh': self.mesh,
+        }
 
-def parse_pubmed_xml(xml_data: str) -> list[dict]:
-    """Parse PubMed XML response and extract article data."""
-    articles = []
 
+def iter_pubmed_articles(source, deleted: Optional[list] = None) -> Iterator[dict]:
+    """Stream articles out of PubMed XML (a file-like object or a path).
+
+    Fields are picked up in a single pass by their position in the tree -
+    the citation's own PMID, the Article's title, abstract, author list,
+    publication types and journal issue date, and the citation's MeSH
+    headings - rather than by descendant searches, which also matched
+    PMIDs and authors in comments and reference lists. Each PubmedArticle
+    is cleared once it has been read, so memory does not grow with the
+    size of the response. Malformed XML ends the stream with the articles
+    read so far.
+
+    PubMed update files also list withdrawn citations in DeleteCitation;
+    their PMIDs are appended to deleted if it is given.
+    """
+    stack = []
+    root = None
+    article = None
     try:
-        root = ElementTree.fromstring(xml_data)
-    except ElementTree.ParseError as e:
-        print(f"  XML parse error: {e}", flush=True)
-        return articles
-
-    for article in root.findall('.//PubmedArticle'):
-        try:
-            # Get PMID
-            pmid_elem = article.find('.//PMID')
-            pmid = pmid_elem.text if pmid_elem is not None else None
-            if not pmid:
+        for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                if root is None:
+                    root = elem
+                stack.append(tag)
+                if tag == 'PubmedArticle':
+                    article = _ArticleFields()
                 continue
 
-            # Get title
-            title_elem = article.find('.//ArticleTitle')
-            title = title_elem.text if title_elem is not None else ""
-            if not title:
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if article is None:
+                if tag == 'PMID' and parent == 'DeleteCitation' and deleted is not None:
+                    deleted.append((elem.text or '').strip())
                 continue
+            grandparent = stack[-2] if len(stack) > 1 else None
+
+            if tag == 'PMID' and parent == 'MedlineCitation':
+                article.pmid = (elem.text or '').strip()
+            elif tag == 'ArticleTitle' and parent == 'Article':
+                article.title = _element_text(elem)
+            elif tag == 'AbstractText' and parent == 'Abstract' and grandparent == 'Article':
+                label = elem.get('Label', '')
+                text = _element_text(elem)
+                if label and text:
+                    article.abstract_parts.append(f"{label}: {text}")
+                elif text:
+                    article.abstract_parts.append(text)
+            elif tag == 'Author' and parent == 'AuthorList' and grandparent == 'Article':
+                lastname = elem.findtext('LastName')
+                forename = elem.findtext('ForeName')
+                if lastname and forename:
+                    article.authors.append(f"{forename} {lastname}")
+                elif lastname:
+                    article.authors.append(lastname)
+            elif tag == 'PubDate' and parent == 'JournalIssue':
+                year = elem.findtext('Year')
+                month = elem.findtext('Month')
+                if year:
+                    article.pub_date = f"{month} {year}" if month else year
+                # Undivided dates come as MedlineDate, e.g. "2019 Nov-Dec"
+                match = re.match(r'\d{4}', year or elem.findtext('MedlineDate') or '')
+                article.year = int(match.group()) if match else None
+            elif tag == 'PublicationType' and parent == 'PublicationTypeList':
+                article.publication_types.append(_element_text(elem))
+            elif tag == 'DescriptorName' and parent == 'MeshHeading':
+                article.mesh.append(_element_text(elem))
+            elif tag == 'PubmedArticle':
+                record = article.record()
+                article = None
+                root.clear()
+                if record is not None:
+                    yield record
+    except ElementTree.ParseError as e:
+        print(f"  XML parse error: {e}", flush=True)
 
-            # Get abstract
-            abstract_parts = []
-            abstract_elem = article.find('.//Abstract')
-            if abstract_elem is not None:
-                for abstract_text in abstract_elem.findall('.//AbstractText'):
-                    label = abstract_text.get('Label', '')
-                    text = abstract_text.text or ''
-                    # Handle mixed content (text with child elements)
-                    if not text and len(abstract_text) > 0:
-                        text = ElementTree.tostring(abstract_text, encoding='unicode', method='text')
-                    if label and text:
-                        abstract_parts.append(f"{label}: {text}")
-                    elif text:
-                        abstract_parts.append(text)
-
-            abstract = ' '.join(abstract_parts)
-            if not abstract or len(abstract) < 100:
-                continue  # Skip articles without meaningful abstracts
-
-            # Get authors
-            authors = []
-            for author in article.findall('.//Author'):
-                lastname = author.find('LastName')
-                forename = author.find('ForeName')
-                if lastname is not None and forename is not None:
-                    authors.append(f"{forename.text} {lastname.text}")
-                elif lastname is not None:
-                    authors.append(lastname.text)
-            author_str = ', '.join(authors[:3])  # First 3 authors
-            if len(authors) > 3:
-                author_str += ' et al.'
-
-            # Get publication date
-            pub_date = ""
-            pub_date_elem = article.find('.//PubDate')
-            if pub_date_elem is not None:
-                year = pub_date_elem.find('Year')
-                month = pub_date_elem.find('Month')
-                if year is not None:
-                    pub_date = year.text
-                    if month is not None:
-                        pub_date = f"{month.text} {year.text}"
-
-            # Build full text content
-            content = f"Title: {title}\n"
-            if author_str:
-                content += f"Authors: {author_str}\n"
-            if pub_date:
-                content += f"Published: {pub_date}\n"
-            content += f"\nAbstract: {abstract}"
-
-            articles.append({
-                'pmid': pmid,
-                'title': title,
-                'content': content,
-                'url': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
-            })
-
-        except Exception as e:
-            print(f"  Error parsing article: {e}", flush=True)
-            continue
-
-    return articles
-
-
-def fetch_pubmed_articles() -> list[RagEntry]:
-    """Fetch articles from PubMed API."""
+
+def parse_pubmed_xml(xml_data: str) -> list[dict]:
+    """Parse PubMed XML response and extract article data."""
+    return list(iter_pubmed_articles(io.BytesIO(xml_data.encode('utf-8'))))
+
+
+def article_entries(article: dict, chunks: list[str], queries=()) -> list[RagEntry]:
+    """The RagEntry rows of one article, one per chunk."""
+    entries = []
+    for j, chunk in enumerate(chunks):
+        entry_id = f"pubmed_{article['pmid']}"
+        if len(chunks) > 1:
+            entry_id += f"_{j+1}"
+
+        entries.append(RagEntry(
+            id=entry_id,
+            title=article['title'],
+            source_name="PubMed",
+            url=article['url'],
+            license="Public Domain",
+            date_accessed=TODAY,
+            text_chunk=chunk,
+            category="research",
+            queries=' | '.join(queries),
+        ))
+    return entries
+
+
+def fetch_pubmed_articles(run: Optional[watermarks.Run] = None) -> list[RagEntry]:
+    """Fetch articles from PubMed API. An incremental run only searches
+    each query from its watermark and skips articles already written."""
+    run = run or watermarks.Run()
     print("\n" + "="*60, flush=True)
     print("FETCHING: PubMed Research Abstracts (E-utilities API)", flush=True)
     print("="*60, flush=True)
 
     entries = []
-    seen_pmids = set()
+    seen_pmids = set(run.known or ())
+    matched = {}  # PMID -> queries that found it
 
-    for query in SEARCH_QUERIES:
-        print(f"\nSearching: {query[:50]}...", flush=True)
+    searched = set()  # queries whose search succeeded
 
-        pmids = search_pubmed(query, max_results=TARGET_PER_QUERY)
-
-        # Filter out already seen PMIDs
-        new_pmids = [p for p in pmids if p not in seen_pmids]
-        seen_pmids.update(new_pmids)
+    def search(query):
+        pmids = search_pubmed(query, max_results=TARGET_PER_QUERY, since=run.since(query))
+        if pmids is None:
+            return []
+        searched.add(query)
+        return pmids
 
-        if not new_pmids:
-            print(f"  No new results", flush=True)
-            continue
+    def batches():
+        if eutils_history.MODE in ('collect', 'epost'):
+            yield from collected_batches()
+            return
+        # Searched lazily by the fetcher, so the next query's search overlaps
+        # with parsing the previous one's abstracts
+        for query in SEARCH_QUERIES:
+            print(f"\nSearching: {query[:50]}...", flush=True)
+
+            pmids = search(query)
+
+            # Filter out already seen PMIDs
+            new_pmids = [p for p in pmids if p not in seen_pmids]
+            seen_pmids.update(new_pmids)
+
+            if not new_pmids:
+                print(f"  No new results", flush=True)
+                if query in searched:
+                    run.done.add(query)
+                continue
 
-        print(f"  Found {len(new_pmids)} new articles", flush=True)
+            print(f"  Found {len(new_pmids)} new articles", flush=True)
+            for pmid in new_pmids:
+                matched[pmid] = [query]
+
+            jobs = ((query, efetch_url(new_pmids[i:i+EFETCH_BATCH]))
+                    for i in range(0, len(new_pmids), EFETCH_BATCH))
+            yield from watermarks.completing(run, jobs, [query])
+
+    def collected_batches():
+        # Every search first, so each article is fetched once however many
+        # queries found it, and credited to all of them
+        print(f"\nSearching: {len(SEARCH_QUERIES)} queries, "
+              f"{eutils_history.SEARCH_WORKERS} at a time...", flush=True)
+        matched.update(eutils_history.collect(SEARCH_QUERIES, search))
+        pmids = [p for p in matched if p not in seen_pmids]
+        print(f"  Found {len(pmids)} unique articles "
+              f"({sum(map(len, matched.values()))} query matches)", flush=True)
+
+        if eutils_history.MODE == 'epost' and pmids:
+            history = eutils_history.epost('pubmed', pmids)
+            if history is None:
+                return
+            jobs = eutils_history.pages(history, params=EFETCH_PARAMS)
+        else:
+            jobs = ((f"articles {i + 1}-{i + len(pmids[i:i+EFETCH_BATCH])}",
+                     efetch_url(pmids[i:i+EFETCH_BATCH]))
+                    for i in range(0, len(pmids), EFETCH_BATCH))
+        yield from watermarks.completing(run, jobs, searched)
+
+    def fetch(batch):
+        _, url, _ = batch
+        return stream_abstracts(url)
+
+    def write(batch, articles):
+        query, _, completes = batch
+        if articles is None:
+            run.incomplete = True  # keep the watermarks so these are retried
+        articles = articles or []
+        print(f"  Fetched {len(articles)} abstracts ({query[:30]}...)", flush=True)
+
+        for article, chunks in articles:
+            if run.is_known(article['pmid']):
+                continue  # already in the CSV
+            entries.extend(article_entries(article, chunks, matched.get(article['pmid'], ())))
+        run.done.update(completes)
+
+    fetchers = eutils_history.EFETCH_WORKERS if eutils_history.MODE == 'collect' else 1
+    pipeline.run('PubMed', batches(), fetch, chunk_articles, write, fetchers=fetchers)
 
-        articles = fetch_abstracts(new_pmids)
-        print(f"  Fetched {len(articles)} abstracts", flush=True)
+    print(f"\n  Total PubMed entries: {len(entries)}", flush=True)
+    return entries
 
-        for article in articles:
-            chunks = chunk_text(article['content'])
 
-            for j, chunk in enumerate(chunks):
-                entry_id = f"pubmed_{article['pmid']}"
-                if len(chunks) > 1:
-                    entry_id += f"_{j+1}"
+CSV_COLUMNS = [
+    'id', 'title', 'source_name', 'url', 'license',
+    'date_accessed', 'text_chunk', 'category', 'section', 'queries'
+]
 
-                entries.append(RagEntry(
-                    id=entry_id,
-                    title=article['title'],
-                    source_name="PubMed",
-                    url=article['url'],
-                    license="Public Domain",
-                    date_accessed=TODAY,
-                    text_chunk=chunk,
-                    category="research"
-                ))
 
-    print(f"\n  Total PubMed entries: {len(entries)}", flush=True)
-    return entries
+def _csv_row(entry: RagEntry) -> list[str]:
+    return [
+        entry.id,
+        entry.title,
+        entry.source_name,
+        entry.url,
+        entry.license,
+        entry.date_accessed,
+        entry.text_chunk,
+        entry.category,
+        entry.section,
+        entry.queries
+    ]
 
 
 def write_csv(entries: list[RagEntry], output_path: str):
     """Write entries to CSV file."""
     with open(output_path, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(_csv_row(entry) for entry in entries)
 
-        # Header
-        writer.writerow([
-            'id', 'title', 'source_name', 'url', 'license',
-            'date_accessed', 'text_chunk', 'category'
-        ])
-
-        # Data rows
-        for entry in entries:
-            writer.writerow([
-                entry.id,
-                entry.title,
-                entry.source_name,
-                entry.url,
-                entry.license,
-                entry.date_accessed,
-                entry.text_chunk,
-                entry.category
-            ])
+
+def append_csv(entries: list[RagEntry], output_path: str):
+    """Append entries to an existing CSV file written by write_csv."""
+    with open(output_path, 'a', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(_csv_row(entry) for entry in entries)
 
 
 def main():
@@ -355,10 +482,17 @@ def main():
     print("HeyDoc PubMed API Fetcher", flush=True)
     print("="*60, flush=True)
     print(f"Date: {TODAY}", flush=True)
-    print(f"Rate limit: {1/REQUEST_DELAY:.1f} requests/second", flush=True)
+    print(f"Rate limit: {ncbi_limiter.requests_per_second():.1f} requests/second (shared)", flush=True)
     print("="*60, flush=True)
 
-    entries = fetch_pubmed_articles()
+    import os
+    output_path = os.path.join(os.path.dirname(__file__), 'pubmed_articles.csv')
+    output_path = os.path.abspath(output_path)
+    run = watermarks.start(output_path, 'pubmed_', CSV_COLUMNS)
+    if run.incremental:
+        print(f"Incremental refresh: {len(run.known)} articles already in the CSV", flush=True)
+
+    entries = fetch_pubmed_articles(run)
 
     # Summary
     print("\n" + "="*60, flush=True)
@@ -367,12 +501,17 @@ def main():
     print(f"Total entries collected: {len(entries)}", flush=True)
 
     # Write output
-    import os
-    output_path = os.path.join(os.path.dirname(__file__), 'pubmed_articles.csv')
-    output_path = os.path.abspath(output_path)
-
-    write_csv(entries, output_path)
-    print(f"\nOutput written to: {output_path}", flush=True)
+    if run.incremental:
+        append_csv(entries, output_path)
+        print(f"\nOutput appended to: {output_path}", flush=True)
+    else:
+        write_csv(entries, output_path)
+        print(f"\nOutput written to: {output_path}", flush=True)
+    watermarks.finish(run)
+    http_client.print_stats()
+    ncbi_limiter.print_stats()
+    pipeline.print_stats()
+    fetch_metrics.write_summary(output_path, total=len(entries))
 
     return entries
 
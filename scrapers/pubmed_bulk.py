@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+PubMed Baseline Bulk Ingest
+Builds PubMed RagEntry rows from the annual baseline and daily update
+files on local disk, instead of through E-utilities.
+
+pubmed_api.py goes through the rate-limited E-utilities API, which is why
+it stops at TARGET_PER_QUERY articles per query. NLM also publishes all
+of PubMed as pubmedNNnXXXX.xml.gz files (ftp.ncbi.nlm.nih.gov/pubmed/
+baseline and updatefiles). Given a directory of them, this script:
+
+  - hands each file to the pipeline's process pool, where it is
+    decompressed as a stream and read with pubmed_api.iter_pubmed_articles,
+    so a worker never holds more than one citation of the file;
+  - matches every citation against the scraper's SEARCH_QUERIES locally
+    (QueryMatcher) and applies the same publication-date range as
+    SEARCH_FILTERS;
+  - applies the files in name order (baseline, then updates), so a
+    revised citation replaces the earlier version and a DeleteCitation
+    removes it;
+  - writes the matches as the same CSV rows pubmed_api.py writes, with
+    every query that matched each article in the queries column.
+
+Local matching covers the PubMed syntax our queries use: AND / OR / NOT
+(left to right, as PubMed evaluates them), parentheses, quoted phrases,
+a trailing * wildcard, and the [pt], [mh], [ti], [tiab] tags. Tagged
+multi-word terms are phrases, as in PubMed. It is an approximation of
+PubMed's search. [mh] matches any heading containing
+the term, standing in for PubMed's explosion to narrower headings.
+Untagged terms are looked up in the title, abstract and headings, with no
+automatic term mapping. Filters that are not in the citation XML, such as
+open access[filter], match everything.
+
+No network access is needed. HEYDOC_PARSE_WORKERS sets the pool size.
+
+Usage:
+    python scrapers/pubmed_bulk.py DIR [--output PATH]
+"""
+
+import argparse
+import functools
+import gzip
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import pipeline
+from pubmed_api import (CSV_COLUMNS, SEARCH_FILTERS, SEARCH_QUERIES, article_entries,
+                        chunk_text, iter_pubmed_articles, write_csv)
+
+# Configuration
+FILE_PATTERN = re.compile(r'pubmed\d+n\d+\.xml(\.gz)?$')
+MIN_YEAR = int(SEARCH_FILTERS['mindate'])
+MAX_YEAR = int(SEARCH_FILTERS['maxdate'])
+
+_WORD = re.compile(r'[a-z0-9]+\*?')
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|(\[[^\]]*\])|([^\s()"\[\]]+))')
+_OPERATORS = ('AND', 'OR', 'NOT')
+
+# Search tags -> field matched locally; None matches every citation
+_TAGS = {
+    'pt': 'pt', 'publication type': 'pt',
+    'mh': 'mh', 'mesh': 'mh', 'mesh terms': 'mh', 'majr': 'mh',
+    'ti': 'ti', 'title': 'ti',
+    'tiab': 'tiab', 'title/abstract': 'tiab',
+    'filter': None, 'sb': None,
+}
+
+
+# ============================================================================
+# Local query matching
+# ============================================================================
+
+def _words(text: str) -> list[str]:
+    return _WORD.findall(text.lower())
+
+
+class _Citation:
+    """The searchable fields of one citation, tokenized once for all
+    queries."""
+
+    __slots__ = ('title', 'tiab', 'title_words', 'tiab_words', 'publication_types', 'mesh')
+
+    def __init__(self, article: dict):
+        self.title = _words(article['title'])
+        self.tiab = self.title + _words(article['abstract'])
+        self.title_words = set(self.title)
+        self.tiab_words = set(self.tiab)
+        # Compared as space-joined words, like the query terms; a publication
+        # type is also known by its name before the comma, so that
+        # "clinical trial"[pt] covers "Clinical Trial, Phase III"
+        self.publication_types = {' '.join(_words(name))
+                                  for p in article['publication_types']
+                                  for name in (p, p.split(',')[0])}
+        self.mesh = [' '.join(_words(m)) for m in article['mesh']]
+
+
+def _word_matches(word: str, token: str) -> bool:
+    return token.startswith(word[:-1]) if word.endswith('*') else token == word
+
+
+@dataclass(frozen=True)
+class _Term:
+    """A search term: words, as a phrase (adjacent, in order) or not, in a
+    field."""
+    words: tuple
+    phrase: bool
+    field: Optional[str] = 'all'
+
+    def _in_text(self, tokens: list[str], vocabulary: set) -> bool:
+        for word in self.words:
+            if word.endswith('*'):
+                if not any(token.startswith(word[:-1]) for token in vocabulary):
+                    return False
+            elif word not in vocabulary:
+                return False
+        if not self.phrase or len(self.words) < 2:
+            return True
+        n = len(self.words)
+        return any(all(_word_matches(word, token) for word, token in zip(self.words, tokens[i:i + n]))
+                   for i in range(len(tokens) - n + 1))
+
+    def matches(self, citation: _Citation) -> bool:
+        text = ' '.join(self.words)
+        if self.field is None:
+            return True
+        if self.field == 'pt':
+            return text in citation.publication_types
+        if self.field == 'mh':
+            return any(text in heading for heading in citation.mesh)
+        if self.field == 'ti':
+            return self._in_text(citation.title, citation.title_words)
+        if self.field == 'tiab':
+            return self._in_text(citation.tiab, citation.tiab_words)
+        return (self._in_text(citation.tiab, citation.tiab_words)
+                or any(text in heading for heading in citation.mesh))
+
+
+def _parse_query(query: str) -> list:
+    """Tokens of a query: '(' / ')', operators, and _Terms.
+
+    As in PubMed, a [tag] applies to all the bare words before it, which
+    are then searched as a phrase: pain management[tiab] does not match
+    "management of back pain". Untagged bare words are separate terms,
+    ANDed (PubMed's automatic term mapping is not reproduced), except that
+    a hyphenated word such as over-the-counter is a phrase of its parts.
+    """
+    tokens = []
+    words: list[str] = []
+
+    def flush(tag: Optional[str] = None, phrase: bool = False):
+        if not words:
+            return
+        if tag is None and not phrase:
+            for word in words:
+                parts = tuple(_words(word))
+                if parts:
+                    tokens.append(_Term(parts, True))
+        else:
+            field = 'all' if tag is None else _TAGS.get(tag.strip('[]').lower(), 'all')
+            tokens.append(_Term(tuple(_words(' '.join(words))), True, field))
+        words.clear()
+
+    position = 0
+    while position < len(query):
+        match = _TOKEN.match(query, position)
+        if match is None or match.end() == position:
+            break
+        position = match.end()
+        opening, closing, quoted, tag, bare = match.groups()
+        if tag is not None:
+            if tokens and not words and isinstance(tokens[-1], _Term):
+                # A tag right after a quoted phrase
+                term = tokens.pop()
+                words.extend(term.words)
+                flush(tag, phrase=True)
+            else:
+                flush(tag)
+        elif quoted is not None:
+            flush()
+            words.append(quoted)
+            flush(phrase=True)
+        elif bare is not None and bare in _OPERATORS:
+            flush()
+            tokens.append(bare)
+        elif bare is not None:
+            words.append(bare)
+        else:
+            flush()
+            tokens.append('(' if opening else ')')
+    flush()
+    return tokens
+
+
+def _evaluate(tokens: list, position: int, citation: _Citation) -> tuple[bool, int]:
+    """Evaluate tokens from position up to the closing parenthesis (or the
+    end), left to right with no operator precedence, as PubMed does.
+    Returns the result and the position after it."""
+    result = None
+    operator = 'AND'
+    while position < len(tokens):
+        token = tokens[position]
+        position += 1
+        if token == ')':
+            break
+        if token in _OPERATORS:
+            operator = token
+            continue
+        if token == '(':
+            value, position = _evaluate(tokens, position, citation)
+        else:
+            value = token.matches(citation)
+        if result is None:
+            result = value
+        elif operator == 'AND':
+            result = result and value
+        elif operator == 'OR':
+            result = result or value
+        else:
+            result = result and not value
+        operator = 'AND'  # terms without an operator between them
+    return bool(result), position
+
+
+class QueryMatcher:
+    """SEARCH_QUERIES-style PubMed queries, matched against citations
+    locally (see the module docstring for what is supported)."""
+
+    def __init__(self, queries: tuple):
+        self.queries = queries
+        self._parsed = [_parse_query(query) for query in queries]
+
+    def matching(self, article: dict) -> list[str]:
+        """The queries an article (a record of iter_pubmed_articles) matches,
+        in query order; none if it is outside the date range."""
+        year = article.get('year')
+        if year is None or not MIN_YEAR <= year <= MAX_YEAR:
+            return []
+        citation = _Citation(article)
+        return [query for query, tokens in zip(self.queries, self._parsed)
+                if _evaluate(tokens, 0, citation)[0]]
+
+
+@functools.lru_cache(maxsize=4)
+def _matcher(queries: tuple) -> QueryMatcher:
+    return QueryMatcher(queries)
+
+
+# ============================================================================
+# Ingest
+# ============================================================================
+
+@dataclass
+class FileResult:
+    """What one baseline / update file contributed."""
+    citations: int = 0  # citations with a usable abstract
+    matches: list = field(default_factory=list)  # (article, chunks, queries)
+    unmatched: list = field(default_factory=list)  # PMIDs read that match no query
+    deleted: list = field(default_factory=list)  # PMIDs withdrawn by the file
+
+
+def ingest_file(job: tuple, path: str) -> FileResult:
+    """Parse stage (runs in a worker): stream one file and match its
+    citations against the job's queries."""
+    _, queries = job
+    matcher = _matcher(queries)
+    result = FileResult()
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        for article in iter_pubmed_articles(f, deleted=result.deleted):
+            result.citations += 1
+            matched = matcher.matching(article)
+            if not matched:
+                result.unmatched.append(article['pmid'])
+                continue
+            # Only what the CSV needs goes back to the writer
+            slim = {key: article[key] for key in ('pmid', 'title', 'url')}
+            result.matches.append((slim, chunk_text(article['content']), matched))
+    return result
+
+
+def find_files(directory: str) -> list[str]:
+    """Baseline and update files in directory, in the order to apply them
+    (their numbering continues from the baseline into the updates)."""
+    names = sorted(name for name in os.listdir(directory) if FILE_PATTERN.search(name))
+    return [os.path.join(directory, name) for name in names]
+
+
+def ingest(directory: str, queries: tuple = tuple(SEARCH_QUERIES),
+           workers: Optional[int] = None,
+           progress: Optional[Callable[[str, FileResult], None]] = None) -> list:
+    """RagEntry rows for every citation in the directory's files that
+    matches one of queries, after updates and deletions."""
+    current = {}  # PMID -> (article, chunks, queries), latest version
+    totals = Counter()
+
+    def write(job, result: Optional[FileResult]):
+        path, _ = job
+        if result is None:
+            print(f"  Skipped {os.path.basename(path)} (could not be read)", flush=True)
+            return
+        for pmid in result.unmatched:
+            current.pop(pmid, None)  # a revision that no longer matches
+        for pmid in result.deleted:
+            current.pop(pmid, None)
+        for article, chunks, matched in result.matches:
+            current[article['pmid']] = (article, chunks, matched)
+        totals['files'] += 1
+        totals['citations'] += result.citations
+        totals['deleted'] += len(result.deleted)
+        if progress is not None:
+            progress(path, result)
+
+    def fetch(job):
+        path, _ = job
+        return path if os.path.exists(path) else None
+
+    files = find_files(directory)
+    options = {} if workers is None else {'workers': workers}
+    pipeline.run('PubMed baseline', ((path, queries) for path in files), fetch, ingest_file,
+                 write, **options)
+
+    per_query = Counter(query for _, _, matched in current.values() for query in matched)
+    print(f"\n  {totals['files']} files, {totals['citations']:,} citations with abstracts, "
+          f"{totals['deleted']:,} deletions; {len(current):,} articles matched", flush=True)
+    for query in queries:
+        print(f"    {per_query[query]:>8,}  {query}", flush=True)
+
+    entries = []
+    for article, chunks, matched in current.values():
+        entries.extend(article_entries(article, chunks, matched))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directory', help='directory of pubmedNNnXXXX.xml.gz files')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         'pubmed_baseline.csv'))
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default HEYDOC_PARSE_WORKERS)')
+    args = parser.parse_args()
+
+    print("\n" + "="*60, flush=True)
+    print("HeyDoc PubMed Baseline Ingest", flush=True)
+    print("="*60, flush=True)
+    files = find_files(args.directory)
+    print(f"Directory: {args.directory} ({len(files)} files)", flush=True)
+    print(f"Queries: {len(SEARCH_QUERIES)}, published {MIN_YEAR}-{MAX_YEAR}", flush=True)
+    print("="*60, flush=True)
+    if not files:
+        parser.error(f"no pubmedNNnXXXX.xml.gz files in {args.directory}")
+
+    def progress(path, result):
+        print(f"  {os.path.basename(path)}: {result.citations:,} citations, "
+              f"{len(result.matches)} matched", flush=True)
+
+    entries = ingest(args.directory, workers=args.workers, progress=progress)
+
+    write_csv(entries, args.output)
+    print(f"\nTotal entries: {len(entries)} ({len(CSV_COLUMNS)} columns)", flush=True)
+    print(f"Output written to: {args.output}", flush=True)
+    pipeline.print_stats()
+    return entries
+
+
+if __name__ == '__main__':
+    main()
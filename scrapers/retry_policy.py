@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Retry Policy and Circuit Breaker
+Decides when the fetch layer retries a failed request and when it gives
+up on a host altogether.
+
+Retries use exponential backoff with full jitter, honour Retry-After, and
+only apply to idempotent requests that failed transiently (429, 5xx
+gateway errors, timeouts, dropped connections).
+
+Each host has a circuit breaker. After FAILURE_THRESHOLD consecutive
+failures (e.g. a site answering 403 to scrapers) the circuit opens and
+further requests fail immediately for OPEN_SECONDS, instead of each one
+paying the politeness delay just to be refused again. After that one
+trial request is let through (half-open); success closes the circuit.
+"""
+
+import email.utils
+import http.client
+import random
+import threading
+import time
+import urllib.error
+from dataclasses import dataclass
+from typing import Optional
+
+# Configuration
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0  # seconds, doubled on each retry
+MAX_BACKOFF = 60.0  # never sleep longer than this for one retry
+FAILURE_THRESHOLD = 3  # consecutive failures before a host's circuit opens
+OPEN_SECONDS = 300.0  # how long an open circuit rejects requests
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+# Statuses that say nothing about host health (the page just isn't there)
+NEUTRAL_STATUS = {404, 410}
+
+
+class CircuitOpenError(urllib.error.URLError):
+    """Raised instead of sending a request to a host whose circuit is open."""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"circuit open for {host} (retry in {retry_in:.0f}s)")
+        self.host = host
+        self.retry_in = retry_in
+
+
+@dataclass
+class HostRetryStats:
+    """Retry and circuit breaker counters for one host."""
+    retries: int = 0
+    backoff_seconds: float = 0.0
+    failed_attempts: int = 0
+    failed_seconds: float = 0.0  # wall time spent on failed attempts
+    circuit_opened: int = 0
+    rejected: int = 0  # requests refused by an open circuit
+
+    @property
+    def seconds_saved(self) -> float:
+        """Estimated time not spent on requests the open circuit refused."""
+        if not self.failed_attempts:
+            return 0.0
+        return self.rejected * self.failed_seconds / self.failed_attempts
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return Retry-After as seconds from now (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def is_retryable(method: str, error: BaseException, idempotent: Optional[bool] = None) -> bool:
+    """Whether a failed request may safely be sent again."""
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    if not idempotent or isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in RETRYABLE_STATUS
+    # Timeouts, resets and other network errors
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Seconds to wait before retry number attempt (0-based)."""
+    delay = random.uniform(0, min(MAX_BACKOFF, BACKOFF_BASE * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class CircuitBreaker:
+    """Thread-safe per-host circuit breaker with retry accounting."""
+
+    def __init__(self, threshold: int = FAILURE_THRESHOLD, open_seconds: float = OPEN_SECONDS):
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._failures: dict[str, int] = {}  # host -> consecutive failures
+        self._open_until: dict[str, float] = {}  # host -> monotonic reopen time
+        self._trial_in_flight: set[str] = set()
+        self._stats: dict[str, HostRetryStats] = {}
+
+    def _host_stats(self, host: str) -> HostRetryStats:
+        if host not in self._stats:
+            self._stats[host] = HostRetryStats()
+        return self._stats[host]
+
+    def before_request(self, host: str):
+        """Raise CircuitOpenError if host's circuit is open."""
+        with self._lock:
+            open_until = self._open_until.get(host)
+            if open_until is None:
+                return
+            now = time.monotonic()
+            if now >= open_until and host not in self._trial_in_flight:
+                self._trial_in_flight.add(host)  # half-open: let one through
+                return
+            self._host_stats(host).rejected += 1
+            retry_in = max(0.0, open_until - now)
+        raise CircuitOpenError(host, retry_in)
+
+    def record_success(self, host: str):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._open_until.pop(host, None)
+            self._trial_in_flight.discard(host)
+
+    def record_failure(self, host: str, error: BaseException, elapsed: float,
+                       final: bool = True):
+        """Count a failed attempt; open the circuit once the threshold is hit.
+
+        Only final failures (after retries) count towards opening the
+        circuit, so a single slow-to-recover page cannot trip it alone.
+        """
+        with self._lock:
+            stats = self._host_stats(host)
+            stats.failed_attempts += 1
+            stats.failed_seconds += elapsed
+
+            if not final:
+                return
+            if isinstance(error, urllib.error.HTTPError) and error.code in NEUTRAL_STATUS:
+                self._trial_in_flight.discard(host)
+                return
+
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            was_trial = host in self._trial_in_flight
+            self._trial_in_flight.discard(host)
+            if failures >= self.threshold or was_trial:
+                if host not in self._open_until or was_trial:
+                    stats.circuit_opened += 1
+                self._open_until[host] = time.monotonic() + self.open_seconds
+
+    def record_retry(self, host: str, delay: float):
+        with self._lock:
+            stats = self._host_stats(host)
+            stats.retries += 1
+            stats.backoff_seconds += delay
+
+    def stats(self) -> dict[str, HostRetryStats]:
+        """Per-host counters (copy)."""
+        with self._lock:
+            return {host: HostRetryStats(**vars(s)) for host, s in self._stats.items()}
+
+
+# Shared breaker for all scrapers in this process
+_BREAKER = CircuitBreaker()
+
+
+def get_breaker() -> CircuitBreaker:
+    """Return the process-wide circuit breaker."""
+    return _BREAKER
+
+
+def print_stats():
+    """Print retries and circuit breaker savings per host."""
+    stats = {host: s for host, s in _BREAKER.stats().items()
+             if s.retries or s.failed_attempts or s.rejected}
+    if not stats:
+        return
+
+    print("\nRetries / circuit breaker:", flush=True)
+    for host, s in sorted(stats.items()):
+        line = (f"  - {host}: {s.retries} retries ({s.backoff_seconds:.1f}s backoff), "
+                f"{s.failed_attempts} failed attempts")
+        if s.circuit_opened:
+            line += (f", circuit opened {s.circuit_opened}x, {s.rejected} requests skipped "
+                     f"(~{s.seconds_saved:.0f}s saved)")
+        print(line, flush=True)
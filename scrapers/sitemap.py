@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Sitemap Discovery
+Finds a source's pages, and when each last changed, from its sitemap.xml.
+
+discover() streams a sitemap through ElementTree.iterparse as it
+downloads - sitemap indexes are followed and gzipped sitemaps inflated on
+the fly - so even a site-wide sitemap of tens of thousands of URLs is
+never held in memory. Each <url> whose path matches the source's
+PathRules comes back with its <lastmod>.
+
+The scrapers pass that lastmod on to http_client.fetch_text: a page
+whose cached copy was stored after its lastmod is served from the
+on-disk cache without a request, so a refresh run only downloads the
+pages that changed (counted as 'unchanged' in the HTTP cache stats).
+A page without a lastmod is fetched as before.
+
+Sitemaps and the scrapers' own lists do not always spell a page's URL
+the same way (http or https, www. or not, a trailing slash or
+index.html), so lastmods are looked up by page_key.
+"""
+
+import re
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, Optional
+
+import http_client
+
+# Configuration
+MAX_SITEMAP_DEPTH = 2  # nested sitemap indexes followed below the root
+MAX_SITEMAPS = 50  # sitemap files read per discovery
+SITEMAP_TIMEOUT = 60
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_DATE_ONLY = re.compile(r'\d{4}-\d{2}-\d{2}')
+_INDEX_PAGE = re.compile(r'/index\.html?$', re.IGNORECASE)
+
+
+def page_key(url: str) -> str:
+    """The URL with the differences that do not change the page removed:
+    scheme, a leading www., a trailing slash or index.html, a fragment."""
+    parts = urllib.parse.urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix('www.')
+    path = _INDEX_PAGE.sub('/', parts.path).rstrip('/')
+    return f"{host}{path}?{parts.query}" if parts.query else f"{host}{path}"
+
+
+@dataclass(frozen=True)
+class PathRules:
+    """Which sitemap URLs belong to a source.
+
+    include is matched against the whole URL path; its last group, if it
+    has one, is the page's slug. A path containing any exclude substring
+    (case-insensitive) is dropped. follow, if set, limits which child
+    sitemaps of an index are read. pages, if set, is the page_keys of the
+    only pages wanted (see listed()).
+    """
+    include: str
+    exclude: tuple = ()
+    follow: Optional[str] = None
+    pages: Optional[frozenset] = None
+
+    @classmethod
+    def listed(cls, urls: Iterable[str], exclude: tuple = ()) -> 'PathRules':
+        """Rules matching only the given pages, for a source whose page
+        list comes from elsewhere and which reads the sitemap just for
+        lastmods. discover() stops once it has found all of them."""
+        return cls(include=r'/.*', exclude=exclude, pages=frozenset(page_key(url) for url in urls))
+
+    def slug(self, url: str) -> Optional[str]:
+        """The slug of a matching URL, or None if the URL does not match."""
+        if self.pages is not None and page_key(url) not in self.pages:
+            return None
+        path = re.sub(r'^[a-z]+://[^/]+', '', url, flags=re.IGNORECASE).split('?')[0]
+        match = re.fullmatch(self.include, path)
+        if match is None or any(x in path.lower() for x in self.exclude):
+            return None
+        return match.group(match.lastindex) if match.lastindex else path
+
+    def follows(self, url: str) -> bool:
+        return self.follow is None or re.search(self.follow, url) is not None
+
+
+@dataclass
+class SitemapEntry:
+    """A page listed in a sitemap."""
+    url: str
+    slug: str
+    lastmod: Optional[float]  # epoch seconds, None if not given or unparseable
+
+
+def parse_lastmod(text: Optional[str]) -> Optional[float]:
+    """Epoch seconds for a W3C datetime <lastmod>.
+
+    A date without a time counts as the end of that day, so a page changed
+    later on the day we fetched it is not mistaken for unchanged.
+    """
+    text = (text or '').strip()
+    try:
+        if _DATE_ONLY.fullmatch(text):
+            day = datetime.strptime(text, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            return (day + timedelta(days=1)).timestamp()
+        moment = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def slug_title(slug: str) -> str:
+    """Readable title for a page known only by its slug ('green-tea',
+    'VitaminB12')."""
+    words = re.sub(r'(?<=[a-z0-9])(?=[A-Z])|(?<=[a-z])(?=[0-9])', ' ', slug.replace('-', ' '))
+    return ' '.join(word[:1].upper() + word[1:] for word in words.split())
+
+
+class _Body:
+    """File-like view of a streamed body for iterparse, inflating gzipped
+    sitemaps (served as application/gzip rather than Content-Encoding)."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._head = b''
+        self._inflate = None
+        self._sniffed = False
+        self._done = False
+
+    def read(self, size: int = -1) -> bytes:
+        for chunk in self._chunks:
+            if not self._sniffed:
+                self._head += chunk
+                if len(self._head) < 2:
+                    continue
+                chunk, self._head = self._head, b''
+                self._sniffed = True
+                if chunk.startswith(_GZIP_MAGIC):
+                    self._inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = self._inflate.decompress(chunk) if self._inflate else chunk
+            if data:
+                return data
+
+        if self._done:
+            return b''
+        self._done = True
+        return self._inflate.flush() if self._inflate else self._head
+
+
+def _local(tag: str) -> str:
+    return tag.rpartition('}')[2]
+
+
+def iter_sitemap(url: str, headers: Optional[dict] = None,
+                 pace: Optional[Callable[[str], None]] = None) -> Iterator[tuple[str, str, Optional[str]]]:
+    """Stream one sitemap file, yielding (kind, loc, lastmod) per entry.
+
+    kind is 'url' for a page and 'sitemap' for a child of a sitemap index.
+    Elements are cleared as soon as they have been read.
+    """
+    stream = http_client.request_with_retries('GET', url, headers=headers,
+                                              timeout=SITEMAP_TIMEOUT, pace=pace, stream=True)
+    with stream:
+        root = None
+        fields = {}
+        for event, elem in ET.iterparse(_Body(stream.chunks()), events=('start', 'end')):
+            if root is None:
+                root = elem
+            if event == 'start':
+                continue
+            name = _local(elem.tag)
+            if name in ('loc', 'lastmod'):
+                fields[name] = (elem.text or '').strip()
+            elif name in ('url', 'sitemap'):
+                if fields.get('loc'):
+                    yield name, fields['loc'], fields.get('lastmod')
+                fields = {}
+                root.clear()
+
+
+# ============================================================================
+# Discovery
+# ============================================================================
+
+@dataclass
+class DiscoveryStats:
+    """Sitemap reading totals for one source."""
+    sitemaps: int = 0
+    listed: int = 0  # <url> entries read
+    kept: int = 0  # entries matching the source's rules
+    with_lastmod: int = 0
+    seconds: float = 0.0
+    errors: int = 0
+
+
+_STATS: dict[str, DiscoveryStats] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def discover(source: str, sitemap_url: str, rules: PathRules,
+             headers: Optional[dict] = None,
+             pace: Optional[Callable[[str], None]] = None) -> list[SitemapEntry]:
+    """Pages of a source listed in its sitemap (following sitemap indexes).
+
+    Returns [] if the root sitemap cannot be read; a child sitemap that
+    fails is reported and skipped. With rules.pages, no further sitemap
+    file is read once every wanted page has been found.
+    """
+    started = time.perf_counter()
+    stats = DiscoveryStats()
+    entries: dict[str, SitemapEntry] = {}
+    found: set[str] = set()  # page_keys of the entries, when rules.pages is set
+    queue = [(sitemap_url, 0)]
+    seen = {sitemap_url}
+
+    while queue and stats.sitemaps < MAX_SITEMAPS:
+        if rules.pages is not None and len(found) == len(rules.pages):
+            break
+        url, depth = queue.pop(0)
+        stats.sitemaps += 1
+        try:
+            for kind, loc, lastmod in iter_sitemap(url, headers=headers, pace=pace):
+                if kind == 'sitemap':
+                    if depth < MAX_SITEMAP_DEPTH and loc not in seen and rules.follows(loc):
+                        seen.add(loc)
+                        queue.append((loc, depth + 1))
+                    continue
+
+                stats.listed += 1
+                slug = rules.slug(loc)
+                if slug is None:
+                    continue
+                modified = parse_lastmod(lastmod)
+                if rules.pages is not None:
+                    found.add(page_key(loc))
+                known = entries.get(loc)
+                if known is None:
+                    entries[loc] = SitemapEntry(url=loc, slug=slug, lastmod=modified)
+                elif modified is not None and (known.lastmod is None or modified > known.lastmod):
+                    known.lastmod = modified
+        except Exception as e:
+            stats.errors += 1
+            print(f"  Error reading sitemap {url}: {e}", flush=True)
+
+    stats.kept = len(entries)
+    stats.with_lastmod = sum(1 for entry in entries.values() if entry.lastmod is not None)
+    stats.seconds = time.perf_counter() - started
+    with _STATS_LOCK:
+        _STATS[source] = stats
+    print(f"  Sitemap: {stats.kept} of {stats.listed} listed pages match "
+          f"({stats.with_lastmod} with lastmod, {stats.sitemaps} sitemap files)", flush=True)
+    return list(entries.values())
+
+
+class Lastmods:
+    """lastmod lookup for discovered entries by URL, in any of the forms
+    page_key treats as the same page."""
+
+    def __init__(self, entries: list[SitemapEntry]):
+        self._by_key: dict[str, Optional[float]] = {}
+        for entry in entries:
+            key = page_key(entry.url)
+            known = self._by_key.get(key)
+            if known is None or (entry.lastmod is not None and entry.lastmod > known):
+                self._by_key[key] = entry.lastmod
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def __contains__(self, url: str) -> bool:
+        return page_key(url) in self._by_key
+
+    def get(self, url: str) -> Optional[float]:
+        return self._by_key.get(page_key(url))
+
+
+def lastmods(entries: list[SitemapEntry]) -> Lastmods:
+    """URL -> lastmod lookup for discovered entries."""
+    return Lastmods(entries)
+
+
+def stats() -> dict[str, DiscoveryStats]:
+    """Per-source discovery totals (copy)."""
+    with _STATS_LOCK:
+        return {source: DiscoveryStats(**vars(s)) for source, s in _STATS.items()}
+
+
+def print_stats():
+    """Print pages discovered per source."""
+    per_source = stats()
+    if not per_source:
+        return
+
+    print("\nSitemap discovery:", flush=True)
+    for source, s in sorted(per_source.items()):
+        line = (f"  - {source}: {s.kept} pages ({s.with_lastmod} with lastmod) from "
+                f"{s.listed:,} listed in {s.sitemaps} sitemap files, {s.seconds:.1f}s")
+        if s.errors:
+            line += f", {s.errors} unreadable"
+        print(line, flush=True)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tail Latency Control
+Adaptive per-host deadlines and hedged requests for the fetch layer.
+
+Every scraper passes a fixed timeout=30, so one stalled who.int or cdc.gov
+connection could hold a sequential crawl for 30 s. Once a host has enough
+samples in fetch_metrics, its socket timeout is derived from the observed
+latency instead (DEADLINE_MULTIPLIER x the p99 time to first byte plus
+connection setup), never above the caller's timeout. A timed-out attempt
+is then retried by the normal retry policy.
+
+Hedging (HEYDOC_HEDGE=1, idempotent GETs only): if a request has not
+completed after the host's p95 latency, a second copy is sent - after
+waiting for the host's politeness slot like any other request - and
+whichever finishes first wins. print_stats() reports how often hedges
+fired and won, and the tail time they saved.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import fetch_metrics
+
+# Configuration
+MIN_SAMPLES = 10  # requests to a host before its latency is trusted
+DEADLINE_MULTIPLIER = 4.0
+MIN_DEADLINE = 5.0  # seconds - never cut a host off faster than this
+HEDGE_ENABLED = os.environ.get('HEYDOC_HEDGE', '0') == '1'
+HEDGE_PERCENTILE = 95
+MIN_HEDGE_DELAY = 0.25  # seconds
+RECOMPUTE_EVERY = 10  # new samples before a host's percentiles are refreshed
+
+
+@dataclass
+class HostLatency:
+    """Latency-derived limits for one host."""
+    samples: int = 0
+    deadline: Optional[float] = None  # socket timeout, None until MIN_SAMPLES
+    hedge_delay: Optional[float] = None
+
+
+@dataclass
+class HedgeStats:
+    """Hedging counters for one host."""
+    fired: int = 0
+    won: int = 0  # hedges that finished before the original request
+    seconds_saved: float = 0.0  # how much later the originals of won hedges finished
+
+
+class TailLatency:
+    """Thread-safe per-host deadlines and hedge accounting."""
+
+    def __init__(self, collector: Optional[fetch_metrics.MetricsCollector] = None):
+        self.collector = collector or fetch_metrics.get_collector()
+        self._lock = threading.Lock()
+        self._hosts: dict[str, HostLatency] = {}
+        self._stats: dict[str, HedgeStats] = {}
+
+    def _latency(self, host: str) -> HostLatency:
+        with self._lock:
+            latency = self._hosts.setdefault(host, HostLatency())
+            cached_at = latency.samples
+
+        totals = self.collector.samples(host, 'total')
+        if len(totals) < MIN_SAMPLES or len(totals) - cached_at < RECOMPUTE_EVERY:
+            return latency
+
+        setup = [sum(phases) for phases in zip(self.collector.samples(host, 'dns'),
+                                                self.collector.samples(host, 'connect'),
+                                                self.collector.samples(host, 'tls'))]
+        first_byte = self.collector.samples(host, 'ttfb')
+        wait = (fetch_metrics.percentile(setup, 99)
+                + fetch_metrics.percentile(first_byte, 99))
+        with self._lock:
+            latency.samples = len(totals)
+            latency.deadline = max(MIN_DEADLINE, DEADLINE_MULTIPLIER * wait)
+            latency.hedge_delay = max(MIN_HEDGE_DELAY,
+                                      fetch_metrics.percentile(totals, HEDGE_PERCENTILE))
+        return latency
+
+    def timeout_for(self, host: str, timeout: Optional[float]) -> Optional[float]:
+        """Socket timeout for the next request to host (at most timeout)."""
+        deadline = self._latency(host).deadline
+        if deadline is None:
+            return timeout
+        return deadline if timeout is None else min(timeout, deadline)
+
+    def hedge_delay(self, host: str) -> Optional[float]:
+        """Seconds to wait before hedging a request to host, or None if the
+        host has too few samples to hedge yet."""
+        return self._latency(host).hedge_delay
+
+    def record_hedge(self, host: str):
+        with self._lock:
+            self._stats.setdefault(host, HedgeStats()).fired += 1
+
+    def record_hedge_won(self, host: str):
+        with self._lock:
+            self._stats.setdefault(host, HedgeStats()).won += 1
+
+    def record_saved(self, host: str, seconds: float):
+        """Add the time between a winning hedge and its original finishing."""
+        with self._lock:
+            self._stats.setdefault(host, HedgeStats()).seconds_saved += max(0.0, seconds)
+
+    def stats(self) -> dict[str, HedgeStats]:
+        """Per-host hedge counters (copy)."""
+        with self._lock:
+            return {host: HedgeStats(**vars(s)) for host, s in self._stats.items()}
+
+    def deadlines(self) -> dict[str, float]:
+        """Current adaptive deadline per host (hosts with enough samples only)."""
+        with self._lock:
+            return {host: l.deadline for host, l in self._hosts.items() if l.deadline}
+
+
+# Shared state for all scrapers in this process
+_TAIL = TailLatency()
+
+
+def get_tail_latency() -> TailLatency:
+    """Return the process-wide deadline / hedging state."""
+    return _TAIL
+
+
+def print_stats():
+    """Print adaptive deadlines and hedging savings per host."""
+    deadlines = _TAIL.deadlines()
+    stats = _TAIL.stats()
+    if not deadlines and not stats:
+        return
+
+    print("\nTail latency:", flush=True)
+    for host in sorted(set(deadlines) | set(stats)):
+        line = f"  - {host}:"
+        if host in deadlines:
+            line += f" deadline {deadlines[host]:.1f}s"
+        s = stats.get(host)
+        if s is not None and s.fired:
+            line += (f"{',' if host in deadlines else ''} {s.fired} hedged requests, "
+                     f"{s.won} won, {s.seconds_saved:.1f}s tail time saved")
+        print(line, flush=True)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+PubMed Bulk Matching Test
+Offline check of pubmed_bulk's local matcher against SEARCH_QUERIES.
+
+Builds a small baseline file and an update file of hand-written citations,
+each meant to match (or, as a near miss, not match) one of the real
+SEARCH_QUERIES, ingests them with pubmed_bulk.ingest(), and checks that
+the rows are the RagEntry rows pubmed_api.py writes for the same
+citations and queries. The near misses cover what a bag-of-words match
+gets wrong: a tagged term's words out of order or apart, as in "d
+vitamin" for vitamin D[tiab].
+
+No network access is needed.
+
+Usage:
+    python test_pubmed_bulk.py
+"""
+
+import gzip
+import os
+import sys
+import tempfile
+
+import pubmed_bulk
+from pubmed_api import SEARCH_QUERIES, article_entries, chunk_text, iter_pubmed_articles
+
+# Long enough for iter_pubmed_articles to keep the abstract
+FILLER = " The results are discussed in the context of earlier work." * 4
+
+SR = ["Systematic Review"]
+CT = ["Clinical Trial, Phase III"]
+DI = ["Drug Interactions"]
+
+# (pmid, title, abstract, publication types, MeSH headings, year, the
+# queries it should match)
+CITATIONS = [
+    (1, "Headache in adults", "Tension-type headache outcomes.", SR, [], 2020,
+     ['"systematic review"[pt] AND headache[tiab]']),
+    (2, "Pain management after surgery", "Opioid-sparing approaches.", SR, [], 2021,
+     ['"systematic review"[pt] AND pain management[tiab]']),
+    (3, "Management of back pain", "Exercise and education.", SR, [], 2021, []),
+    (4, "Vitamin D and falls", "Vitamin D supplementation in older adults.", CT, [], 2019,
+     ['"clinical trial"[pt] AND vitamin D[tiab]']),
+    (5, "Bone density", "Serum group d vitamin levels were measured.", CT, [], 2019, []),
+    (6, "Anxiety treatment in primary care", "Collaborative care.", SR, [], 2022,
+     ['"systematic review"[pt] AND anxiety treatment[tiab]']),
+    (7, "Treatment of anxiety", "Cognitive behavioural therapy.", SR, [], 2022, []),
+    (8, "Over-the-counter analgesics", "Interactions with warfarin.", ["Review"], DI, 2018,
+     ['"drug interactions"[mh] AND over-the-counter']),
+    (9, "Analgesics over the counter", "Counter-intuitive findings.", ["Review"], DI, 2018,
+     ['"drug interactions"[mh] AND over-the-counter']),
+    (10, "Common medications in the elderly", "Prescribing patterns.", ["Review"],
+     ["Drug Interactions"], 2017, ['"drug interactions"[mh] AND common medications']),
+    (11, "Medications in the elderly", "A common problem.", ["Review"], DI, 2017,
+     ['"drug interactions"[mh] AND common medications']),
+    (12, "Ginger for nausea", "Ginger in pregnancy.", CT, [], 2020,
+     ['"clinical trial"[pt] AND ginger[tiab]']),
+    (13, "Ginger for nausea", "Ginger in pregnancy.", CT, [], 2010, []),  # before the date filter
+    (14, "Cold symptoms in children", "Zinc and honey.", SR, [], 2016,
+     ['"systematic review"[pt] AND cold symptoms[tiab]']),
+    (15, "Symptoms of the common cold", "Zinc and honey.", SR, [], 2016, []),
+    (16, "Headache in adults", "Tension-type headache outcomes.", SR, [], 2020,
+     ['"systematic review"[pt] AND headache[tiab]']),
+]
+
+# The update revises 12 so it no longer matches, revises 3 so it does,
+# and deletes 16
+UPDATES = [
+    (12, "Herbal tea", "Taste preferences.", CT, [], 2020, []),
+    (3, "Pain management in back pain", "Exercise and education.", SR, [], 2021,
+     ['"systematic review"[pt] AND pain management[tiab]']),
+]
+DELETED = [16]
+
+
+def citation_xml(pmid, title, abstract, publication_types, mesh, year) -> str:
+    types = ''.join(f'<PublicationType>{p}</PublicationType>' for p in publication_types)
+    headings = ''.join(f'<MeshHeading><DescriptorName>{m}</DescriptorName></MeshHeading>'
+                       for m in mesh)
+    return (f'<PubmedArticle><MedlineCitation><PMID Version="1">{pmid}</PMID><Article>'
+            f'<Journal><JournalIssue><PubDate><Year>{year}</Year></PubDate></JournalIssue></Journal>'
+            f'<ArticleTitle>{title}</ArticleTitle>'
+            f'<Abstract><AbstractText>{abstract}{FILLER}</AbstractText></Abstract>'
+            f'<PublicationTypeList>{types}</PublicationTypeList></Article>'
+            f'<MeshHeadingList>{headings}</MeshHeadingList></MedlineCitation></PubmedArticle>')
+
+
+def write_file(path: str, citations: list, deleted: list = ()):
+    deletions = ''.join(f'<PMID Version="1">{pmid}</PMID>' for pmid in deleted)
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write('<PubmedArticleSet>')
+        f.write(''.join(citation_xml(*c[:6]) for c in citations))
+        if deleted:
+            f.write(f'<DeleteCitation>{deletions}</DeleteCitation>')
+        f.write('</PubmedArticleSet>')
+
+
+def expected_entries(citations: list, directory: str) -> list:
+    """The rows the E-utilities path writes for the citations that match,
+    from the same XML and the expected queries."""
+    queries = {str(c[0]): c[6] for c in citations}
+    path = os.path.join(directory, 'expected.xml.gz')
+    write_file(path, citations)
+    entries = []
+    with gzip.open(path, 'rb') as f:
+        for article in iter_pubmed_articles(f):
+            if queries[article['pmid']]:
+                entries.extend(article_entries(article, chunk_text(article['content']),
+                                               queries[article['pmid']]))
+    return entries
+
+
+def test_queries_parse():
+    for query in SEARCH_QUERIES:
+        assert pubmed_bulk._parse_query(query), query
+
+
+def test_matches():
+    matcher = pubmed_bulk.QueryMatcher(tuple(SEARCH_QUERIES))
+    with tempfile.TemporaryDirectory() as directory:
+        for citation in CITATIONS:
+            path = os.path.join(directory, f'{citation[0]}.xml.gz')
+            write_file(path, [citation])
+            with gzip.open(path, 'rb') as f:
+                articles = list(iter_pubmed_articles(f))
+            assert len(articles) == 1, citation[0]
+            matched = matcher.matching(articles[0])
+            assert matched == citation[6], f"PMID {citation[0]}: {matched} != {citation[6]}"
+
+
+def test_ingest_rows():
+    latest = {c[0]: c for c in CITATIONS}
+    latest.update({c[0]: c for c in UPDATES})
+    for pmid in DELETED:
+        del latest[pmid]
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_file(os.path.join(directory, 'pubmed26n0001.xml.gz'), CITATIONS)
+        write_file(os.path.join(directory, 'pubmed26n1300.xml.gz'), UPDATES, DELETED)
+        entries = pubmed_bulk.ingest(directory, workers=0)
+        expected = expected_entries(list(latest.values()), directory)
+
+    key = lambda entry: entry.id
+    assert sorted(entries, key=key) == sorted(expected, key=key)
+
+
+if __name__ == '__main__':
+    failed = 0
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            try:
+                test()
+                print(f"  ok    {name}", flush=True)
+            except AssertionError as e:
+                failed += 1
+                print(f"  FAIL  {name}: {e}", flush=True)
+    sys.exit(1 if failed else 0)
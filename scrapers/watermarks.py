@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Incremental Refresh Watermarks
+Per-query date of the last completed run, so a refresh only searches for
+what NCBI added since.
+
+pubmed_api.py and pmc_reviews.py used to search every query over its
+whole date range and re-fetch everything on each run, although only a
+few articles per query appear in a week. Now each scraper keeps a
+Watermarks file next to its CSV (e.g. pubmed_articles.watermarks.json)
+holding, per query, the day the last run that completed it started.
+
+On the next run, a query with a watermark is searched by Entrez date
+from that day (minus OVERLAP_DAYS, as edat days follow NCBI's clock
+rather than ours). IDs already in the CSV are skipped, and the new rows
+are appended without rewriting the file. Queries without a watermark,
+e.g. newly added ones, get the full search. A Run collects the queries
+whose results were all written (a run that stops at its target leaves
+the rest behind); if any efetch failed, no watermark moves, and the next
+refresh covers the same window again.
+
+HEYDOC_NCBI_FULL_REFRESH=1 ignores the watermarks and rewrites the CSV.
+So does a CSV whose header does not match the scraper's columns.
+"""
+
+import csv
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Iterable, Iterator, Optional
+
+# Configuration
+FULL_REFRESH = os.environ.get('HEYDOC_NCBI_FULL_REFRESH', '0') == '1'
+OVERLAP_DAYS = 1  # re-search this many days before the watermark
+
+
+def path_for(output_path: str) -> str:
+    """The watermark file that belongs to a scraper's CSV."""
+    return os.path.splitext(output_path)[0] + '.watermarks.json'
+
+
+def edat_clause(since: str) -> str:
+    """Search term restricting a query to Entrez dates from since on."""
+    return f'("{since}"[edat] : "3000"[edat])'
+
+
+class Watermarks:
+    """Per-query watermark dates, loaded from and saved to a JSON file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.marks: dict[str, str] = json.load(f)
+        except (OSError, ValueError):
+            self.marks = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.marks)
+
+    def since(self, query: str) -> Optional[str]:
+        """First Entrez date (YYYY/MM/DD) to search query from, or None
+        for a full search."""
+        mark = self.marks.get(query)
+        if mark is None:
+            return None
+        return (date.fromisoformat(mark) - timedelta(days=OVERLAP_DAYS)).strftime('%Y/%m/%d')
+
+    def advance(self, queries: Iterable[str], day: date):
+        for query in queries:
+            self.marks[query] = day.isoformat()
+
+    def save(self):
+        """Write the file atomically, so an interrupted save keeps the old
+        watermarks."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.marks, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def known_ids(csv_path: str, prefix: str, columns: list[str]) -> Optional[set]:
+    """Article IDs already in a scraper's CSV (entry ids are
+    prefix + ID, with _N appended for later chunks). None if the file is
+    missing or its header is not columns, so it cannot be appended to."""
+    try:
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            if next(reader, None) != columns:
+                return None
+            ids = set()
+            for row in reader:
+                if row and row[0].startswith(prefix):
+                    ids.add(row[0][len(prefix):].split('_')[0])
+            return ids
+    except OSError:
+        return None
+
+
+@dataclass
+class Run:
+    """One scraper run: whether it is incremental, and what it covered,
+    for advancing the watermarks afterwards."""
+    store: Optional[Watermarks] = None
+    known: Optional[set] = None  # IDs already in the CSV; None for a full run
+    day: date = field(default_factory=date.today)
+    done: set = field(default_factory=set)  # queries whose results were all written
+    incomplete: bool = False  # an efetch failed
+
+    @property
+    def incremental(self) -> bool:
+        return self.known is not None
+
+    def since(self, query: str) -> Optional[str]:
+        """Entrez date to search query from, None for a full search."""
+        return self.store.since(query) if self.incremental else None
+
+    def is_known(self, id_: str) -> bool:
+        return self.known is not None and id_ in self.known
+
+    def completed(self) -> set:
+        """Queries whose watermark may advance."""
+        return set() if self.incomplete else set(self.done)
+
+
+def completing(run: Run, jobs: Iterable[tuple], queries: Iterable[str]) -> Iterator[tuple]:
+    """jobs with one more element: the queries that are done once that
+    job's results are written - all of queries on the last job, () on the
+    others. Without any jobs, the queries have nothing to write and are
+    done right away."""
+    queries = tuple(queries)
+    previous = None
+    for job in jobs:
+        if previous is not None:
+            yield previous + ((),)
+        previous = job
+    if previous is None:
+        run.done.update(queries)
+    else:
+        yield previous + (queries,)
+
+
+def start(output_path: str, prefix: str, columns: list[str]) -> Run:
+    """Set up a run for the scraper writing output_path: incremental if it
+    has watermarks and its CSV can be appended to."""
+    store = Watermarks(path_for(output_path))
+    if FULL_REFRESH or not store:
+        return Run(store)
+    known = known_ids(output_path, prefix, columns)
+    if known is None:
+        print(f"  {os.path.basename(output_path)} cannot be appended to; running a full refresh",
+              flush=True)
+    return Run(store, known)
+
+
+def finish(run: Run):
+    """Advance the watermarks of the queries the run completed and save.
+    A full run rewrote the CSV, so older watermarks no longer apply."""
+    completed = run.completed()
+    if not run.incremental:
+        run.store.marks = {}
+    run.store.advance(completed, run.day)
+    run.store.save()
+    print(f"Watermarks: {len(completed)} queries advanced to {run.day.isoformat()}"
+          + (" (held back: an efetch failed)" if run.incomplete else "")
+          + f" ({run.store.path})", flush=True)
@@ -10,16 +10,22 @@ Note: Uses polite scraping with 2-3 second delays
 
 import csv
 import re
-import time
-import urllib.request
 import urllib.error
 import urllib.parse
 import sys
 from datetime import date
 from dataclasses import dataclass
-from html.parser import HTMLParser
 from typing import Optional
-import random
+
+import boilerplate
+import crawl_engine
+import fetch_metrics
+import http_client
+import page_guard
+import pipeline
+import sitemap
+from html_text import (Selector, extract_all, extract_regions, extract_text, first_long_region,
+                       section_after)
 
 # Configuration
 REQUEST_DELAY_MIN = 2.0  # Minimum seconds between requests
@@ -44,71 +50,27 @@ class RagEntry:
     date_accessed: str
     text_chunk: str
     category: str
+    section: str = ""  # heading path of the chunk within its page
 
 
-class TextExtractor(HTMLParser):
-    """Extract clean text from HTML, preserving some structure."""
-
-    def __init__(self):
-        super().__init__()
-        self.text_parts = []
-        self.skip_tags = {'script', 'style', 'nav', 'header', 'footer', 'aside', 'noscript'}
-        self.current_skip = 0
-
-    def handle_starttag(self, tag, attrs):
-        if tag in self.skip_tags:
-            self.current_skip += 1
-        if tag in ('p', 'li', 'h1', 'h2', 'h3', 'h4', 'br', 'div'):
-            self.text_parts.append(' ')
-
-    def handle_endtag(self, tag):
-        if tag in self.skip_tags:
-            self.current_skip = max(0, self.current_skip - 1)
-        if tag in ('p', 'li', 'h1', 'h2', 'h3', 'h4'):
-            self.text_parts.append(' ')
-
-    def handle_data(self, data):
-        if self.current_skip == 0:
-            self.text_parts.append(data)
-
-    def get_text(self) -> str:
-        text = ' '.join(self.text_parts)
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
-
-
-def extract_text(html: str) -> str:
-    """Extract clean text from HTML."""
-    parser = TextExtractor()
-    try:
-        parser.feed(html)
-    except Exception:
-        pass
-    return parser.get_text()
-
-
-def fetch_url(url: str, delay: bool = True) -> Optional[str]:
-    """Fetch URL content with polite random delay."""
-    if delay:
-        delay_time = random.uniform(REQUEST_DELAY_MIN, REQUEST_DELAY_MAX)
-        time.sleep(delay_time)
-
+def fetch_url(url: str, delay: bool = True, lastmod: Optional[float] = None) -> Optional[str]:
+    """Fetch URL content with polite random delay (a cached copy newer than
+    the sitemap's lastmod is used without a request)."""
     headers = {
         'User-Agent': USER_AGENT,
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
         'Accept-Language': 'en-US,en;q=0.5',
     }
-    req = urllib.request.Request(url, headers=headers)
-
     try:
-        with urllib.request.urlopen(req, timeout=30) as response:
-            return response.read().decode('utf-8', errors='ignore')
+        return http_client.fetch_text(url, headers=headers, timeout=30,
+                                      pace=crawl_engine.pacer(REQUEST_DELAY_MIN, REQUEST_DELAY_MAX,
+                                                             wait=delay),
+                                      lastmod=lastmod)
     except urllib.error.HTTPError as e:
         if e.code == 403:
             print(f"  Access denied (403)", flush=True)
         elif e.code == 429:
-            print(f"  Rate limited (429) - waiting longer", flush=True)
-            time.sleep(10)
+            print(f"  Rate limited (429) - gave up after retries", flush=True)
         else:
             print(f"  HTTP Error {e.code}", flush=True)
         return None
@@ -223,83 +185,114 @@ WHO_TOPICS = [
 ]
 
 
-def get_who_topic_page(topic_slug: str, topic_name: str) -> Optional[dict]:
-    """Fetch and parse a WHO health topic page."""
-    url = f"https://www.who.int/health-topics/{topic_slug}"
+WHO_SITEMAP = "https://www.who.int/sitemap.xml"
+TOPIC_URL = "https://www.who.int/health-topics/{}"
+FACTSHEET_URL = "https://www.who.int/news-room/fact-sheets/detail/{}"
 
-    html = fetch_url(url)
-    if not html:
-        return None
+# English topic pages and fact sheets (the sitemap also lists every translation)
+WHO_PAGES = sitemap.PathRules(include=r'/(?:health-topics|news-room/fact-sheets/detail)/([a-z0-9-]+)')
+
+
+def get_who_topics() -> tuple[list[tuple[str, str]], sitemap.Lastmods]:
+    """Curated topics followed by any other health topic in the WHO
+    sitemap, plus the sitemap's lastmod for every topic and fact sheet URL."""
+    print("Fetching WHO sitemap...", flush=True)
+
+    pages = sitemap.discover('WHO', WHO_SITEMAP, WHO_PAGES,
+                             headers={'User-Agent': USER_AGENT},
+                             pace=crawl_engine.pacer(REQUEST_DELAY_MIN, REQUEST_DELAY_MAX,
+                                                     wait=False))
+    curated = {slug for slug, _ in WHO_TOPICS}
+    added = [(page.slug, sitemap.slug_title(page.slug)) for page in pages
+             if page.url == TOPIC_URL.format(page.slug) and page.slug not in curated]
+    if added:
+        print(f"  {len(added)} health topics not in the curated list", flush=True)
+    return WHO_TOPICS + added, sitemap.lastmods(pages)
+
+
+WHO_TOPIC_BOILERPLATE = [
+    r'Share.*?Facebook.*?Twitter.*?LinkedIn.*',
+    r'WHO response.*',
+    r'More.*?WHO.*',
+    r'Related links.*',
+    r'See all.*',
+    r'Download.*PDF.*',
+    r'©.*WHO.*',
+]
+
+
+TOPIC_REGIONS = [
+    # Key facts
+    Selector('section', class_contains='key-facts'),
+    Selector('div', class_contains='key-facts'),
+    # Overview
+    Selector('section', class_contains='overview'),
+    Selector('div', class_contains='sf-content-block'),
+    Selector('section', id='tab-overview'),
+    # Main content area
+    Selector('main'),
+    Selector('article'),
+    Selector('div', class_contains='content'),
+]
+SECTION_END = ('<h[23]', '</section')
+
+
+def _section_text(html: str, regions: list, heading: str, min_length: int) -> Optional[str]:
+    """First region longer than min_length, else the text after the section
+    heading if that is long enough."""
+    for text in regions:
+        if text and len(text) > min_length:
+            return text
+    marked = section_after(html, heading, SECTION_END)
+    if marked is not None:
+        text = extract_text(marked)
+        if len(text) > min_length:
+            return text
+    return None
+
+
+def topic_text(html: str, topic_name: str,
+               budget: Optional[page_guard.PageBudget] = None) -> str:
+    """Key facts and overview of a health topic page, or its main content."""
+    regions = extract_regions(html, TOPIC_REGIONS, budget=budget)
 
     content_parts = []
     content_parts.append(f"WHO Health Topic: {topic_name}")
 
     # Try to extract key facts section
-    key_facts_patterns = [
-        r'<section[^>]*class="[^"]*key-facts[^"]*"[^>]*>(.*?)</section>',
-        r'<div[^>]*class="[^"]*key-facts[^"]*"[^>]*>(.*?)</div>',
-        r'Key facts(.*?)(?=<h[23]|</section)',
-    ]
-
-    for pattern in key_facts_patterns:
-        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
-        if match:
-            key_facts = extract_text(match.group(1))
-            if len(key_facts) > 50:
-                content_parts.append(f"\nKey Facts: {key_facts}")
-                break
+    key_facts = _section_text(html, regions[0:2], 'Key facts', 50)
+    if key_facts:
+        content_parts.append(f"\nKey Facts: {key_facts}")
 
     # Try to extract overview section
-    overview_patterns = [
-        r'<section[^>]*class="[^"]*overview[^"]*"[^>]*>(.*?)</section>',
-        r'<div[^>]*class="[^"]*sf-content-block[^"]*"[^>]*>(.*?)</div>',
-        r'<section[^>]*id="tab-overview"[^>]*>(.*?)</section>',
-        r'Overview(.*?)(?=<h[23]|</section)',
-    ]
-
-    for pattern in overview_patterns:
-        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
-        if match:
-            overview = extract_text(match.group(1))
-            if len(overview) > 100:
-                content_parts.append(f"\nOverview: {overview}")
-                break
+    overview = _section_text(html, regions[2:5], 'Overview', 100)
+    if overview:
+        content_parts.append(f"\nOverview: {overview}")
 
     # Try main content area
-    main_patterns = [
-        r'<main[^>]*>(.*?)</main>',
-        r'<article[^>]*>(.*?)</article>',
-        r'<div[^>]*class="[^"]*content[^"]*"[^>]*>(.*?)</div>',
-    ]
-
-    main_content = ""
-    for pattern in main_patterns:
-        match = re.search(pattern, html, re.DOTALL | re.IGNORECASE)
-        if match:
-            main_content = extract_text(match.group(1))
-            if len(main_content) > 200:
-                break
+    main_content = first_long_region(regions[5:], 200)
 
     # If we didn't get key facts or overview, use main content
     if len(' '.join(content_parts)) < 200 and main_content:
         content_parts.append(f"\n{main_content[:2000]}")
 
+    return ' '.join(content_parts)
+
+
+def parse_who_topic_page(job: tuple, html: str) -> Optional[dict]:
+    """Parse stage: title, url and chunks of a fetched WHO health topic page."""
+    _, topic_slug, topic_name, _ = job
+    url = TOPIC_URL.format(topic_slug)
+
+    content = page_guard.extract(
+        'WHO', url, html, lambda page, budget: topic_text(page, topic_name, budget),
+        fallback=lambda page: f"WHO Health Topic: {topic_name} {page_guard.main_text(page)[:2000]}")
+
     # Clean up content
-    content = ' '.join(content_parts)
     content = re.sub(r'\s+', ' ', content).strip()
 
     # Remove boilerplate
-    boilerplate = [
-        r'Share.*?Facebook.*?Twitter.*?LinkedIn.*',
-        r'WHO response.*',
-        r'More.*?WHO.*',
-        r'Related links.*',
-        r'See all.*',
-        r'Download.*PDF.*',
-        r'©.*WHO.*',
-    ]
-    for pattern in boilerplate:
-        content = re.sub(pattern, '', content, flags=re.IGNORECASE)
+    content = boilerplate.trimmer('WHO topics', WHO_TOPIC_BOILERPLATE).trim(content)
 
     content = content.strip()
 
@@ -310,49 +303,52 @@ def get_who_topic_page(topic_slug: str, topic_name: str) -> Optional[dict]:
         'title': topic_name,
         'url': url,
         'content': content,
+        'chunks': chunk_text(content),
     }
 
 
-def get_who_factsheet(topic_slug: str, topic_name: str) -> Optional[dict]:
-    """Fetch and parse a WHO fact sheet page."""
-    # Try fact sheet URL format
-    url = f"https://www.who.int/news-room/fact-sheets/detail/{topic_slug}"
+WHO_FACTSHEET_BOILERPLATE = [
+    r'Share.*?Facebook.*?Twitter.*',
+    r'©.*WHO.*',
+    r'Download.*PDF.*',
+]
 
-    html = fetch_url(url)
-    if not html:
-        return None
 
+FACTSHEET_KEY_FACTS = Selector('section', class_contains='sf-key-facts')
+FACTSHEET_SECTION = Selector('section', class_contains='sf-content-block')
+
+
+def factsheet_text(html: str, topic_name: str,
+                   budget: Optional[page_guard.PageBudget] = None) -> str:
+    """Key facts and the first content sections of a fact sheet."""
     content_parts = []
     content_parts.append(f"WHO Fact Sheet: {topic_name}")
 
     # Extract key facts
-    key_facts_pattern = r'<section[^>]*class="[^"]*sf-key-facts[^"]*"[^>]*>(.*?)</section>'
-    match = re.search(key_facts_pattern, html, re.DOTALL | re.IGNORECASE)
-    if match:
-        key_facts = extract_text(match.group(1))
-        if len(key_facts) > 50:
-            content_parts.append(f"\nKey Facts: {key_facts}")
+    key_facts = extract_regions(html, [FACTSHEET_KEY_FACTS], budget=budget)[0]
+    if key_facts and len(key_facts) > 50:
+        content_parts.append(f"\nKey Facts: {key_facts}")
 
     # Extract main content sections
-    section_pattern = r'<section[^>]*class="[^"]*sf-content-block[^"]*"[^>]*>(.*?)</section>'
-    sections = re.findall(section_pattern, html, re.DOTALL | re.IGNORECASE)
-
-    for section in sections[:5]:  # First 5 sections
-        section_text = extract_text(section)
+    for section_text in extract_all(html, FACTSHEET_SECTION, limit=5, budget=budget):  # First 5 sections
         if len(section_text) > 100:
             content_parts.append(f"\n{section_text}")
 
-    content = ' '.join(content_parts)
+    return ' '.join(content_parts)
+
+
+def parse_who_factsheet(job: tuple, html: str) -> Optional[dict]:
+    """Parse stage: title, url and chunks of a fetched WHO fact sheet."""
+    _, topic_slug, topic_name, _ = job
+    url = FACTSHEET_URL.format(topic_slug)
+
+    content = page_guard.extract(
+        'WHO', url, html, lambda page, budget: factsheet_text(page, topic_name, budget),
+        fallback=lambda page: f"WHO Fact Sheet: {topic_name} {page_guard.main_text(page)}")
     content = re.sub(r'\s+', ' ', content).strip()
 
     # Remove boilerplate
-    boilerplate = [
-        r'Share.*?Facebook.*?Twitter.*',
-        r'©.*WHO.*',
-        r'Download.*PDF.*',
-    ]
-    for pattern in boilerplate:
-        content = re.sub(pattern, '', content, flags=re.IGNORECASE)
+    content = boilerplate.trimmer('WHO fact sheets', WHO_FACTSHEET_BOILERPLATE).trim(content)
 
     content = content.strip()
 
@@ -363,9 +359,23 @@ def get_who_factsheet(topic_slug: str, topic_name: str) -> Optional[dict]:
         'title': topic_name,
         'url': url,
         'content': content,
+        'chunks': chunk_text(content),
     }
 
 
+# Job kind -> (page URL template, parse stage)
+WHO_PAGES_BY_KIND = {
+    'topic': (TOPIC_URL, parse_who_topic_page),
+    'factsheet': (FACTSHEET_URL, parse_who_factsheet),
+}
+
+
+def parse_who_page(job: tuple, html: str) -> Optional[dict]:
+    """Parse stage for both kinds of WHO job ('topic' or 'factsheet', slug,
+    name, lastmod)."""
+    return WHO_PAGES_BY_KIND[job[0]][1](job, html)
+
+
 def scrape_who_topics() -> list[RagEntry]:
     """Scrape health topics from WHO website."""
     print("\n" + "="*60, flush=True)
@@ -376,33 +386,34 @@ def scrape_who_topics() -> list[RagEntry]:
 
     entries = []
     entry_count = 0
+    topics, lastmods = get_who_topics()
 
-    for topic_slug, topic_name in WHO_TOPICS:
-        if entry_count >= MAX_ENTRIES:
-            print(f"\nReached target of {MAX_ENTRIES} entries", flush=True)
-            break
+    def fetch(job):
+        kind, topic_slug, topic_name, lastmod = job
+        if kind == 'topic':
+            print(f"\nFetching: {topic_name}...", flush=True)
+        else:
+            print(f"  Trying fact sheet for {topic_name}...", flush=True)
+        return fetch_url(WHO_PAGES_BY_KIND[kind][0].format(topic_slug), lastmod=lastmod)
 
-        print(f"\nFetching: {topic_name}...", flush=True)
+    def write(job, result):
+        nonlocal entry_count
+        kind, topic_slug, topic_name, _ = job
 
-        # Try health topic page first
-        result = get_who_topic_page(topic_slug, topic_name)
+        # If the health topic page fails, try the fact sheet
+        if not result and kind == 'topic':
+            return ('factsheet', topic_slug, topic_name,
+                    lastmods.get(FACTSHEET_URL.format(topic_slug)))
 
-        # If that fails, try fact sheet
         if not result:
-            print(f"  Trying fact sheet...", flush=True)
-            result = get_who_factsheet(topic_slug, topic_name)
+            print(f"  {topic_name}: no content found", flush=True)
+            return None
 
-        if not result:
-            print(f"  No content found", flush=True)
-            continue
-
-        content = result['content']
+        chunks = result['chunks']
         url = result['url']
         title = result['title']
 
-        print(f"  Got {len(content)} chars", flush=True)
-
-        chunks = chunk_text(content)
+        print(f"  {topic_name}: got {len(result['content'])} chars", flush=True)
 
         for j, chunk in enumerate(chunks):
             entry_id = f"who_{topic_slug.replace('-', '_')}_{j+1:02d}"
@@ -421,6 +432,14 @@ def scrape_who_topics() -> list[RagEntry]:
         entry_count += len(chunks)
         print(f"  Added {len(chunks)} entries (total: {entry_count})", flush=True)
 
+        if entry_count >= MAX_ENTRIES:
+            print(f"\nReached target of {MAX_ENTRIES} entries", flush=True)
+            raise pipeline.Stop
+
+    jobs = (('topic', topic_slug, topic_name, lastmods.get(TOPIC_URL.format(topic_slug)))
+            for topic_slug, topic_name in topics)
+    pipeline.run('WHO', jobs, fetch, parse_who_page, write)
+
     print(f"\n  Total WHO entries: {len(entries)}", flush=True)
     return entries
 
@@ -433,7 +452,7 @@ def write_csv(entries: list[RagEntry], output_path: str):
         # Header
         writer.writerow([
             'id', 'title', 'source_name', 'url', 'license',
-            'date_accessed', 'text_chunk', 'category'
+            'date_accessed', 'text_chunk', 'category', 'section'
         ])
 
         # Data rows
@@ -446,7 +465,8 @@ def write_csv(entries: list[RagEntry], output_path: str):
                 entry.license,
                 entry.date_accessed,
                 entry.text_chunk,
-                entry.category
+                entry.category,
+                entry.section
             ])
 
 
@@ -458,7 +478,7 @@ def main():
     print(f"Date: {TODAY}", flush=True)
     print(f"Request delay: {REQUEST_DELAY_MIN}-{REQUEST_DELAY_MAX}s between requests", flush=True)
     print(f"Target entries: {MAX_ENTRIES}", flush=True)
-    print(f"Topics to scrape: {len(WHO_TOPICS)}", flush=True)
+    print(f"Curated topics: {len(WHO_TOPICS)}", flush=True)
     print("="*60, flush=True)
 
     entries = scrape_who_topics()
@@ -476,6 +496,12 @@ def main():
 
     write_csv(entries, output_path)
     print(f"\nOutput written to: {output_path}", flush=True)
+    http_client.print_stats()
+    sitemap.print_stats()
+    pipeline.print_stats()
+    boilerplate.print_stats()
+    page_guard.print_stats()
+    fetch_metrics.write_summary(output_path, total=len(entries))
 
     return entries
 